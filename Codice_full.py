@@ -1,165 +1,238 @@
 import streamlit as st
-from datetime import datetime, date, time
-from geopy import geocoders, exc
+from datetime import datetime, date
+from geopy import exc
 import pandas as pd
 import folium
 from streamlit_folium import folium_static
-import requests
-from geopy.distance import geodesic
-import random
+import streamlit.components.v1 as components
 import re
+import os
+import json
 import math 
+import numpy as np
 import prices
-from folium.plugins import MarkerCluster
-
-
-
-#Used to handale the API with a rate limit (unrelible conditions)
-def safe_request(url, params):
-    """Make a request with exponential backoff."""
-    attempts = 0
-    max_attempts = 5
-    backoff_factor = 1.5
-    while attempts < max_attempts:
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            return response
-        elif response.status_code == 429:
-            sleep_time = (backoff_factor ** attempts) + random.uniform(0, 1)
-            time.sleep(sleep_time)
-            attempts += 1
-        else:
-            break
-    return None   #Written with the help of ChatGPT, in order to prevent and help with the rate of requests a user can make 
+import http_replay
+import distances
+import spatial_index
+import ttl_cache
+import geocoding
+import poi_categories
+import map_layers
+import pipeline
+import instrumentation
+import occupancy_forecast
+import garage_ranking
+import parking_dataset
+import open_data
+from folium.plugins import MarkerCluster, FastMarkerCluster
+
+
 
+#Both datasets are downloaded and kept for the whole process by open_data.py (shared by all the sessions and by api.py)
+#Here only the errors and the age of the occupancy are shown
 
-#Call of the first API (Parkhaus platzte)
+PARKING_DATA_MAX_STALE = 15 * 60  # older occupancy is shown with a warning
 
+
+@instrumentation.timed()
 def fetch_parking_data():
-    """Fetch parking data from an API."""
-    API_ENDPOINT = "https://daten.stadt.sg.ch/api/explore/v2.1/catalog/datasets/freie-parkplatze-in-der-stadt-stgallen-pls/records?limit=20"
-    response = requests.get(API_ENDPOINT)
-    if response.status_code == 200:
-        data = response.json()['results']
-        if data:
-            parking_data = pd.DataFrame(data)
-            parking_data['latitude'] = parking_data['standort'].apply(lambda x: x.get('lat'))
-            parking_data['longitude'] = parking_data['standort'].apply(lambda x: x.get('lon'))
-            parking_data['category'] = parking_data.apply(lambda x: 'Parkhaus' if x['phstate'] == 'offen' else 'Closed', axis=1)
-            return parking_data
-        else:
-            st.error("No data available from the API.")
-            return pd.DataFrame()
+    """Parking data published by the background poller (the request never waits for the API once there is a snapshot)."""
+    try:
+        data = open_data.cached_parking_data()
+    except open_data.FetchError as e:
+        st.error(str(e))
+        return e.data if e.data is not None else pd.DataFrame()
+    display_occupancy_age(open_data.parking_data_poller())
+    return data
+
+
+#Age of the occupancy shown under the map, with a warning if the API has not answered for a while
+
+def display_occupancy_age(poller):
+    snapshot = poller.snapshot
+    if snapshot is None:
+        return
+    age_minutes = int(snapshot.age() // 60)
+    if snapshot.age() > PARKING_DATA_MAX_STALE:
+        st.warning(f"The occupancy could not be updated, the free spaces shown are from {age_minutes} minutes ago.")
     else:
-        st.error(f'Failed to retrieve data: HTTP Status Code {response.status_code}')
-        return pd.DataFrame()
-    
-# Call of the second API (all the Parkings)   
- 
-def fetch_additional_data():
-    base_url = "https://daten.stadt.sg.ch/api/explore/v2.1/catalog/datasets/points-of-interest-/records?refine=kategorie%3A%22Parkpl%C3%A4tze%2C%20Parkh%C3%A4user%22"
-    params = {
-        "refine": 'kategorie:"Parkplätze, Parkhäuser"',
-        "limit": 100,
-        "offset": 0
-    }
-    parking_data = []
-
-    while True:
-        response = safe_request(base_url, params)
-        if response and response.status_code == 200:
-            data = response.json()
-            results = data.get('results', [])
-            if not results:
-                break
-
-            for item in results:
-                geo_point = item.get('geo_point_2d', {})
-                parking_data.append({
-                    'latitude': geo_point.get('lat', 0),  # Default to 0 if no latitude
-                    'longitude': geo_point.get('lon', 0),  # Default to 0 if no longitude
-                    'name': item.get('name', 'No Name Provided'),
-                    'description': item.get('description', 'No Description Provided'),
-                    'address': item.get('adresse', 'No Address Provided'),
-                    'info': item.get('informatio', 'No Information Provided')  # Additional info
-                })
-            params['offset'] += params['limit']
-        else:
-            st.error("Failed to fetch additional data after multiple attempts.")
-            break
+        st.caption(f"Occupancy updated {age_minutes} min ago" if age_minutes else "Occupancy updated less than a minute ago")
 
-    return pd.DataFrame(parking_data)  # Assicurati di restituire sempre un DataFrame
+
+@instrumentation.timed()
+def fetch_additional_data():
+    try:
+        return open_data.cached_additional_data()
+    except open_data.FetchError as e:
+        st.error(str(e))
+        return e.data if e.data is not None else pd.DataFrame()
 
 
 
 # Used to convert a textual address into geographical coordinates (latitude and longitude) using the Nominatim geocoding API
+# The results are memoised in memory and on disk, and an offline gazetteer can answer without network (see geocoding.py)
 
 
+@instrumentation.timed()
 def geocode_address(location):
     """
-    Converts an address to a point (latitude, longitude) using the Nominatim API, 
+    Converts an address to a point (longitude, latitude) using the Nominatim API, 
     specifically within an area around St. Gallen, Switzerland defined by a custom bounding box.
     """
     if location:
-        geolocator = geocoders.Nominatim(user_agent="geocoding_app", timeout=10)
-        full_location = f"{location}, St. Gallen, Switzerland"
-        
-        # Custom bounding box coordinates based on St. gallen map (Aid of ChatGPT)
-        southwest_bound = (47.404229, 9.324815)  # Adjusted to the southwest boundary
-        northeast_bound = (47.4400, 9.4400)      # Adjusted to the northeast boundary
-        
         try:
-            geocoded_location = geolocator.geocode(full_location, viewbox=[southwest_bound, northeast_bound], bounded=True)
-            if geocoded_location:
-                return (geocoded_location.longitude, geocoded_location.latitude)
-        except exc.GeocoderRateLimited as e:
-            st.warning("Rate limit exceeded, waiting to retry...")
-            time.sleep(10)  # Wait 10 seconds before retrying (chatgpt)
+            return geocoding.geocode(location)
+        except exc.GeocoderRateLimited:
+            st.warning("Rate limit exceeded, please try again in a few seconds.")
         except Exception as e:
             st.error(f"Geocoding error: {e}")
     return None
 
 
 
+#"folium" (default): the map of the markers within the radius built with folium
+#"incremental": cached base map with all the POIs plus the markers of the request (map_layers), less work on the
+#server but more data sent to the browser, so only used with PARKGALLEN_MAP_MODE=incremental
+MAP_MODE = os.environ.get("PARKGALLEN_MAP_MODE", "folium")
+MAP_HEIGHT = 500
+
+#Above this number of markers the map uses one FastMarkerCluster per category (icons drawn in the browser)
+FAST_RENDER_THRESHOLD = 100
+
+
+def parkhaus_popup_texts(data, destination_point):
+    if isinstance(data, parking_dataset.DatasetView):
+        return parkhaus_view_popup_texts(data, destination_point)
+    if 'distance_to_destination' in data.columns:
+        parking_distances = data['distance_to_destination'].to_numpy(dtype=float)
+    else:
+        parking_distances = distances.distances_from_data(data, destination_point)
+    walking_times = distances.walking_minutes(parking_distances)
+    return [
+        f"Name: {name}<br>Description: {state}<br>Estimated Walking Time: {int(walking_time) if walking_time == walking_time else 'N/A'} minutes<br>Spaces: {free}/{total}"
+        for name, state, walking_time, free, total in zip(
+            data.get('phname', pd.Series('No Name Provided', index=data.index)),
+            data.get('phstate', pd.Series('No State Provided', index=data.index)),
+            walking_times,
+            data.get('shortfree', pd.Series('N/A', index=data.index)),
+            data.get('shortmax', pd.Series('N/A', index=data.index)),
+        )
+    ]
+
+
+def parkhaus_view_popup_texts(view, destination_point):
+    parking_distances = view.distances
+    if np.isnan(parking_distances).all() and destination_point is not None:
+        parking_distances = distances.distances_to_point(view.column('latitude'), view.column('longitude'), destination_point)
+    walking_times = distances.walking_minutes(parking_distances)
+    spaces = lambda counts: ['N/A' if count == parking_dataset.MISSING else count for count in counts.tolist()]
+    return [
+        f"Name: {name}<br>Description: {state}<br>Estimated Walking Time: {int(walking_time) if walking_time == walking_time else 'N/A'} minutes<br>Spaces: {free}/{total}"
+        for name, state, walking_time, free, total in zip(
+            view.column('phname'), view.column('phstate'), walking_times.tolist(), spaces(view.column('shortfree')), spaces(view.column('shortmax')))
+    ]
+
+
+def address_popup_texts(data):
+    addresses = data['address'] if 'address' in data.columns else pd.Series('No Address Provided', index=data.index)
+    return [f"Address: {address}" for address in addresses]
+
+
+#One layer per category: all the points are sent as one array and the browser creates the markers
+
+def add_fast_marker_layer(map_folium, name, icon, data, popup_texts):
+    latitudes, longitudes = distances.coordinate_arrays(data)
+    points = [[lat, lon, popup] for lat, lon, popup in zip(latitudes.tolist(), longitudes.tolist(), popup_texts) if lat == lat and lon == lon]
+    icon_html = json.dumps(f'<div style="font-size: 20pt">{icon}</div>')
+    callback = f"""function (row) {{
+        var icon = L.divIcon({{html: {icon_html}, iconSize: [150, 36], iconAnchor: [7, 20], className: ''}});
+        return L.marker(new L.LatLng(row[0], row[1]), {{icon: icon}}).bindPopup(row[2], {{maxWidth: 250}});
+    }}"""
+    FastMarkerCluster(points, callback=callback, name=name).add_to(map_folium)
+
+
 #Fucntion used to picture the parking spaces on the map based on the different categories + count of the catgories within map 
+#render_mode: "markers" (one folium.Marker each), "fast" (FastMarkerCluster layers) or "auto" (fast above FAST_RENDER_THRESHOLD markers)
 
-def add_markers_to_map(map_folium, original_data, additional_data, location_point, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, address):
-    address_provided = bool(address)
-    filtered_original_data = filter_parking_by_radius(original_data, destination_point, radius, show_parkhaus, address_provided)
-    filtered_additional_data = filter_parking_by_radius(additional_data, destination_point, radius, False, address_provided)
+#Rows shown on the map: the Parkhaus within the radius and, per POI category ticked, the row positions within the radius
+#Shared by both ways of drawing the map, so the counts are the same whatever the map mode
 
-    # Clustering setup
-    parkhaus_cluster = MarkerCluster(name="Parkhaus").add_to(map_folium)
-    blue_zone_cluster = MarkerCluster(name="Blue Zone").add_to(map_folium)
-    white_zone_cluster = MarkerCluster(name="White Zone").add_to(map_folium)
-    handicapped_cluster = MarkerCluster(name="Handicapped Zone").add_to(map_folium)
+def visible_parking(original_data, additional_data, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, address):
+    parkhaus_data = None
+    if show_parkhaus:
+        parkhaus_data = parking_in_radius(original_data, destination_point, radius, True, 'Parkhaus')  # a view, no copy of the rows
 
-    blue_count, white_count, handicapped_count = 0, 0, 0
+    # The rows were classified when the data was loaded, here it is only a mask on the rows within the radius
+    category_index = poi_categories.category_index_for(additional_data)
+    positions, _ = positions_within_radius(additional_data, destination_point, radius)
+    shown = {"blue": show_extended_blue, "white": show_white, "handicapped": show_handicapped}
+    category_positions = {category: category_index.select(category, positions) for category, show in shown.items() if show}
+    return parkhaus_data, category_positions
 
-    if show_parkhaus: # Parkhaus picture 
-        for _, row in filtered_original_data.iterrows():
-            if row.get('category', '') == 'Parkhaus':
-                add_marker(parkhaus_cluster, row, "🅿️", destination_point)
 
-    if show_extended_blue: # Blue zone 
-        for _, row in filtered_additional_data.iterrows():
-            if "erweiterte blaue zone" in row.get('info', '').lower():
-                add_marker(blue_zone_cluster, row, "🔵", None)
-                blue_count += 1
+@instrumentation.timed()
+def add_markers_to_map(map_folium, original_data, additional_data, location_point, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, address, render_mode="auto"):
+    parkhaus_data, category_positions = visible_parking(original_data, additional_data, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, address)
 
+    # (layer name, icon, rows, destination for the walking time) of every category to show
+    layers = []
+    if parkhaus_data is not None: # Parkhaus picture 
+        layers.append(("Parkhaus", "🅿️", parkhaus_data.frame(), destination_point))
+    if show_extended_blue: # Blue zone 
+        layers.append(("Blue Zone", "🔵", additional_data.iloc[category_positions["blue"]], None))
     if show_white: # White Zone
-        for _, row in filtered_additional_data.iterrows():
-            if "weiss (bewirtschaftet)" in row.get('info', '').lower() or "weisse zone" in row.get('info', '').lower():
-                add_marker(white_zone_cluster, row, "⚪", None)
-                white_count += 1
-
+        layers.append(("White Zone", "⚪", additional_data.iloc[category_positions["white"]], None))
     if show_handicapped: # Handicap parking spaces
-        for _, row in filtered_additional_data.iterrows():
-            if "invalidenparkplatz" in row.get('info', '').lower():
-                add_marker(handicapped_cluster, row, "♿", None)
-                handicapped_count += 1
+        layers.append(("Handicapped Zone", "♿", additional_data.iloc[category_positions["handicapped"]], None))
+
+    total_markers = sum(len(data) for _, _, data, _ in layers)
+    fast = render_mode == "fast" or (render_mode == "auto" and total_markers > FAST_RENDER_THRESHOLD)
+    for name, icon, data, destination in layers:
+        if fast:
+            popup_texts = parkhaus_popup_texts(data, destination) if destination else address_popup_texts(data)
+            add_fast_marker_layer(map_folium, name, icon, data, popup_texts)
+        else:
+            cluster = MarkerCluster(name=name).add_to(map_folium)
+            for _, row in data.iterrows():
+                add_marker(cluster, row, icon, destination)
+
+    return category_counts(category_positions)
+
+
+def category_counts(category_positions):
+    """(blue, white, handicapped) counts for display_additional_information, 0 for the categories not shown."""
+    return tuple(len(category_positions.get(category, ())) for category in ("blue", "white", "handicapped"))
 
-    return blue_count, white_count, handicapped_count
+
+#The whole map built with folium (MAP_MODE = "folium")
+
+def build_folium_map(original_data, additional_data, location_point, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, address):
+    map_folium = create_map()
+    add_search_radius(map_folium, destination_point, radius)
+    add_user_markers(map_folium, location_point, destination_point)
+    counts = add_markers_to_map(map_folium, original_data, additional_data, location_point, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, address)
+    return map_folium, counts
+
+
+#Map drawn from the base cached in map_layers (all the POIs, rendered once per data refresh) plus a small
+#script with this request: the markers of the user, the radius, the Parkhaus and the row numbers of the POIs to show
+#The session keeps only that script and the counts, the HTML is put together at every rerun from the shared base
+
+@instrumentation.timed()
+def incremental_map_overlay(original_data, additional_data, location_point, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, address):
+    parkhaus_data, category_positions = visible_parking(original_data, additional_data, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, address)
+    parkhaus_points = None
+    if parkhaus_data is not None:
+        latitudes, longitudes = parkhaus_data.column('latitude'), parkhaus_data.column('longitude')
+        popup_texts = parkhaus_popup_texts(parkhaus_data, destination_point)
+        parkhaus_points = [[lat, lon, popup] for lat, lon, popup in zip(latitudes.tolist(), longitudes.tolist(), popup_texts) if lat == lat and lon == lon]
+    overlay = map_layers.request_overlay(additional_data, location_point, destination_point, radius, parkhaus_points, category_positions)
+    return overlay, category_counts(category_positions)
+
+
+def render_incremental_map(original_data, additional_data, location_point, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, address):
+    overlay, counts = incremental_map_overlay(original_data, additional_data, location_point, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, address)
+    return map_layers.compose_map(additional_data, overlay), counts
 
 
 # Function used to add various types of parking markers to a map created with Folium
@@ -174,8 +247,11 @@ def add_marker(cluster, row, icon, destination_point):
         # Handling for Parkhaus markers
         name = row.get('phname', 'No Name Provided')
         description = f"Description: {row.get('phstate', 'No State Provided')}"
-        parking_distance = geodesic((latitude, longitude), (destination_point[1], destination_point[0])).meters
-        estimated_walking_time = int(parking_distance / 1.1 / 60)  # Walking speed approximation
+        # Reuse the distance computed by filter_parking_by_radius when it is there
+        parking_distance = row.get('distance_to_destination')
+        if parking_distance is None or pd.isna(parking_distance):
+            parking_distance = distances.distance_between((longitude, latitude), destination_point)
+        estimated_walking_time = int(distances.walking_minutes(parking_distance))  # Walking speed approximation
         spaces_available = row.get('shortfree', 'N/A')
         total_spaces = row.get('shortmax', 'N/A')
         popup_text = f"Name: {name}<br>{description}<br>Estimated Walking Time: {estimated_walking_time} minutes<br>Spaces: {spaces_available}/{total_spaces}"
@@ -237,54 +313,112 @@ def create_map():
 
 
  #Function used to filter the parking within the radius (try to reduce long charging times)
+ #Distances are kept in 'distance_to_destination' for the later stages
+ #Datasets coming from the fetch functions have a spatial index, so only the cells around the destination are looked at
+
+def free_spaces_mask(data):
+    column = 'expected_free' if 'expected_free' in data.columns else 'shortfree'  # forecast for the arrival time if there is one
+    if column not in data.columns:
+        return np.zeros(len(data), dtype=bool)
+    return pd.to_numeric(data[column], errors='coerce').fillna(0).to_numpy() > 0
+
+
+#Free spaces expected at the arrival time (occupancy_forecast.py), used instead of the current ones when the
+#arrival is more than FORECAST_MIN_LEAD away and the garage has history; returns data itself otherwise
+
+FORECAST_MIN_LEAD = 30 * 60  # seconds
+
+@instrumentation.timed()
+def add_expected_free(data, arrival_datetime, now=None):
+    if data.empty or 'phname' not in data.columns:
+        return data
+    now = now or occupancy_forecast.local_now()
+    if (arrival_datetime - now).total_seconds() < FORECAST_MIN_LEAD:
+        return data
+    current_free = pd.to_numeric(data.get('shortfree'), errors='coerce').to_numpy(dtype=float)
+    expected = occupancy_forecast.get_forecaster().predict(data['phname'], arrival_datetime, current_free, now)
+    if np.isnan(expected).all():
+        return data
+    forecast_data = data.assign(expected_free=np.where(np.isnan(expected), current_free, np.rint(expected)))
+    parking_dataset.build_dataset(forecast_data)
+    return forecast_data
+
+
+def positions_within_radius(data, destination_point, radius, mask=None):
+    """Row positions (sorted) and distances of the rows within radius, restricted to mask if given."""
+    if destination_point is None:
+        positions = np.arange(len(data)) if mask is None else np.flatnonzero(mask)
+        return positions, np.full(len(positions), np.nan)
+
+    index = spatial_index.index_for(data)
+    if index is not None:
+        return index.query_radius(destination_point, radius, mask)
 
+    all_distances = distances.distances_from_data(data, destination_point)
+    inside = all_distances <= radius
+    if mask is not None:
+        inside &= mask
+    positions = np.flatnonzero(inside)
+    return positions, all_distances[positions]
+
+
+@instrumentation.timed()
 def filter_parking_by_radius(data, destination_point, radius, show_only_free, address_provided):
     if destination_point is None:
         return data 
+    return parking_in_radius(data, destination_point, radius, show_only_free).frame()
 
-    def condition(row):
-        #Take only coordinates of data if availble
-        lat = row.get('latitude') or row.get('standort', {}).get('lat', 0)
-        lon = row.get('longitude') or row.get('standort', {}).get('lon', 0)
-        if lat and lon:
-            distance_within_radius = geodesic(
-                (lat, lon), (destination_point[1], destination_point[0])
-            ).meters <= radius
-            if show_only_free:
-                # Only consider and show parking spaces that are free 
-                return distance_within_radius and row.get('shortfree', 0) > 0
-            return distance_within_radius
-        return False
 
-    filtered_data = data[data.apply(condition, axis=1)]
-    return filtered_data
+#Same selection without copying the rows: a parking_dataset.DatasetView (row positions and distances)
+#The app works on views, the DataFrame of filter_parking_by_radius is only for the callers that need one
+
+@instrumentation.timed()
+def parking_in_radius(data, destination_point, radius, show_only_free, category=None):
+    dataset = parking_dataset.dataset_for(data)
+    # Only consider and show parking spaces that are free 
+    mask = dataset.free_mask() if show_only_free else None
+    if category is not None:
+        mask = dataset.category_mask(category) if mask is None else mask & dataset.category_mask(category)
+    if destination_point is None:
+        return dataset.all(mask)
+    return dataset.within(destination_point, radius, mask)
 
 
 #Function used to filter and find the nearest parking space
 
+@instrumentation.timed()
 def find_nearest_parking_place(data, destination_point):
     if destination_point is None or data.empty:
         return None, None
 
     # Filtering parkhaus data
-    parkhaus_data = data[data['category'] == 'Parkhaus']   #Help of ChatGPT
-    if parkhaus_data.empty:
+    is_parkhaus = (data['category'] == 'Parkhaus').to_numpy()   #Help of ChatGPT
+    if not is_parkhaus.any():
         st.error("No 'Parkhaus' available in the data.")
         return None, None
 
-    # Calculating distances to the destination
-    parkhaus_data['distance_to_destination'] = parkhaus_data.apply(
-        lambda row: geodesic(
-            (row['latitude'], row['longitude']),
-            (destination_point[1], destination_point[0])
-        ).meters, axis=1
-    )
+    # With a spatial index only the cells around the destination are searched
+    index = spatial_index.index_for(data)
+    if index is not None:
+        positions, nearest_distance = index.query_nearest(destination_point, 1, is_parkhaus)
+        if len(positions) == 0:
+            st.error("No nearby valid Parkhaus found.")
+            return None, None
+        nearest_parkhaus = data.iloc[positions[0]].copy()
+        nearest_parkhaus['distance_to_destination'] = nearest_distance[0]
+        return nearest_parkhaus, distances.walking_minutes(nearest_distance[0])
+
+    parkhaus_data = data[is_parkhaus]
+
+    # Calculating distances to the destination (already there if the data went through filter_parking_by_radius)
+    if 'distance_to_destination' not in parkhaus_data.columns:
+        parkhaus_data = parkhaus_data.assign(distance_to_destination=distances.distances_from_data(parkhaus_data, destination_point))
 
     # Finding the nearest parkhaus
-    nearest_parkhaus = parkhaus_data.loc[parkhaus_data['distance_to_destination'].idxmin()] if not parkhaus_data.empty else None   #Help of ChatGPT
+    nearest_parkhaus = parkhaus_data.loc[parkhaus_data['distance_to_destination'].idxmin()] if parkhaus_data['distance_to_destination'].notna().any() else None   #Help of ChatGPT
     if nearest_parkhaus is not None:
         # Calculate walking time in minutes, assuming walking speed is 1.1 m/s
-        estimated_walking_time = (nearest_parkhaus['distance_to_destination'] / 1.1) / 60
+        estimated_walking_time = distances.walking_minutes(nearest_parkhaus['distance_to_destination'])
         return nearest_parkhaus, estimated_walking_time
     else:
         st.error("No nearby valid Parkhaus found.")
@@ -297,15 +431,17 @@ def calculate_and_display_distances(map_folium, location_point, destination_poin
     if destination_point:
         if location_point:
             # Calculate distance from location point to destination
-            distance_to_destination = geodesic((location_point[1], location_point[0]), (destination_point[1], destination_point[0])).meters
-            time_to_destination = distance_to_destination / 1.1 / 60  # Convert to minutes
+            distance_to_destination = distances.distance_between(location_point, destination_point)
+            time_to_destination = distances.walking_minutes(distance_to_destination)  # Convert to minutes
             st.markdown(f"Estimated walking time from your location to destination: {int(time_to_destination)} minutes")
 
         # Check if nearest_parking DataFrame is not empty and is specifically a Parkhaus
         if nearest_parking is not None and not nearest_parking.empty and nearest_parking['category'] == 'Parkhaus':
             # Calculate distance from nearest parking to destination
-            parking_distance = geodesic((nearest_parking['latitude'], nearest_parking['longitude']), (destination_point[1], destination_point[0])).meters
-            parking_time = parking_distance / 1.1 / 60
+            parking_distance = nearest_parking.get('distance_to_destination')
+            if parking_distance is None or pd.isna(parking_distance):
+                parking_distance = distances.distance_between((nearest_parking['longitude'], nearest_parking['latitude']), destination_point)
+            parking_time = distances.walking_minutes(parking_distance)
             name = nearest_parking.get('phname', 'No Name Provided')
             description = f"Description: {nearest_parking.get('phstate', 'No State Provided')}"
             spaces_available = nearest_parking.get('shortfree', 'N/A')
@@ -357,25 +493,77 @@ def display_additional_information(blue_count, white_count, handicapped_count):
 
 def display_parking_information(nearest_parkhaus, parking_fee, estimated_walking_time):
     # Display the left box, containing "Nearest Parkhaus Information"
+    # parking_fee is a tariffs.FeeResult (or None), it is only formatted here
+    if parking_fee is not None:
+        fee_text = f"{prices.format_fee(parking_fee)} ({prices.format_charges(parking_fee)})"
+    else:
+        fee_text = "not available for this Parkhaus"
+    expected_free = nearest_parkhaus.get('expected_free')
+    expected_text = f"<p>Expected free spaces at arrival: {int(expected_free)}</p>" if expected_free is not None and not pd.isna(expected_free) else ""
     st.markdown(f"""
     <div style="background-color:#86B97A; padding:10px; border-radius:5px;">
-        <h4>Nearest Parkhaus Information</h4>
+        <h4>Recommended Parkhaus Information</h4>
         <p>Name: {nearest_parkhaus.get('phname', 'Unknown')}</p>
         <p>Estimated Walking Time from Destination: {int(estimated_walking_time)} minutes</p>
         <p>Description: {nearest_parkhaus.get('phstate', 'No Description')}</p>
         <p>Spaces: {nearest_parkhaus.get('shortfree', 'N/A')}/{nearest_parkhaus.get('shortmax', 'N/A')}</p>
-        <p>Estimated parking fee {parking_fee}</p>
+        {expected_text}
+        <p>Estimated parking fee {fee_text}</p>
     </div>
     """, unsafe_allow_html=True)
 
 
+RANKING_SIZE = 3  # Parkhaus shown in the ranking table
+
+
+# Display the best Parkhaus of the ranking (garage_ranking.RankedGarage) as a small table under the recommendation
+def display_ranking(ranking):
+    if len(ranking) < 2:
+        return
+    st.markdown("#### Best Parkhaus for your stay")
+    st.table(pd.DataFrame({
+        'Parkhaus': [garage.name for garage in ranking],
+        'Walking (min)': [int(garage.walking_minutes) for garage in ranking],
+        'Fee (CHF)': [f"{garage.fee:.2f}" if not math.isnan(garage.fee) else "n/a" for garage in ranking],
+        'Free spaces': [int(garage.free_spaces) if not math.isnan(garage.free_spaces) else "n/a" for garage in ranking],
+        'Score': [f"{garage.score:.2f}" for garage in ranking],
+    }, index=range(1, len(ranking) + 1)))
+
+
 #Function to call the other code (prices.py), needed to estimate the prices
+#Returns a tariffs.FeeResult, or None if the parkhaus is not recognized (the name is counted in prices.REGISTRY.misses)
 
+@instrumentation.timed()
 def calculate_parking_fees(parking_name, arrival_datetime, rounded_total_hours):
-    parking_fee_function = getattr(prices, f"calculate_fee_{parking_name.lower().replace(' ', '_')}", None)
-    if parking_fee_function:
-        return parking_fee_function(arrival_datetime, rounded_total_hours)
-    return "Parking name not recognized. Please check the parking name."
+    return prices.calculate_parking_fees(parking_name, arrival_datetime, rounded_total_hours)
+
+
+#Counters shown in the debug panel and exported with the timings (the sources are read only when shown)
+instrumentation.add_stats_source("ttl_cache", ttl_cache.all_stats)
+instrumentation.add_stats_source("occupancy", lambda: open_data.parking_data_poller().stats())
+instrumentation.add_stats_source("forecast", lambda: occupancy_forecast.get_forecaster().stats())
+instrumentation.add_stats_source("geocoding", lambda: geocoding.stats)
+instrumentation.add_stats_source("fees", prices.fee_cache_stats)
+instrumentation.add_stats_source("garages", prices.REGISTRY.stats)
+instrumentation.add_stats_source("http_replay", lambda: http_replay.get_store().stats())
+
+
+#Debug panel in the sidebar (only with PARKGALLEN_INSTRUMENTATION=1): latencies, API status codes and caches
+
+def display_debug_panel():
+    with st.sidebar.expander("Debug: timings and caches"):
+        spans = instrumentation.histogram_summaries()
+        if spans:
+            st.markdown("**Latency (ms)**")
+            st.dataframe(pd.DataFrame.from_dict(spans, orient="index").round(2))
+        statuses = instrumentation.http_status_counts()
+        if statuses:
+            st.markdown("**API responses**")
+            st.dataframe(pd.DataFrame([{'host': host, 'status': status, 'count': count} for (host, status), count in statuses.items()]), hide_index=True)
+        st.markdown("**Caches**")
+        st.dataframe(pd.DataFrame.from_dict(instrumentation.cache_stats(), orient="index"))
+        st.download_button("Export JSON lines", instrumentation.to_json_lines(), file_name="parkgallen_metrics.jsonl")
+        st.download_button("Export Prometheus", instrumentation.to_prometheus(), file_name="parkgallen.prom")
 
 
 #All the function into the main
@@ -407,9 +595,12 @@ def main():
     arrival_time_str = st.sidebar.text_input("Enter arrival time :", key="arrival_time")
     departure_time_str = st.sidebar.text_input("Enter departure time :", key="departure_time")
 
+    # Every stage below is skipped when its inputs did not change since the last rerun (see pipeline.py)
+    stages = pipeline.Pipeline(st.session_state)
+
     # Parse datetime using custom function for flexibility
-    arrival_datetime = parse_datetime(arrival_date.strftime("%Y-%m-%d"), arrival_time_str)
-    departure_datetime = parse_datetime(departure_date.strftime("%Y-%m-%d"), departure_time_str)
+    arrival_datetime = stages.run("arrival", (arrival_date, arrival_time_str), parse_datetime, arrival_date.strftime("%Y-%m-%d"), arrival_time_str)
+    departure_datetime = stages.run("departure", (departure_date, departure_time_str), parse_datetime, departure_date.strftime("%Y-%m-%d"), departure_time_str)
     if arrival_datetime is None or departure_datetime is None:
         return
 
@@ -425,8 +616,8 @@ def main():
         return
 
     # Geocode addresses
-    location_point = geocode_address(address) if address else None
-    destination_point = geocode_address(destination) if destination else None
+    location_point = stages.run("geocode address", (address,), geocode_address, address) if address else None
+    destination_point = stages.run("geocode destination", (destination,), geocode_address, destination) if destination else None
 
     # Check for valid destination
     if not destination_point:
@@ -441,24 +632,45 @@ def main():
     show_white = st.sidebar.checkbox("⚪ White Parking", True)
     show_handicapped = st.sidebar.checkbox("♿ Handicapped Parking", True)
 
+    # How much each criterion counts when the Parkhaus are ranked (0 = ignored)
+    with st.sidebar.expander("Ranking weights"):
+        ranking_weights = {
+            'walking': st.slider("Walking time", 0.0, 3.0, garage_ranking.DEFAULT_WEIGHTS['walking'], 0.5),
+            'fee': st.slider("Parking fee", 0.0, 3.0, garage_ranking.DEFAULT_WEIGHTS['fee'], 0.5),
+            'free': st.slider("Free spaces", 0.0, 3.0, garage_ranking.DEFAULT_WEIGHTS['free'], 0.5),
+        }
+
     # Display parking and calculate fees
+    # The results stay on screen after the button was pressed, changing a filter only reruns the stages it affects
     if st.sidebar.button("Show Parking and Calculate Fees"):
+        st.session_state["show_results"] = True
+    if st.session_state.get("show_results"):
         with st.spinner("Loading information for you 😉"):
-            original_data = fetch_parking_data()
-            additional_data = fetch_additional_data()
-            filtered_data = filter_parking_by_radius(original_data, destination_point, radius, True, bool(address))
-            map_folium = create_map()
-            add_search_radius(map_folium, destination_point, radius)
-            add_user_markers(map_folium, location_point, destination_point)
-            blue_count, white_count, handicapped_count = add_markers_to_map(map_folium, original_data, additional_data, location_point, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, address)
-            
-            folium_static(map_folium)
+            # The fetches read the poller snapshot / ttl_cache, a new download gives new DataFrames and so reruns what follows
+            original_data = stages.always("fetch parking data", fetch_parking_data)
+            additional_data = stages.always("fetch additional data", fetch_additional_data)
+            original_data = stages.run("forecast", (original_data, arrival_datetime), add_expected_free, original_data, arrival_datetime)
+            filtered_data = stages.run("filter", (original_data, destination_point, radius), parking_in_radius, original_data, destination_point, radius, True)
+            map_inputs = (original_data, additional_data, location_point, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, bool(address), MAP_MODE)
+            if MAP_MODE == "incremental":
+                overlay, (blue_count, white_count, handicapped_count) = stages.run("map", map_inputs, incremental_map_overlay, original_data, additional_data, location_point, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, address)
+                with instrumentation.span("map_component"):
+                    components.html(map_layers.compose_map(additional_data, overlay), height=MAP_HEIGHT + 10, width=700)  # same frame as folium_static
+            else:
+                map_folium, (blue_count, white_count, handicapped_count) = stages.run("map", map_inputs, build_folium_map, original_data, additional_data, location_point, destination_point, radius, show_parkhaus, show_extended_blue, show_white, show_handicapped, address)
+                with instrumentation.span("folium_static"):
+                    folium_static(map_folium)
             
             # Display the legend above the map
             st.markdown("### Legend")
             st.markdown("🏡 = Your Location | 📍= Your Destination | 🅿️ = Parkhaus | 🔵 = Extended Blue Zone | ⚪ = White Parking | ♿ = Handicapped")
             
-            nearest_parkhaus, estimated_walking_time = find_nearest_parking_place(filtered_data, destination_point)
+            ranking = stages.run("ranking", (filtered_data, destination_point, arrival_datetime, rounded_total_hours, tuple(ranking_weights.values())), garage_ranking.rank_garages, filtered_data, destination_point, arrival_datetime, rounded_total_hours, ranking_weights, RANKING_SIZE, keep=bool)
+            if ranking:
+                best = ranking[0]
+                nearest_parkhaus, estimated_walking_time = original_data.iloc[best.position], best.walking_minutes
+            else:
+                nearest_parkhaus, estimated_walking_time = None, None
 
             info_column, extra_info_column = st.columns(2)
 
@@ -467,23 +679,24 @@ def main():
                 display_additional_information(blue_count, white_count, handicapped_count)
 
             if nearest_parkhaus is not None and not nearest_parkhaus.empty:
-                parking_fee = calculate_parking_fees(nearest_parkhaus.get('phname', 'Unknown'), arrival_datetime, rounded_total_hours)
-
-                # Ensure parking_fee is a string to safely check its contents
-                if isinstance(parking_fee, (int, float)):
-                    parking_fee = f"{parking_fee:.2f} CHF"  # Format numerical fee as a string
-
-                if "Information not available" in parking_fee or "Rate information is incomplete" in parking_fee:
-                    with info_column:
-                        st.error(parking_fee)
-                else:
-                    # Process valid parking fee display
-                    with info_column:
-                        display_parking_information(nearest_parkhaus, parking_fee, estimated_walking_time)
+                parking_name = nearest_parkhaus.get('phname', 'Unknown')
+                parking_fee = stages.run("fee", (parking_name, arrival_datetime, rounded_total_hours), calculate_parking_fees, parking_name, arrival_datetime, rounded_total_hours)
+
+                # The fee stays numeric until it is displayed
+                with info_column:
+                    display_parking_information(nearest_parkhaus, parking_fee, estimated_walking_time)
+                    display_ranking(ranking)
             else:
                 with info_column:
                     st.write("### No Parkhaus within the Radius😔")
                     st.write("### Try to make the radius bigger🔎")
-                
+
+    if instrumentation.enabled():
+        display_debug_panel()
+
+    # Time of every stage in this rerun ("reused": the inputs did not change, the last output was kept)
+    with st.sidebar.expander("Stage timings"):
+        st.dataframe(pd.DataFrame(stages.timing_rows()), hide_index=True)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""
+Headless JSON API of ParkGallen, for the mobile client and the integrations.
+
+    uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+
+Endpoints:
+    GET /nearest  nearest Parkhaus to a destination (lat/lon or address)
+    GET /spots    parking spaces within a radius, by category
+    GET /fees     fee quote for one Parkhaus, or for all of them
+    GET /health   state of the caches
+
+The functions of Codice_full.py and prices.py are reused as they are. The datasets come from the
+same process-wide stores as the app (the occupancy poller and ttl_cache), with their spatial and
+category indexes built once per download, so a request only pays for an index query and the JSON.
+"""
+import math
+from datetime import datetime
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+
+import Codice_full
+import distances
+import geocoding
+import open_data
+import parking_dataset
+import prices
+import spatial_index
+import ttl_cache
+from garage_registry import GarageMiss
+
+CATEGORIES = ("parkhaus", "blue", "white", "handicapped")
+MAX_NEAREST = 20
+MAX_STAY_HOURS = 30 * 24  # longest stay quoted; the pricing runs on the event loop and grows with the days
+LOCAL_TIME = ZoneInfo("Europe/Zurich")  # the tariffs are in local time
+
+app = FastAPI(title="ParkGallen API")
+
+
+# The datasets are loaded (or refreshed) in a worker thread, the event loop only waits for them
+
+async def parking_data():
+    try:
+        return await run_in_threadpool(open_data.cached_parking_data)
+    except open_data.FetchError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+async def additional_data():
+    try:
+        return await run_in_threadpool(open_data.cached_additional_data)
+    except open_data.FetchError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+async def destination_point(lat, lon, address):
+    """(longitude, latitude) like in the app, from the coordinates or by geocoding the address."""
+    if lat is not None and lon is not None:
+        return (lon, lat)
+    if not address:
+        raise HTTPException(status_code=422, detail="Give lat and lon, or an address")
+    try:
+        point = await run_in_threadpool(geocoding.geocode, address)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Geocoding error: {e}")
+    if point is None:
+        raise HTTPException(status_code=404, detail=f"Address not found in St. Gallen: {address}")
+    return point
+
+
+def occupancy_age():
+    """Seconds since the occupancy was downloaded (the poller keeps the last good data when the API fails)."""
+    snapshot = open_data.parking_data_poller().snapshot
+    return round(snapshot.age(), 1) if snapshot is not None else None
+
+
+def number(value):
+    """JSON-friendly number (NaN and missing values become None)."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def garage_records(data, positions, garage_distances):
+    rows = data.iloc[positions]
+    return [
+        {
+            'name': row.get('phname'),
+            'state': row.get('phstate'),
+            'free': number(row.get('shortfree')),
+            'total': number(row.get('shortmax')),
+            'lat': number(row.get('latitude')),
+            'lon': number(row.get('longitude')),
+            'distance_m': round(float(distance), 1),
+            'walking_minutes': int(distances.walking_minutes(distance)),
+        }
+        for (_, row), distance in zip(rows.iterrows(), garage_distances)
+    ]
+
+
+def nearest_garages(data, point, k, only_free):
+    """The k nearest open Parkhaus (with free spaces if only_free) as (positions, distances)."""
+    if data.empty:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    dataset = parking_dataset.dataset_for(data)
+    mask = dataset.category_mask('Parkhaus')
+    if only_free:
+        mask = mask & dataset.free_mask()
+    view = dataset.nearest(point, k, mask)
+    return view.positions, view.distances
+
+
+def fee_record(fee_result):
+    return {
+        'garage': fee_result.garage,
+        'amount': fee_result.amount,
+        'currency': fee_result.currency,
+        'charges': [{'label': c.label, 'hours': c.hours, 'amount': c.amount} for c in fee_result.charges],
+    }
+
+
+def local_time(moment):
+    """moment as a naive local time; times with an offset are converted, naive ones are already local."""
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(LOCAL_TIME).replace(tzinfo=None)
+
+
+def rounded_hours(arrival, departure, hours):
+    """Duration charged, rounded up to the half hour like in the app (arrival and departure in local time)."""
+    if hours is None:
+        if departure is None:
+            raise HTTPException(status_code=422, detail="Give departure or hours")
+        hours = (departure - arrival).total_seconds() / 3600
+    if not math.isfinite(hours) or hours <= 0:
+        raise HTTPException(status_code=422, detail="Departure must be after arrival")
+    if hours > MAX_STAY_HOURS:
+        raise HTTPException(status_code=422, detail=f"Stays longer than {MAX_STAY_HOURS} hours are not quoted")
+    return math.ceil(hours * 2) / 2
+
+
+@app.get("/nearest")
+async def nearest(lat: Optional[float] = None, lon: Optional[float] = None, address: Optional[str] = None,
+                  k: int = Query(1, ge=1, le=MAX_NEAREST), only_free: bool = True):
+    point = await destination_point(lat, lon, address)
+    data = await parking_data()
+    positions, garage_distances = nearest_garages(data, point, k, only_free)
+    return {'destination': {'lat': point[1], 'lon': point[0]}, 'occupancy_age_seconds': occupancy_age(), 'garages': garage_records(data, positions, garage_distances)}
+
+
+@app.get("/spots")
+async def spots(lat: Optional[float] = None, lon: Optional[float] = None, address: Optional[str] = None,
+                radius: float = Query(500, gt=0, le=5000), category: List[str] = Query(list(CATEGORIES)),
+                points: bool = True, limit: int = Query(1000, ge=0)):
+    unknown = sorted(set(category) - set(CATEGORIES))
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown categories {unknown}, use {list(CATEGORIES)}")
+    point = await destination_point(lat, lon, address)
+    original, additional = await parking_data(), await additional_data()
+
+    # Same selection as the map of the app (free Parkhaus, POIs classified at load time)
+    parkhaus_data, category_positions = Codice_full.visible_parking(
+        original, additional, point, radius, "parkhaus" in category, "blue" in category, "white" in category, "handicapped" in category, None)
+    counts = {name: len(positions) for name, positions in category_positions.items()}
+    result = {'destination': {'lat': point[1], 'lon': point[0]}, 'radius': radius, 'counts': counts}
+    if parkhaus_data is not None:
+        counts['parkhaus'] = len(parkhaus_data)
+    if not points:
+        return result
+
+    index = spatial_index.index_for(additional)
+    latitudes, longitudes = (index.latitudes, index.longitudes) if index is not None else distances.coordinate_arrays(additional)
+    addresses = additional['address'].to_numpy() if 'address' in additional.columns else None
+    result['spots'] = {
+        name: [
+            {'lat': latitudes[p], 'lon': longitudes[p], 'address': addresses[p] if addresses is not None else None}
+            for p in positions[:limit].tolist()
+        ]
+        for name, positions in category_positions.items()
+    }
+    if parkhaus_data is not None:
+        result['spots']['parkhaus'] = garage_records(original, parkhaus_data.positions[:limit], parkhaus_data.distances[:limit])
+    return result
+
+
+@app.get("/fees")
+async def fees(arrival: datetime, departure: Optional[datetime] = None,
+               hours: Optional[float] = Query(None, gt=0, le=MAX_STAY_HOURS, allow_inf_nan=False), garage: Optional[str] = None):
+    arrival, departure = local_time(arrival), local_time(departure)
+    charged_hours = rounded_hours(arrival, departure, hours)
+    if garage is None:
+        names = list(prices.TARIFFS)
+        amounts = prices.calculate_all_fees(arrival, charged_hours, names)
+        return {'hours': charged_hours, 'fees': [{'garage': name, 'amount': number(amount), 'currency': prices.TARIFFS[name].currency} for name, amount in zip(names, amounts)]}
+
+    resolved = prices.REGISTRY.resolve(garage)
+    if isinstance(resolved, GarageMiss):
+        raise HTTPException(status_code=404, detail={'message': f"Unknown Parkhaus: {garage}", 'suggestions': list(resolved.suggestions)})
+    return {'hours': charged_hours, **fee_record(Codice_full.calculate_parking_fees(resolved.garage, arrival, charged_hours))}
+
+
+@app.get("/health")
+async def health():
+    return {'occupancy': open_data.parking_data_poller().stats(), 'caches': ttl_cache.all_stats(), 'fees': prices.fee_cache_stats(), 'garages': prices.REGISTRY.stats()}
@@ -0,0 +1,263 @@
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+from tariffs import MINUTES_PER_DAY, charge_units, chf_units, rate_units
+
+# Batch pricing: the fees of many garages for one stay, or of many stays for one garage,
+# as one NumPy array.
+#
+# Every tariff is compiled once into lookup tables:
+#   - tariffs with time-of-day bands: a stay is an optional first-hour block followed by
+#     slots of q minutes, each priced at the band where it starts (pro rata is simply q = 1).
+#     For every phase (start minute modulo q) we keep the cumulative price of the slots of
+#     one day, so the price of any number of slots is two table lookups.
+#   - tariffs that only depend on the duration: the tiers as padded arrays.
+# The tables of all the garages are stacked, so a (garage, stay) pair costs the same few
+# array operations whatever the tariff. Tariffs rounded per band segment (every started
+# hour of a band is paid) use the cumulative cost of whole segments plus the two partial
+# ones at the ends. Tariffs the tables cannot express (daily caps on band tariffs)
+# fall back to tariffs.charge_units.
+# All the tables hold integer units of 1/60 Rappen like tariffs.py, and the total is rounded to
+# the Rappen the same way, so a batch fee is always the fee of tariffs.calculate_fee to the cent.
+
+NO_LIMIT = np.iinfo(np.int64).max // 4  # minutes of the last tier
+
+
+class CompiledTariffs:
+    def __init__(self, tariffs):
+        self.tariffs = tuple(tariffs)
+        count = len(self.tariffs)
+        self.kind = np.zeros(count, dtype=np.int8)  # 0: bands, 1: tiers, 2: scalar fallback, 3: bands rounded per segment
+        self.round_total = np.array([chf_units(t.round_total or 0.0) for t in self.tariffs], dtype=np.int64)
+
+        # Band tariffs
+        self.first_len = np.zeros(count, dtype=np.int64)
+        self.first_price = np.zeros((count, MINUTES_PER_DAY), dtype=np.int64)
+        self.slot = np.ones(count, dtype=np.int64)
+        self.slots_per_day = np.full(count, MINUTES_PER_DAY, dtype=np.int64)
+        self.table_base = np.zeros(count, dtype=np.int64)
+        tables = []
+        table_size = 0
+
+        # Tier tariffs
+        max_tiers = max([len(t.tiers) for t in self.tariffs] + [1])
+        self.tier_upper = np.full((count, max_tiers), NO_LIMIT, dtype=np.int64)  # minutes
+        self.tier_lower = np.full((count, max_tiers), NO_LIMIT, dtype=np.int64)
+        self.tier_rate = np.zeros((count, max_tiers), dtype=np.int64)  # units per minute
+        self.tier_flat = np.zeros((count, max_tiers), dtype=np.int64)
+        self.tier_has_flat = np.zeros((count, max_tiers), dtype=bool)
+        self.tier_marginal = np.zeros(count, dtype=bool)
+        self.daily_cap = np.full(count, -1, dtype=np.int64)  # -1: no cap
+
+        # Band tariffs rounded per segment (band boundaries, their rounded cost and rate)
+        self.segments = {}
+
+        for g, tariff in enumerate(self.tariffs):
+            if tariff.bands and (tariff.daily_cap is not None or (tariff.segment_rounding and (tariff.slot_hours or tariff.first_hour))):
+                self.kind[g] = 2
+                continue
+            if tariff.segment_rounding:
+                self.kind[g] = 3
+                self.segments[g] = self._compile_segments(tariff)
+                continue
+            if not tariff.bands:
+                self.kind[g] = 1
+                lower = 0
+                for k, tier in enumerate(tariff.tiers):
+                    upper = NO_LIMIT if tier.up_to == np.inf else int(round(tier.up_to * 60))
+                    self.tier_lower[g, k] = lower
+                    self.tier_upper[g, k] = upper
+                    self.tier_rate[g, k] = rate_units(tier.rate)
+                    if tier.flat is not None:
+                        self.tier_flat[g, k] = chf_units(tier.flat)
+                        self.tier_has_flat[g, k] = True
+                    lower = upper
+                self.tier_marginal[g] = tariff.tiers_marginal
+                if tariff.daily_cap is not None:
+                    self.daily_cap[g] = chf_units(tariff.daily_cap)
+                continue
+
+            rate_per_minute = np.zeros(MINUTES_PER_DAY, dtype=np.int64)
+            first_price = np.zeros(MINUTES_PER_DAY, dtype=np.int64)
+            for band in tariff.bands:
+                start, end = int(round(band.start * 60)), int(round(band.end * 60))
+                rate_per_minute[start:end] = rate_units(band.rate)
+                first_price[start:end] = chf_units(band.first_hour if band.first_hour is not None else band.rate)
+            if tariff.first_hour:
+                self.first_len[g] = 60
+                self.first_price[g] = first_price
+
+            slot = int(round(tariff.slot_hours * 60)) if tariff.slot_hours else 1
+            if MINUTES_PER_DAY % slot:
+                raise ValueError(f"The slot of {tariff.garage} does not divide a day")
+            slots_per_day = MINUTES_PER_DAY // slot
+            # price of the slot starting at phase + j * slot, cumulated over j
+            slot_prices = rate_per_minute[:, None] if slot == 1 else rate_per_minute.reshape(slots_per_day, slot)
+            slot_prices = slot_prices.T * slot  # (phase, j)
+            cumulative = np.zeros((slot, slots_per_day + 1), dtype=np.int64)
+            np.cumsum(slot_prices, axis=1, out=cumulative[:, 1:])
+
+            self.slot[g] = slot
+            self.slots_per_day[g] = slots_per_day
+            self.table_base[g] = table_size
+            tables.append(cumulative.ravel())
+            table_size += cumulative.size
+
+        self.tables = np.concatenate(tables) if tables else np.zeros(1, dtype=np.int64)
+        tier_garages = np.flatnonzero((self.kind == 1) & (self.daily_cap >= 0))
+        self.capped_day_fee = np.zeros(count, dtype=np.int64)
+        if len(tier_garages):
+            day_fee = self._tier_fees(tier_garages, np.full(len(tier_garages), MINUTES_PER_DAY, dtype=np.int64))
+            self.capped_day_fee[tier_garages] = np.minimum(day_fee, self.daily_cap[tier_garages])
+
+    @staticmethod
+    def _compile_segments(tariff):
+        bands = sorted(tariff.bands, key=lambda band: band.start)
+        boundaries = np.array([int(round(band.start * 60)) for band in bands] + [MINUTES_PER_DAY])
+        rates = np.array([rate_units(band.rate) for band in bands], dtype=np.int64)
+        step = int(round(tariff.segment_rounding * 60))
+        full_cost = rates * -(-np.diff(boundaries) // step) * step
+        cumulative = np.concatenate([[0], np.cumsum(full_cost)])
+        return boundaries, rates, step, cumulative
+
+    def _segment_fees(self, g, start, duration):
+        """Pro rata band tariff where the time in every band segment is rounded up (e.g. every started hour)."""
+        boundaries, rates, step, cumulative = self.segments[g]
+        pieces_per_day = len(rates)
+        end = start + duration
+
+        def piece(minute):
+            """Global index of the band segment containing minute, counted from the arrival day."""
+            index = np.searchsorted(boundaries, minute % MINUTES_PER_DAY, side="right") - 1
+            return (minute // MINUTES_PER_DAY) * pieces_per_day + index
+
+        def piece_start(index):
+            return (index // pieces_per_day) * MINUTES_PER_DAY + boundaries[index % pieces_per_day]
+
+        def cumulated(index):
+            return (index // pieces_per_day) * cumulative[-1] + cumulative[index % pieces_per_day]
+
+        def rounded_cost(index, minutes):
+            return rates[index % pieces_per_day] * -(-minutes // step) * step
+
+        first, last = piece(start), piece(np.maximum(end - 1, start))
+        same = first == last
+        first_end = piece_start(first + 1)
+        last_start = piece_start(last)
+        fees = np.where(
+            same,
+            rounded_cost(first, end - start),
+            rounded_cost(first, first_end - start) + rounded_cost(last, end - last_start)
+            + np.where(same, 0, cumulated(np.maximum(last, first + 1)) - cumulated(first + 1)),
+        )
+        return np.where(duration > 0, fees, 0)
+
+    def _band_fees(self, g, start, duration):
+        first_len = self.first_len[g]
+        first = np.where(duration > 0, self.first_price[g, start % MINUTES_PER_DAY], 0)
+        rest_start = start + first_len
+        rest = np.maximum(duration - first_len, 0)
+        slot = self.slot[g]
+        slots_per_day = self.slots_per_day[g]
+        slots = -(-rest // slot)
+
+        phase = rest_start % slot
+        j0 = (rest_start % MINUTES_PER_DAY) // slot
+        row = self.table_base[g] + phase * (slots_per_day + 1)
+        day_total = self.tables[row + slots_per_day]
+
+        def cumulated(j):
+            return (j // slots_per_day) * day_total + self.tables[row + j % slots_per_day]
+
+        return first + cumulated(j0 + slots) - cumulated(j0)
+
+    def _tier_fees(self, g, duration):
+        upper, lower = self.tier_upper[g], self.tier_lower[g]
+        rate, flat, has_flat = self.tier_rate[g], self.tier_flat[g], self.tier_has_flat[g]
+        marginal_minutes = np.minimum(np.clip(duration[:, None] - lower, 0, None), upper - lower)  # padded tiers have no width
+        marginal = np.where(has_flat, np.where(marginal_minutes > 0, flat, 0), rate * marginal_minutes).sum(-1)
+        rows = np.arange(len(g))
+        tier = np.argmax(duration[:, None] <= upper, axis=-1)
+        whole = np.where(has_flat[rows, tier], flat[rows, tier], rate[rows, tier] * duration)
+        fees = np.where(self.tier_marginal[g], marginal, whole)
+        return np.where(duration > 0, fees, 0)
+
+    def _capped_tier_fees(self, g, duration):
+        cap = self.daily_cap[g]
+        capped = cap >= 0
+        fees = self._tier_fees(g, duration)
+        if capped.any():
+            # at most cap for every 24 h from the arrival
+            g, cap, duration = g[capped], cap[capped], duration[capped]
+            full_days = duration // MINUTES_PER_DAY
+            remainder = duration % MINUTES_PER_DAY
+            fees[capped] = full_days * self.capped_day_fee[g] + np.minimum(self._tier_fees(g, remainder), cap)
+        return fees
+
+    def fees(self, garages, start, duration):
+        """
+        Fees for the (garage position, arrival minute of the day, duration in minutes) triples.
+        The three arrays are broadcast against each other.
+        """
+        garages, start, duration = np.broadcast_arrays(np.asarray(garages, dtype=np.int64), np.asarray(start, dtype=np.int64), np.asarray(duration, dtype=np.int64))
+        shape = garages.shape
+        garages, start, duration = garages.ravel(), start.ravel(), duration.ravel()
+        fees = np.zeros(len(garages), dtype=np.int64)  # units, see tariffs.py
+        kind = self.kind[garages]
+
+        bands = kind == 0
+        if bands.any():
+            fees[bands] = self._band_fees(garages[bands], start[bands], duration[bands])
+        tiers = kind == 1
+        if tiers.any():
+            fees[tiers] = self._capped_tier_fees(garages[tiers], duration[tiers])
+        segments = kind == 3
+        if segments.any():
+            for g in np.unique(garages[segments]):
+                rows = garages == g
+                fees[rows] = self._segment_fees(g, start[rows], duration[rows])
+        fallback = kind == 2
+        if fallback.any():
+            for position in np.flatnonzero(fallback):
+                tariff = self.tariffs[garages[position]]
+                fees[position] = charge_units(tariff, int(start[position]) % MINUTES_PER_DAY, int(duration[position]))[0]
+
+        step = self.round_total[garages]
+        rounded = step > 0
+        if rounded.any():
+            fees[rounded] = -(-fees[rounded] // step[rounded]) * step[rounded]
+        return (((fees + 30) // 60) / 100).reshape(shape)  # like tariffs.units_to_chf
+
+
+@lru_cache(maxsize=32)
+def compile_tariffs(tariffs):
+    """Compiled tables for a tuple of tariffs (kept, since the tariffs never change while the app runs)."""
+    return CompiledTariffs(tariffs)
+
+
+def minutes_of_day(arrivals):
+    """Minute of the day of one datetime, a list of datetimes or an array of numpy datetime64."""
+    if isinstance(arrivals, datetime):
+        return arrivals.hour * 60 + arrivals.minute
+    arrivals = np.asarray(arrivals)
+    if np.issubdtype(arrivals.dtype, np.datetime64):
+        return ((arrivals - arrivals.astype("datetime64[D]")) // np.timedelta64(1, "m")).astype(np.int64)
+    return np.array([a.hour * 60 + a.minute for a in arrivals], dtype=np.int64)
+
+
+def duration_minutes(hours):
+    return np.rint(np.asarray(hours, dtype=float) * 60).astype(np.int64)
+
+
+def fees_for_garages(tariffs, arrival_datetime, hours):
+    """Fee of one stay in every one of the tariffs, as an array in the same order."""
+    compiled = compile_tariffs(tuple(tariffs))
+    return compiled.fees(np.arange(len(compiled.tariffs)), minutes_of_day(arrival_datetime), duration_minutes(hours))
+
+
+def fees_for_stays(tariff, arrival_datetimes, hours):
+    """Fee of many stays (arrival times and durations, broadcast together) in one tariff."""
+    compiled = compile_tariffs((tariff,))
+    return compiled.fees(0, minutes_of_day(arrival_datetimes), duration_minutes(hours))
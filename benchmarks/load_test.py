@@ -0,0 +1,417 @@
+"""
+Load test of ParkGallen: simulated users doing realistic sessions, in steps with more and more
+users, against the local stand-ins of the city APIs and of Nominatim (standin_server.py), so that
+it tells how many users one instance serves before the map render or the upstream fetches saturate.
+
+    python benchmarks/load_test.py --target api --workers 2 --users 1 2 4 8 16 --duration 20
+    python benchmarks/load_test.py --target api --url http://127.0.0.1:8000 --pid 12345   # a server already running
+    python benchmarks/load_test.py --target streamlit --users 1 2 4 8 --duration 30
+
+A session is one visit: a destination drawn inside the bounding box of geocoding.py (typed as an
+address one time in four), an arrival in the day and a stay of 0.5 to 5 hours, then the nearest
+Parkhaus, two to four changes of the radius slider, a change of the ranking weights or of the
+departure and a fee query. Every user waits --think-ms on average (exponential) between two actions.
+
+Targets
+    api        uvicorn api:app started with --workers worker processes (or the server at --url), one
+               keep-alive HTTP connection per user
+    streamlit  Codice_full.py run headless by streamlit.testing.v1.AppTest in this process, one AppTest
+               (one browser session) per user and session: every action is a full rerun of the script,
+               which is what the Streamlit server does per interaction (without websocket and browser)
+
+Every step reports throughput, latency percentiles (overall and per action), errors and the CPU
+and RSS of every worker process (read from /proc, so Linux only). For the streamlit target the
+worker is this process, the load generator included.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import requests
+import streamlit.logger
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import prices  # noqa: E402
+
+streamlit.logger.set_log_level("error")  # st.* calls outside of `streamlit run` only log warnings, for every session
+
+DEFAULT_USERS = (1, 2, 4, 8, 16)
+SEED = 7
+STARTUP_TIMEOUT = 60  # seconds for the servers to answer
+SAMPLE_INTERVAL = 0.5  # seconds between two RSS samples
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+RADII = (100, 250, 500, 750, 1000)
+
+
+# --- Sessions -------------------------------------------------------------------------
+
+def random_session(rng):
+    """The actions of one visit as (name, parameters), the same for both targets."""
+    import geocoding  # only once main() has pointed the environment to the stand-in (it reads it on import)
+    south, west = geocoding.SOUTHWEST_BOUND
+    north, east = geocoding.NORTHEAST_BOUND
+    destination = {'lat': float(rng.uniform(south, north)), 'lon': float(rng.uniform(west, east))}
+    if rng.random() < 0.25:
+        destination = {'address': f"Teststrasse {int(rng.integers(1, 500))}"}
+    arrival = datetime.combine(date.today(), datetime.min.time()) + timedelta(minutes=15 * int(rng.integers(6 * 4, 18 * 4)))
+    departure = arrival + timedelta(minutes=30 * int(rng.integers(1, 11)))
+    actions = [('nearest', {'destination': destination, 'arrival': arrival, 'departure': departure})]
+    for _ in range(int(rng.integers(2, 5))):
+        actions.append(('radius', {'radius': int(rng.choice(RADII))}))
+    if rng.random() < 0.5:
+        actions.append(('weights', {'weight': str(rng.choice(["walking", "fee", "free"])), 'value': float(rng.choice([0.0, 0.5, 2.0, 3.0]))}))
+    else:
+        actions.append(('departure', {'departure': departure + timedelta(minutes=30)}))
+    actions.append(('fees', {'garage': str(rng.choice(list(prices.TARIFFS))) if rng.random() < 0.8 else None}))
+    return actions
+
+
+class ApiUser:
+    """One user of the JSON API, keeping the state of its session (destination, stay, radius)."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.http = requests.Session()
+        self.state = {}
+
+    def start_session(self):
+        self.state = {'radius': 500}
+
+    def perform(self, name, parameters):
+        """Do one action, True if it succeeded."""
+        self.state.update(parameters)
+        point = self.state['destination']
+        if name == 'nearest':
+            response = self.http.get(f"{self.url}/nearest", params={**point, 'k': 3})
+        elif name in ('radius', 'weights'):
+            response = self.http.get(f"{self.url}/spots", params={**point, 'radius': self.state['radius'], 'limit': 200})
+        elif name in ('departure', 'fees'):
+            params = {'arrival': self.state['arrival'].isoformat(), 'departure': self.state['departure'].isoformat()}
+            if self.state.get('garage'):
+                params['garage'] = self.state['garage']
+            response = self.http.get(f"{self.url}/fees", params=params)
+        else:
+            raise ValueError(f"Unknown action {name}")
+        return response.status_code == 200
+
+
+class StreamlitUser:
+    """One browser session of the Streamlit app, driven by AppTest (a new one for every session)."""
+
+    def __init__(self, script=os.path.join(ROOT, "Codice_full.py")):
+        self.script = script
+        self.app = None
+
+    def start_session(self):
+        self.app = AppTest.from_file(self.script, default_timeout=STARTUP_TIMEOUT)
+        self.app.run()
+
+    def _slider(self, label):
+        return next(slider for slider in self.app.slider if slider.label.startswith(label))
+
+    def perform(self, name, parameters):
+        app = self.app
+        if name == 'nearest':
+            destination = parameters['destination']
+            text = destination.get('address') or f"{destination['lat']:.5f}, {destination['lon']:.5f}"
+            app.text_input(key="destination").input(text)
+            app.text_input(key="arrival_time").input(parameters['arrival'].strftime("%H:%M"))
+            app.text_input(key="departure_time").input(parameters['departure'].strftime("%H:%M"))
+            app.run()  # the button is only shown once the times are valid
+            app.button[0].click()
+        elif name == 'radius':
+            self._slider("Select search radius").set_value(parameters['radius'])
+        elif name == 'weights':
+            self._slider({'walking': "Walking time", 'fee': "Parking fee", 'free': "Free spaces"}[parameters['weight']]).set_value(parameters['value'])
+        elif name == 'departure':
+            app.text_input(key="departure_time").input(parameters['departure'].strftime("%H:%M"))
+        elif name == 'fees':
+            pass  # the app prices the recommended Parkhaus at every rerun, a rerun is the query
+        else:
+            raise ValueError(f"Unknown action {name}")
+        app.run()
+        return not app.exception and not app.error
+
+
+# --- Worker processes -----------------------------------------------------------------
+
+def _stat_fields(pid):
+    with open(f"/proc/{pid}/stat") as file:
+        return file.read().rsplit(")", 1)[1].split()  # the name in parentheses may contain spaces
+
+
+def process_usage(pid):
+    """(CPU seconds used so far, RSS in bytes) of a process."""
+    fields = _stat_fields(pid)
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, int(fields[21]) * PAGE_SIZE
+
+
+def worker_pids(pid):
+    """The worker processes of a server: its children except the multiprocessing helpers, else itself."""
+    children = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            if int(_stat_fields(name)[1]) != pid:
+                continue
+            with open(f"/proc/{name}/cmdline", "rb") as file:
+                command = file.read().replace(b"\0", b" ").decode(errors="replace")
+        except (OSError, IndexError):
+            continue  # the process ended meanwhile
+        if "resource_tracker" not in command:
+            children.append(int(name))
+    return sorted(children) or [pid]
+
+
+class ResourceSampler:
+    """CPU used and RSS (sampled every SAMPLE_INTERVAL) of processes during one step."""
+
+    def __init__(self, pids):
+        self.pids = list(pids)
+        self._rss = {pid: [] for pid in self.pids}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+
+    def _sample(self):
+        usage = {}
+        for pid in self.pids:
+            try:
+                usage[pid] = process_usage(pid)
+            except OSError:
+                continue
+            self._rss[pid].append(usage[pid][1])
+        return usage
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self._sample()
+
+    def start(self):
+        self._started = time.monotonic()
+        self._cpu_start = {pid: cpu for pid, (cpu, _) in self._sample().items()}
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        elapsed = time.monotonic() - self._started
+        end = self._sample()
+        return [
+            {
+                'pid': pid,
+                'cpu_percent': round(100 * (end[pid][0] - self._cpu_start[pid]) / elapsed, 1),
+                'rss_mb': round(float(np.mean(self._rss[pid])) / 2**20, 1),
+                'rss_mb_max': round(max(self._rss[pid]) / 2**20, 1),
+            }
+            for pid in self.pids if pid in end and pid in self._cpu_start
+        ]
+
+
+def wait_until_up(url, timeout=STARTUP_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=2).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not answer within {timeout} s")
+
+
+def start_process(command, environment, url):
+    log = tempfile.TemporaryFile()  # not a pipe: nobody reads it while the test runs, a full pipe would block the server
+    process = subprocess.Popen(command, cwd=ROOT, env=environment, stdout=subprocess.DEVNULL, stderr=log)
+    try:
+        wait_until_up(url)
+    except RuntimeError:
+        process.kill()
+        process.wait()
+        log.seek(0)
+        raise RuntimeError(f"{' '.join(command)} did not start: {log.read().decode(errors='replace')[-2000:]}")
+    return process
+
+
+def stop_process(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# --- Steps ----------------------------------------------------------------------------
+
+def run_user(make_user, seed, deadline, think, samples):
+    """Sessions of one user until deadline; samples gets (action, seconds, succeeded)."""
+    rng = np.random.default_rng(seed)
+    user = make_user()
+    while time.monotonic() < deadline:
+        user.start_session()
+        for name, parameters in random_session(rng):
+            if time.monotonic() >= deadline:
+                return
+            start = time.perf_counter()
+            try:
+                succeeded = user.perform(name, parameters)
+            except Exception:
+                succeeded = False
+            samples.append((name, time.perf_counter() - start, succeeded))
+            time.sleep(rng.exponential(think) if think > 0 else 0)
+
+
+def percentiles(seconds):
+    if len(seconds) == 0:
+        return {'p50_ms': None, 'p90_ms': None, 'p99_ms': None}
+    p50, p90, p99 = np.percentile(np.asarray(seconds) * 1000, [50, 90, 99])
+    return {'p50_ms': round(float(p50), 2), 'p90_ms': round(float(p90), 2), 'p99_ms': round(float(p99), 2)}
+
+
+def run_step(make_user, users, duration, think, pids, seed):
+    samples = [[] for _ in range(users)]
+    sampler = ResourceSampler(pids).start()
+    started = time.monotonic()
+    deadline = started + duration
+    threads = [threading.Thread(target=run_user, args=(make_user, seed * 1000 + i, deadline, think, samples[i]), daemon=True) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started  # the last actions may end after the deadline
+    workers = sampler.stop()
+
+    all_samples = [sample for user_samples in samples for sample in user_samples]
+    actions = {}
+    for name in sorted({sample[0] for sample in all_samples}):
+        chosen = [sample for sample in all_samples if sample[0] == name]
+        actions[name] = {'count': len(chosen), 'errors': sum(not ok for _, _, ok in chosen), **percentiles([s for _, s, _ in chosen])}
+    return {
+        'users': users,
+        'duration_s': round(elapsed, 2),
+        'requests': len(all_samples),
+        'errors': sum(not ok for _, _, ok in all_samples),
+        'throughput_rps': round(len(all_samples) / elapsed, 2),
+        **percentiles([s for _, s, _ in all_samples]),
+        'actions': actions,
+        'workers': workers,
+    }
+
+
+# --- Report ---------------------------------------------------------------------------
+
+def print_report(steps, slo_ms):
+    print(f"{'users':>5} {'req/s':>9} {'errors':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'workers':>8} {'CPU % (each)':>24} {'RSS MB (max, each)':>24}")
+    for step in steps:
+        cpu = " ".join(f"{w['cpu_percent']:.0f}" for w in step['workers'])
+        rss = " ".join(f"{w['rss_mb_max']:.0f}" for w in step['workers'])
+        print(f"{step['users']:>5} {step['throughput_rps']:>9.1f} {step['errors']:>7} {step['p50_ms'] or 0:>9.1f} {step['p90_ms'] or 0:>9.1f} {step['p99_ms'] or 0:>9.1f} {len(step['workers']):>8} {cpu:>24} {rss:>24}")
+
+    def cell(action):
+        return f"{action['p50_ms']:.0f} / {action['p99_ms']:.0f}" if action else "-"
+
+    names = sorted({name for step in steps for name in step['actions']})
+    print(f"\n{'p50 / p99 ms per action':<24}" + "".join(f"{name:>16}" for name in names))
+    for step in steps:
+        print(f"{step['users']:>5} users{'':<13}" + "".join(f"{cell(step['actions'].get(name)):>16}" for name in names))
+
+    best = max(steps, key=lambda step: step['throughput_rps'])
+    print(f"\nHighest throughput: {best['throughput_rps']:.1f} req/s with {best['users']} users")
+    over = [step for step in steps if (step['p99_ms'] or 0) > slo_ms]
+    if over:
+        print(f"p99 above {slo_ms:.0f} ms from {over[0]['users']} users on")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("api", "streamlit"), default="api")
+    parser.add_argument("--users", type=int, nargs="+", default=list(DEFAULT_USERS), help="simultaneous users of every step")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per step")
+    parser.add_argument("--think-ms", type=float, default=500, help="mean pause of a user between two actions")
+    parser.add_argument("--url", help="api target: a server already running (not started by the test)")
+    parser.add_argument("--pid", type=int, help="with --url: process of that server, for its CPU and RSS")
+    parser.add_argument("--workers", type=int, default=2, help="api target: uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8000, help="api target: port of the uvicorn started")
+    parser.add_argument("--standin-url", help="stand-in already running (default: one is started)")
+    parser.add_argument("--standin-port", type=int, default=8765)
+    parser.add_argument("--standin-latency-ms", type=float, default=50)
+    parser.add_argument("--standin-rate-limit", type=float, default=0.0, help="share of the upstream requests answered 429")
+    parser.add_argument("--slo-ms", type=float, default=1000, help="p99 latency reported as the limit")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    processes = []
+    try:
+        standin_url = args.standin_url
+        if standin_url is None:
+            standin_url = f"http://127.0.0.1:{args.standin_port}"
+            processes.append(start_process(
+                [sys.executable, os.path.join(ROOT, "benchmarks", "standin_server.py"), "--port", str(args.standin_port),
+                 "--latency-ms", str(args.standin_latency_ms), "--rate-limit", str(args.standin_rate_limit)],
+                os.environ.copy(), f"{standin_url}/_stats"))
+
+        # The app (in this process or in uvicorn) talks to the stand-in, with caches that do not touch the real ones
+        environment = {
+            'PARKGALLEN_OPENDATA_URL': standin_url,
+            'PARKGALLEN_NOMINATIM_URL': standin_url,
+            'PARKGALLEN_HTTP_MODE': "live",
+            'PARKGALLEN_HISTORY_DIR': "",
+            'PARKGALLEN_GEOCODE_CACHE': os.path.join(tempfile.mkdtemp(), "geocode_cache.sqlite3"),
+        }
+        if args.target == "api":
+            url = args.url
+            if url is None:
+                url = f"http://127.0.0.1:{args.port}"
+                server = start_process(
+                    [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"],
+                    {**os.environ, **environment}, f"{url}/health")
+                processes.append(server)
+                pids = worker_pids(server.pid)
+            else:
+                pids = worker_pids(args.pid) if args.pid else []
+            make_user = lambda: ApiUser(url)  # noqa: E731
+        else:
+            os.environ.update(environment)  # before Codice_full is imported by the first AppTest
+            os.chdir(ROOT)  # the script opens its logo with a relative path
+            pids = [os.getpid()]
+            make_user = StreamlitUser
+
+        # One session per user first, so that the datasets are loaded before the measurements
+        warmup_sessions = 2 * args.workers if args.target == "api" else 1
+        for i in range(warmup_sessions):
+            run_user(make_user, args.seed + i, time.monotonic() + 5, 0, [])
+
+        steps = []
+        for users in args.users:
+            step = run_step(make_user, users, args.duration, args.think_ms / 1000, pids, args.seed + users)
+            steps.append(step)
+            print(f"{users} users: {step['throughput_rps']:.1f} req/s, p99 {step['p99_ms']} ms, {step['errors']} errors", flush=True)
+    finally:
+        for process in reversed(processes):
+            stop_process(process)
+
+    print()
+    print_report(steps, args.slo_ms)
+    if args.output:
+        report = {'created': datetime.now().isoformat(timespec="seconds"), 'target': args.target, 'think_ms': args.think_ms,
+                  'standin_latency_ms': args.standin_latency_ms, 'standin_rate_limit': args.standin_rate_limit, 'steps': steps}
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""
+Benchmarks of the hot paths of the app: radius filter, nearest Parkhaus, map HTML,
+geocoding (with a stubbed geocoder) and the fee of every Parkhaus from 0.5 h to 30 days.
+
+Runs offline: the two St. Gallen APIs are replayed by http_replay from benchmarks/fixtures
+(recorded once with --record) through the same loaders as the app, and synthetic datasets of 10k and 100k
+points are generated with a fixed seed. Every benchmark reports throughput, p50/p99 latency
+per operation and peak memory (tracemalloc), and is compared to benchmarks/baseline.json if it
+exists. A benchmark whose run does many operations (e.g. 100 geocodes) divides the time of
+every run by their number, so its percentiles are over the mean latency of one operation per run.
+
+    python benchmarks/run_benchmarks.py                 # run and compare to the baseline
+    python benchmarks/run_benchmarks.py --save-baseline # run and store the results as the baseline
+    python benchmarks/run_benchmarks.py --record        # download the fixtures (needs the network)
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# The geocoding benchmark must not touch the real disk cache of the app
+os.environ.setdefault("PARKGALLEN_GEOCODE_CACHE", os.path.join(tempfile.mkdtemp(), "geocode_cache.sqlite3"))
+
+import folium  # noqa: E402
+
+import Codice_full  # noqa: E402
+import geocoding  # noqa: E402
+import http_replay  # noqa: E402
+import open_data  # noqa: E402
+import parking_dataset  # noqa: E402
+import poi_categories  # noqa: E402
+import prices  # noqa: E402
+import spatial_index  # noqa: E402
+from synthetic_data import CENTER, SEED, synthetic_parking_records, synthetic_poi_records, synthetic_records  # noqa: E402
+
+logging.getLogger("streamlit").setLevel(logging.ERROR)  # st.* calls outside of `streamlit run` only log warnings
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")  # an http_replay fixture store
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+SYNTHETIC_SIZES = (10_000, 100_000)
+RADII = (50, 250, 500, 1000)
+FEE_DURATIONS = np.arange(0.5, 30 * 24 + 0.5, 0.5)  # 0.5 h to 30 days
+ARRIVAL = datetime(2024, 5, 14, 8, 0)
+
+
+# --- Fixtures -------------------------------------------------------------------------
+
+def load_datasets(mode, directory):
+    """Run both loaders of the app with http_replay in mode on the fixtures of directory."""
+    previous_mode, previous_directory = http_replay.MODE, http_replay.FIXTURES_DIR
+    store = http_replay.set_mode(mode, directory)
+    store.rewind()
+    try:
+        return open_data.load_parking_data(), open_data.load_additional_data()
+    finally:
+        http_replay.set_mode(previous_mode, previous_directory)
+
+
+def record_fixtures():
+    """Download both APIs as they are now into benchmarks/fixtures (the only step that needs the network)."""
+    try:
+        parking, poi = load_datasets("record", FIXTURES_DIR)
+    except open_data.FetchError as e:
+        sys.exit(f"Could not download the fixtures: {e}")
+    print(f"Recorded {len(parking)} Parkhaus and {len(poi)} points of interest in {FIXTURES_DIR}")
+
+
+def synthetic_fixtures(directory):
+    """Fixture store in directory answering like the APIs, with the synthetic records of synthetic_data."""
+    store = http_replay.FixtureStore(directory)
+    parking_records, poi_records = synthetic_records()
+    store.add(open_data.PARKING_DATA_URL, None, json.dumps({'total_count': len(parking_records), 'results': parking_records}))
+    size = open_data.ADDITIONAL_DATA_PAGE_SIZE
+    for offset in range(0, len(poi_records), size):
+        page = {'total_count': len(poi_records), 'results': poi_records[offset:offset + size]}
+        store.add(open_data.ADDITIONAL_DATA_URL, open_data.additional_page_params(offset), json.dumps(page))
+    return store
+
+
+def load_fixture_datasets():
+    """The two datasets loaded by the loaders of the app from the recorded answers (synthetic ones if none were recorded)."""
+    if any(http_replay.FixtureStore(FIXTURES_DIR).entries()):
+        parking, poi = load_datasets("replay", FIXTURES_DIR)
+        return parking, poi, "recorded"
+    directory = tempfile.mkdtemp()
+    synthetic_fixtures(directory)
+    parking, poi = load_datasets("replay", directory)
+    return parking, poi, "synthetic (run with --record to record the APIs)"
+
+
+def synthetic_datasets(size):
+    """Parking and POI DataFrames of size rows, prepared like the loaders do (indexes included)."""
+    rng = np.random.default_rng(SEED + size)
+    parking = pd.DataFrame(synthetic_parking_records(size, rng))
+    parking['latitude'] = parking['standort'].map(lambda x: x['lat'])
+    parking['longitude'] = parking['standort'].map(lambda x: x['lon'])
+    parking['category'] = np.where(parking['phstate'] == 'offen', 'Parkhaus', 'Closed')
+    parking_dataset.build_dataset(parking)
+
+    poi = pd.DataFrame(open_data.parse_additional_records(synthetic_poi_records(size, rng)))
+    poi_categories.build_category_index(poi)
+    spatial_index.build_index(poi)
+    return parking, poi
+
+
+# --- Measurements -------------------------------------------------------------------
+
+def measure(name, function, repeat, calls_per_run=1, setup=None):
+    """Latency per operation of repeat runs of function (each doing calls_per_run operations) and the peak memory of one run."""
+    if setup:
+        setup()
+    function()  # warm-up, not measured
+    timings = np.empty(repeat)
+    for i in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings[i] = (time.perf_counter() - start) / calls_per_run
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'name': name,
+        'runs': repeat,
+        'calls_per_run': calls_per_run,
+        'ops_per_second': repeat / timings.sum(),
+        'p50_ms_per_op': float(np.percentile(timings, 50) * 1000),
+        'p99_ms_per_op': float(np.percentile(timings, 99) * 1000),
+        'peak_memory_kb': peak / 1024,
+    }
+
+
+def benchmark_dataset(label, parking, poi, repeat):
+    results = []
+    for radius in RADII:
+        results.append(measure(
+            f"filter_parking_by_radius[{label},r={radius}]",
+            lambda: Codice_full.filter_parking_by_radius(parking, CENTER, radius, True, True), repeat))
+        results.append(measure(
+            f"parking_in_radius[{label},r={radius}]",
+            lambda: Codice_full.parking_in_radius(parking, CENTER, radius, True), repeat))
+    results.append(measure(
+        f"find_nearest_parking_place[{label}]",
+        lambda: Codice_full.find_nearest_parking_place(parking, CENTER), repeat))
+
+    def map_html(render_mode):
+        map_folium = Codice_full.create_map()
+        Codice_full.add_markers_to_map(map_folium, parking, poi, CENTER, CENTER, 500, True, True, True, True, "x", render_mode=render_mode)
+        return map_folium.get_root().render()
+
+    map_repeat = max(repeat // 10, 3)
+    results.append(measure(f"add_markers_to_map[{label},fast]", lambda: map_html("fast"), map_repeat))
+    if len(poi) <= 20_000:  # one folium.Marker per point is minutes for 100k
+        results.append(measure(f"add_markers_to_map[{label},markers]", lambda: map_html("markers"), map_repeat))
+    results.append(measure(
+        f"render_incremental_map[{label}]",
+        lambda: Codice_full.render_incremental_map(parking, poi, CENTER, CENTER, 500, True, True, True, True, "x"), repeat))
+    return results
+
+
+class StubGeolocator:
+    """Answers like Nominatim without the network (a fixed point for every query)."""
+
+    class Location:
+        latitude, longitude = CENTER[1], CENTER[0]
+
+    def geocode(self, query, **kwargs):
+        return self.Location()
+
+
+def benchmark_geocoding(repeat):
+    geocoding._geolocator = StubGeolocator()
+    counter = iter(range(10**9))
+
+    def clear_memory():
+        geocoding._lru = geocoding.LRUCache()
+
+    queries = [f"Teststrasse {i}" for i in range(100)]
+    return [
+        measure("geocode_address[new query]", lambda: Codice_full.geocode_address(f"Neue Strasse {next(counter)}"), repeat),
+        measure("geocode_address[disk hit]", lambda: [Codice_full.geocode_address(q) for q in queries], max(repeat // 10, 3), len(queries), setup=clear_memory),
+        measure("geocode_address[memory hit]", lambda: [Codice_full.geocode_address(q) for q in queries], repeat, len(queries)),
+    ]
+
+
+def benchmark_fees(repeat):
+    functions = [getattr(prices, name) for name in dir(prices) if name.startswith("calculate_fee_") and callable(getattr(prices, name))]
+    durations = FEE_DURATIONS.tolist()
+
+    def all_fees():
+        for function in functions:
+            for hours in durations:
+                function(ARRIVAL, hours)
+
+    calls = len(functions) * len(durations)
+    fee_repeat = max(repeat // 20, 3)
+    return [
+        measure(f"calculate_fee_*[{len(functions)} garages x {len(durations)} durations, cold]", all_fees, fee_repeat, calls, setup=prices.cached_quote.cache_clear),
+        measure(f"calculate_fee_*[{len(functions)} garages x {len(durations)} durations, memoised]", all_fees, fee_repeat, calls),
+        measure("calculate_all_fees[batch, all durations]", lambda: [prices.calculate_all_fees(ARRIVAL, hours) for hours in durations], fee_repeat, len(durations)),
+    ]
+
+
+# --- Report ---------------------------------------------------------------------------
+
+def compare(results, baseline, tolerance):
+    """Benchmarks whose p50 is more than tolerance slower than in the baseline."""
+    previous = {entry['name']: entry for entry in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        old = previous.get(result['name'])
+        if old and old.get('p50_ms_per_op', 0) > 0:  # baselines saved before the latencies were per operation are skipped
+            result['p50_vs_baseline'] = result['p50_ms_per_op'] / old['p50_ms_per_op']
+            if result['p50_vs_baseline'] > 1 + tolerance:
+                regressions.append(result)
+    return regressions
+
+
+def print_table(results):
+    print(f"{'benchmark':<72} {'ops/run':>8} {'ops/s':>12} {'p50 ms/op':>10} {'p99 ms/op':>10} {'peak KB/run':>12} {'vs base':>8}")
+    for r in results:
+        ratio = f"{r['p50_vs_baseline']:.2f}x" if 'p50_vs_baseline' in r else ""
+        print(f"{r['name']:<72} {r['calls_per_run']:>8} {r['ops_per_second']:>12.1f} {r['p50_ms_per_op']:>10.3f} {r['p99_ms_per_op']:>10.3f} {r['peak_memory_kb']:>12.0f} {ratio:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", action="store_true", help="download the API answers into benchmarks/fixtures and exit")
+    parser.add_argument("--repeat", type=int, default=50, help="runs per benchmark (fewer for the slow ones)")
+    parser.add_argument("--sizes", type=int, nargs="*", default=list(SYNTHETIC_SIZES), help="sizes of the synthetic datasets")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown against the baseline")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        record_fixtures()
+        return 0
+
+    parking, poi, source = load_fixture_datasets()
+    print(f"Fixtures: {source}, {len(parking)} Parkhaus, {len(poi)} points of interest")
+    results = benchmark_dataset("fixtures", parking, poi, args.repeat)
+    for size in args.sizes:
+        parking, poi = synthetic_datasets(size)
+        results += benchmark_dataset(f"{size // 1000}k", parking, poi, args.repeat)
+    results += benchmark_geocoding(args.repeat)
+    results += benchmark_fees(args.repeat)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+    print_table(results)
+
+    report = {'created': datetime.now().isoformat(timespec="seconds"), 'python': sys.version.split()[0], 'numpy': np.__version__, 'pandas': pd.__version__, 'folium': folium.__version__, 'fixtures': source, 'results': results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.tolerance:.0%}:")
+        for r in regressions:
+            print(f"  {r['name']}: {r['p50_vs_baseline']:.2f}x")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""
+Local stand-in for the St. Gallen open-data API and for Nominatim, so that the whole app can be
+load tested and measured without the network (and without being rate limited by the real servers).
+
+    python benchmarks/standin_server.py --port 8765 --latency-ms 80 --jitter-ms 40 --rate-limit 0.05
+    PARKGALLEN_OPENDATA_URL=http://127.0.0.1:8765 PARKGALLEN_NOMINATIM_URL=http://127.0.0.1:8765 \
+        PARKGALLEN_GEOCODE_CACHE=/tmp/parkgallen-geocode.sqlite3 streamlit run Codice_full.py
+
+Serves
+    /api/explore/v2.1/catalog/datasets/<dataset>/records   paginated like Opendatasoft (limit <= 100, offset, total_count)
+    /search                                                  like Nominatim: one fixed point in St. Gallen per query
+    /_stats                                                  requests answered, rate limited and by path
+
+The data are the records of benchmarks/fixtures (--fixtures, recorded by run_benchmarks.py --record)
+or synthetic ones (synthetic_data.py). The free spaces of the Parkhaus change every --update-interval
+seconds: a daily-like wave of period --period seconds plus noise, both derived from the seed and the
+time, so two servers started with the same options serve the same occupancy at the same time.
+Every request waits --latency-ms (+ up to --jitter-ms) and a share --rate-limit of them is answered
+429 with a Retry-After header, like the real API when it rate limits us.
+"""
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from synthetic_data import SEED, synthetic_records
+
+import geocoding  # noqa: E402  (synthetic_data puts the app on sys.path)
+import http_replay  # noqa: E402
+
+PARKING_DATASET = "freie-parkplatze-in-der-stadt-stgallen-pls"
+POI_DATASET = "points-of-interest-"
+RECORDS_PREFIX = "/api/explore/v2.1/catalog/datasets/"
+MAX_LIMIT = 100  # larger pages are refused by Opendatasoft too
+DEFAULT_LIMIT = 10
+
+
+def fixture_records(directory):
+    """(parking records, POI records) recorded in an http_replay fixture store, None if it has neither."""
+    parking, poi_pages = None, {}
+    for url, answers in http_replay.FixtureStore(directory).entries():
+        ok = [answer for answer in answers if answer['status_code'] == 200]
+        if not ok:
+            continue
+        parts = urlsplit(url)
+        body = json.loads(ok[0]['text'])
+        if PARKING_DATASET in parts.path and parking is None:
+            parking = body.get('results', [])
+        elif POI_DATASET in parts.path:
+            offset = int(parse_qs(parts.query).get('offset', ['0'])[0])
+            poi_pages[offset] = body.get('results', [])
+    if parking is None or not poi_pages:
+        return None
+    return parking, [record for offset in sorted(poi_pages) for record in poi_pages[offset]]
+
+
+class StandinData:
+    """The records served, with the occupancy of the Parkhaus computed for the time of the request."""
+
+    def __init__(self, parking_records, poi_records, seed=SEED, period=3600.0, update_interval=60.0):
+        self.parking_records = parking_records
+        self.poi_records = poi_records
+        self.seed = seed
+        self.period = period
+        self.update_interval = update_interval
+        rng = np.random.default_rng(seed)
+        self.capacities = np.array([record.get('shortmax') or 0 for record in parking_records], dtype=float)
+        self.phases = rng.random(len(parking_records))
+        self.levels = rng.uniform(0.3, 0.7, len(parking_records))  # mean share of free spaces of every garage
+
+    def free_spaces(self, now):
+        """Free spaces of every garage at the unix time now (constant within an update interval)."""
+        tick = int(now // self.update_interval)
+        updated_at = tick * self.update_interval
+        wave = 0.25 * np.sin(2 * np.pi * (updated_at / self.period + self.phases))
+        noise = np.random.default_rng([self.seed, tick]).normal(0, 0.03, len(self.capacities))
+        share = np.clip(self.levels + wave + noise, 0, 1)
+        return np.rint(share * self.capacities).astype(int)
+
+    def parking_records_at(self, now):
+        free = self.free_spaces(now)
+        return [{**record, 'shortfree': int(free[i])} if record.get('phstate') == 'offen' else record
+                for i, record in enumerate(self.parking_records)]
+
+
+class StandinServer:
+    def __init__(self, data, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, rate_limit=0.0, retry_after=1, seed=SEED, verbose=False):
+        self.data = data
+        self.latency = latency  # seconds
+        self.jitter = jitter
+        self.rate_limit = rate_limit  # share of the requests answered 429
+        self.retry_after = retry_after
+        self.verbose = verbose
+        self.requests = Counter()  # path -> requests
+        self.rate_limited = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="standin-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {'requests': sum(self.requests.values()), 'rate_limited': self.rate_limited, 'paths': dict(self.requests)}
+
+    def _draw(self):
+        """(waiting time, rate limited?) of one request."""
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter), self._random.random() < self.rate_limit
+
+    # --- Answers ----------------------------------------------------------------------
+
+    def answer(self, path, query):
+        """(status code, body, extra headers) for a GET."""
+        if path == "/_stats":
+            return 200, self.stats(), {}
+        wait, limited = self._draw()
+        if wait > 0:
+            time.sleep(wait)
+        with self._lock:
+            self.requests[path] += 1
+            if limited:
+                self.rate_limited += 1
+        if limited:
+            return 429, {'error_code': "TooManyRequests", 'message': "Too many requests"}, {'Retry-After': str(self.retry_after)}
+        if path == "/search":
+            return 200, self.search(query.get('q', [""])[0]), {}
+        if path.startswith(RECORDS_PREFIX) and path.endswith("/records"):
+            return self.records(path[len(RECORDS_PREFIX):-len("/records")], query)
+        return 404, {'error_code': "NotFound", 'message': f"Unknown path {path}"}, {}
+
+    def records(self, dataset, query):
+        try:
+            limit = int(query.get('limit', [DEFAULT_LIMIT])[0])
+            offset = int(query.get('offset', [0])[0])
+        except ValueError:
+            return 400, {'error_code': "InvalidRESTParameterError", 'message': "limit and offset must be integers"}, {}
+        if limit > MAX_LIMIT or limit < 0 or offset < 0:
+            return 400, {'error_code': "InvalidRESTParameterError", 'message': f"limit must be between 0 and {MAX_LIMIT}"}, {}
+        if dataset == PARKING_DATASET:
+            records = self.data.parking_records_at(time.time())
+        elif dataset == POI_DATASET:
+            records = self.data.poi_records
+        else:
+            return 404, {'error_code': "DatasetNotFound", 'message': f"Unknown dataset {dataset}"}, {}
+        return 200, {'total_count': len(records), 'results': records[offset:offset + limit]}, {}
+
+    def search(self, q):
+        """A point inside the bounding box of geocoding.py, always the same for the same query."""
+        digest = hashlib.sha1(q.encode("utf-8")).digest()
+        south, west = geocoding.SOUTHWEST_BOUND
+        north, east = geocoding.NORTHEAST_BOUND
+        latitude = south + (north - south) * int.from_bytes(digest[:4], "big") / 2**32
+        longitude = west + (east - west) * int.from_bytes(digest[4:8], "big") / 2**32
+        return [{'place_id': int.from_bytes(digest[8:12], "big"), 'lat': f"{latitude:.7f}", 'lon': f"{longitude:.7f}", 'display_name': q,
+                 'boundingbox': [f"{latitude:.7f}", f"{latitude:.7f}", f"{longitude:.7f}", f"{longitude:.7f}"]}]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real servers behind the pooled session
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                status, body, headers = server.answer(parts.path, parse_qs(parts.query))
+                content = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                if server.verbose:
+                    super().log_message(format, *args)
+
+        return Handler
+
+
+def create_server(fixtures=None, garages=20, points_of_interest=1_500, seed=SEED, period=3600.0, update_interval=60.0, **options):
+    """A StandinServer (not started) with the records of the fixture store fixtures, or synthetic ones."""
+    records = fixture_records(fixtures) if fixtures else None
+    if fixtures and records is None:
+        raise ValueError(f"No parking and POI answers recorded in {fixtures}")
+    if records is None:
+        records = synthetic_records(garages, points_of_interest, seed)
+    return StandinServer(StandinData(*records, seed=seed, period=period, update_interval=update_interval), seed=seed, **options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", help="serve the records of this fixture store (e.g. benchmarks/fixtures) instead of synthetic ones")
+    parser.add_argument("--garages", type=int, default=20, help="synthetic Parkhaus")
+    parser.add_argument("--points", type=int, default=1_500, help="synthetic points of interest")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--period", type=float, default=3600.0, help="seconds of one occupancy wave")
+    parser.add_argument("--update-interval", type=float, default=60.0, help="seconds between two occupancy changes")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of the requests answered 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="seconds sent in Retry-After with a 429")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    server = create_server(
+        args.fixtures, args.garages, args.points, args.seed, args.period, args.update_interval,
+        host=args.host, port=args.port, latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+        rate_limit=args.rate_limit, retry_after=args.retry_after, verbose=args.verbose)
+    print(f"Serving on {server.url} ({len(server.data.parking_records)} Parkhaus, {len(server.data.poi_records)} points of interest)")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+Synthetic answers of the two St. Gallen APIs, shaped like the real ones and generated with a fixed
+seed. Used by run_benchmarks.py when no fixtures were recorded and by standin_server.py.
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prices  # noqa: E402
+
+SEED = 42
+CENTER = (9.3747, 47.4237)  # (longitude, latitude) like the app
+POI_INFO = ("Erweiterte blaue Zone", "Weiss (bewirtschaftet)", "Invalidenparkplatz", "Motorrad")
+
+
+def synthetic_parking_records(size, rng):
+    """Records shaped like the answer of the parking API."""
+    lats = CENTER[1] + rng.normal(0, 0.01, size)
+    lons = CENTER[0] + rng.normal(0, 0.015, size)
+    names = list(prices.TARIFFS)
+    records = []
+    for i in range(size):
+        total = int(rng.integers(50, 600))
+        records.append({
+            'phid': f"P{i}",
+            'phname': names[i % len(names)] if i < len(names) else f"Parkhaus {i}",
+            'phstate': "offen" if rng.random() < 0.9 else "geschlossen",
+            'shortfree': int(rng.integers(0, total)),
+            'shortmax': total,
+            'standort': {'lat': float(lats[i]), 'lon': float(lons[i])},
+        })
+    return records
+
+
+def synthetic_poi_records(size, rng):
+    """Records shaped like the answer of the points-of-interest API."""
+    lats = CENTER[1] + rng.normal(0, 0.01, size)
+    lons = CENTER[0] + rng.normal(0, 0.015, size)
+    info = rng.choice(POI_INFO, size)
+    return [
+        {
+            'geo_point_2d': {'lat': float(lats[i]), 'lon': float(lons[i])},
+            'name': f"Parkplatz {i}",
+            'description': "",
+            'adresse': f"Teststrasse {i}, 9000 St. Gallen",
+            'informatio': str(info[i]),
+        }
+        for i in range(size)
+    ]
+
+
+def synthetic_records(garages=20, points_of_interest=1_500, seed=SEED):
+    """(parking records, POI records) of the default fixture sizes."""
+    rng = np.random.default_rng(seed)
+    return synthetic_parking_records(garages, rng), synthetic_poi_records(points_of_interest, rng)
@@ -0,0 +1,42 @@
+import threading
+import weakref
+
+# Values computed once per loaded DataFrame (spatial index, POI categories, base map, Parkhaus
+# arrays) and looked up again by the identity of the frame.
+#
+# A DataFrame is not hashable, so the key is id(data) together with a weak reference to it: the
+# entry is dropped when the frame is garbage collected, and a new frame that reuses the id of a
+# dead one never sees the old value. The registry holds no strong reference to the frames.
+
+
+class FrameRegistry:
+    def __init__(self):
+        self._entries = {}  # id(data) -> (weak reference to data, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, data):
+        """The value registered for this exact DataFrame, or None."""
+        entry = self._entries.get(id(data))
+        if entry is not None and entry[0]() is data:
+            return entry[1]
+        return None
+
+    def put(self, data, value):
+        """Register value for data (until data is collected) and return it."""
+        key = id(data)
+        self._entries[key] = (weakref.ref(data, lambda _, key=key: self._entries.pop(key, None)), value)
+        return value
+
+    def get_or_build(self, data, build):
+        """The registered value, or build(data) registered now; concurrent callers share one build."""
+        value = self.get(data)
+        if value is not None:
+            return value
+        with self._lock:
+            value = self.get(data)
+            if value is None:
+                value = self.put(data, build(data))
+            return value
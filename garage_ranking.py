@@ -0,0 +1,147 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import distances
+import parking_dataset
+import prices
+import spatial_index
+
+# Ranking of the Parkhaus around the destination by several criteria instead of distance only.
+#
+# Every candidate gets a cost between 0 (best) and 1 (worst) per criterion, and the score is
+# their weighted mean:
+#   - walking: walking time, relative to the longest walk among the candidates
+#   - fee: fee of the stay, relative to the most expensive candidate (unknown fee = 1)
+#   - free: 1 when the garage is full, 0 from FREE_TARGET free spaces on (forecast ones if known)
+# Closed garages (phstate other than 'offen') are left out unless only_open=False, then they cost 1
+# on every criterion. The best k are chosen with argpartition and only those k are sorted.
+# Candidates come from the radius query of the spatial index (or the distances already in the
+# data), so the cost grows with the garages around the destination, not with the whole city.
+# data can also be a parking_dataset.DatasetView (what the app filters with): its rows are the
+# candidates and the columns come from the read-only arrays of the dataset, without any DataFrame.
+# The fees are the memoised quotes of prices.py (a dict lookup each once seen); for a handful
+# of garages that is faster than the batch pricing, whose fixed NumPy cost is ~0.2 ms.
+
+DEFAULT_WEIGHTS = {'walking': 1.0, 'fee': 1.0, 'free': 1.0}
+FREE_TARGET = 20  # free spaces from which a garage is not considered "almost full"
+WHOLE_COLUMN_ROWS = 2000  # up to this size a column is converted whole, above only the candidate rows
+
+
+def candidate_positions(data, destination_point, radius=None):
+    """Row positions and distances of the garages to rank (all of them, or those within radius)."""
+    if 'distance_to_destination' in data.columns and radius is None:
+        garage_distances = data['distance_to_destination'].to_numpy(dtype=float)
+        positions = np.flatnonzero(~np.isnan(garage_distances))
+        return positions, garage_distances[positions]
+    index = spatial_index.index_for(data)
+    if index is not None and radius is not None:
+        return index.query_radius(destination_point, radius)
+    garage_distances = distances.distances_from_data(data, destination_point)
+    inside = ~np.isnan(garage_distances) if radius is None else garage_distances <= radius
+    positions = np.flatnonzero(inside)
+    return positions, garage_distances[positions]
+
+
+def _relative(values):
+    """values / their maximum (0 when all are 0), NaN stays NaN."""
+    top = np.nanmax(values) if len(values) and not np.isnan(values).all() else 0.0
+    return values / top if top > 0 else np.zeros_like(values)
+
+
+def score_garages(walking_minutes, fees, free, is_open, weights=None):
+    """Weighted cost of every candidate (lower is better), the inputs are arrays of the same length."""
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    walking_cost = _relative(np.asarray(walking_minutes, dtype=float))
+    fee_cost = _relative(np.asarray(fees, dtype=float))
+    free = np.asarray(free, dtype=float)
+    free_cost = 1 - np.clip(np.where(np.isnan(free), 0.0, free) / FREE_TARGET, 0, 1)
+    costs = np.stack([np.nan_to_num(walking_cost, nan=1.0), np.nan_to_num(fee_cost, nan=1.0), free_cost])
+    weight = np.array([weights['walking'], weights['fee'], weights['free']], dtype=float)
+    total = weight.sum()
+    scores = weight @ costs / total if total > 0 else np.zeros(costs.shape[1])
+    return np.where(np.asarray(is_open, dtype=bool), scores, 1.0)
+
+
+def top_k(scores, k):
+    """Positions of the k lowest scores, best first (argpartition, then a sort of k items)."""
+    if k >= len(scores):
+        return np.argsort(scores, kind="stable")
+    best = np.argpartition(scores, k - 1)[:k]
+    return best[np.argsort(scores[best], kind="stable")]
+
+
+class RankedGarage(NamedTuple):
+    position: int  # row position in the ranked DataFrame (in view.dataset.data for a view)
+    name: str
+    state: str
+    free_spaces: float  # forecast free spaces if the data has them, else the current ones
+    total_spaces: float
+    distance: float  # metres
+    walking_minutes: float
+    fee: float  # NaN if the tariff is unknown
+    score: float
+
+
+def rank_garages(data, destination_point, arrival_datetime, rounded_total_hours, weights=None, k=3, radius=None, only_open=True):
+    """The k best Parkhaus of data for a stay, best first, as a list of RankedGarage (empty if there is no candidate)."""
+    if data.empty or destination_point is None:
+        return []
+    if isinstance(data, parking_dataset.DatasetView):
+        positions, garage_distances = data.positions, data.distances
+        if radius is not None:
+            inside = garage_distances <= radius
+            positions, garage_distances = positions[inside], garage_distances[inside]
+        columns = _view_columns(data.dataset, positions)
+    else:
+        positions, garage_distances = candidate_positions(data, destination_point, radius)
+        dataset = parking_dataset.dataset_for(data, build=False)  # the loaded DataFrames have one, their copies do not
+        columns = _view_columns(dataset, positions) if dataset is not None else _frame_columns(data, positions)
+    is_open = columns[0] == parking_dataset.OPEN_STATE
+    if only_open:
+        positions, garage_distances = positions[is_open], garage_distances[is_open]
+        columns = tuple(values[is_open] for values in columns)
+        is_open = is_open[is_open]
+    states, names, free, total = columns
+    if len(positions) == 0:
+        return []
+
+    quotes = [prices.calculate_parking_fees(name, arrival_datetime, rounded_total_hours) for name in names]
+    fees = np.array([quote.amount if quote is not None else np.nan for quote in quotes])
+    walking = distances.walking_minutes(garage_distances)
+
+    scores = score_garages(walking, fees, free, is_open, weights)
+    return [
+        RankedGarage(int(positions[i]), names[i], states[i], float(free[i]), float(total[i]), float(garage_distances[i]), float(walking[i]), float(fees[i]), float(scores[i]))
+        for i in top_k(scores, k).tolist()
+    ]
+
+
+def _view_columns(dataset, positions):
+    """(states, names, free spaces, capacity) of the rows at positions of a parking_dataset.ParkingDataset."""
+    free = dataset.expected_free if dataset.expected_free is not None else dataset.free
+    return dataset.states[positions], dataset.names[positions], parking_dataset.as_float(free[positions]), parking_dataset.as_float(dataset.total[positions])
+
+
+def _frame_columns(data, positions):
+    """(states, names, free spaces, capacity) of the rows at positions of a DataFrame, forecast free spaces if known."""
+    free_column = 'expected_free' if 'expected_free' in data.columns else 'shortfree'
+    return _column(data, 'phstate', positions, parking_dataset.OPEN_STATE), _column(data, 'phname', positions, None), _numbers(data, free_column, positions), _numbers(data, 'shortmax', positions)
+
+
+def _column(data, column, positions, default):
+    """Values of column at positions only (not the whole column, which is what keeps this sub-linear)."""
+    if column not in data.columns:
+        return np.full(len(positions), default, dtype=object)
+    if len(data) <= WHOLE_COLUMN_ROWS:
+        return data[column].to_numpy()[positions]  # cheaper than iloc on small tables
+    return data[column].iloc[positions].to_numpy()
+
+
+def _numbers(data, column, positions):
+    values = _column(data, column, positions, np.nan)
+    try:
+        return values.astype(float)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
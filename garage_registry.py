@@ -0,0 +1,97 @@
+import difflib
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import NamedTuple
+
+# Maps the Parkhaus names of the API (phname) to their tariff.
+# Lookups are one dict access: every name resolved once (exact, alias or fuzzy match) is
+# remembered, so the fuzzy matching only runs the first time a new spelling shows up.
+# The names also come from clients (api.py /fees?garage=), so nothing here grows without
+# bound: misses are not remembered, at most MAX_REMEMBERED names are, and the counters keep
+# MAX_COUNTED_NAMES names, the others are counted together under OTHER.
+
+FUZZY_CUTOFF = 0.85  # similarity needed by difflib for a fuzzy match
+MAX_REMEMBERED = 1024
+MAX_COUNTED_NAMES = 50
+MAX_NAME_LENGTH = 100  # longer names are never a garage, they miss without fuzzy matching
+OTHER = "(other)"
+
+
+class GarageMiss(NamedTuple):
+    """A name that matches no known garage."""
+    name: str
+    key: str
+    suggestions: tuple = ()
+
+
+def garage_key(name):
+    """Normalised name: case, umlauts, punctuation and words like 'Parkhaus' do not matter."""
+    key = unicodedata.normalize("NFC", str(name)).casefold()
+    key = key.replace("ä", "ae").replace("ö", "oe").replace("ü", "ue").replace("ß", "ss")
+    key = re.sub(r"[^a-z0-9]+", " ", key)
+    key = re.sub(r"\b(parkhaus|parkgarage|parking|tiefgarage|ph)\b", " ", key)
+    return " ".join(key.split())
+
+
+def count_name(counter, name):
+    """Count name in counter, under OTHER once the counter already has MAX_COUNTED_NAMES names."""
+    if name not in counter and len(counter) >= MAX_COUNTED_NAMES:
+        name = OTHER
+    counter[name] += 1
+
+
+class GarageRegistry:
+    def __init__(self, tariffs, aliases=None):
+        self.tariffs = dict(tariffs)
+        self._keys = {}
+        for garage, tariff in self.tariffs.items():
+            self._keys[garage_key(garage)] = tariff
+        for alias, garage in (aliases or {}).items():
+            self._keys[garage_key(alias)] = self.tariffs[garage]
+        self._resolved = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fuzzy_matches = Counter()
+        self.misses = Counter()
+
+    def resolve(self, name):
+        """Tariff of the garage called name, or a GarageMiss (also counted in self.misses)."""
+        result = self._resolved.get(name)
+        if result is None:
+            result = self._match(name)
+            if not isinstance(result, GarageMiss):
+                with self._lock:
+                    if len(self._resolved) < MAX_REMEMBERED:
+                        self._resolved[name] = result
+        if isinstance(result, GarageMiss):
+            with self._lock:
+                count_name(self.misses, result.name)
+        else:
+            self.hits += 1
+        return result
+
+    def _match(self, name):
+        key = garage_key(name)
+        tariff = self._keys.get(key)
+        if tariff is not None:
+            return tariff
+        if len(key) > MAX_NAME_LENGTH:
+            return GarageMiss(name[:MAX_NAME_LENGTH], key[:MAX_NAME_LENGTH])
+        close = difflib.get_close_matches(key, list(self._keys), n=3, cutoff=0.6)
+        if close and difflib.SequenceMatcher(None, key, close[0]).ratio() >= FUZZY_CUTOFF:
+            with self._lock:
+                count_name(self.fuzzy_matches, name)
+            return self._keys[close[0]]
+        return GarageMiss(name, key, tuple(self._keys[match].garage for match in close))
+
+    def stats(self):
+        return {
+            'garages': len(self.tariffs),
+            'hits': self.hits,
+            'misses': sum(self.misses.values()),
+            'remembered_names': len(self._resolved),
+            'unknown_names': dict(self.misses),
+            'fuzzy_names': dict(self.fuzzy_matches),
+        }
@@ -0,0 +1,229 @@
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from geopy import geocoders, exc
+
+import http_replay
+
+# Geocoding of the addresses typed in the sidebar, with three levels before the network:
+#   1. an in-memory LRU (repeat destinations such as "Bahnhof" resolve in microseconds)
+#   2. an on-disk SQLite store shared by all the processes and kept across restarts
+#   3. an optional offline gazetteer of St. Gallen addresses (CSV: address,latitude,longitude)
+# Only if all three miss is Nominatim asked, and the answer is stored in 1 and 2.
+# All the keys are the normalised query string, results are (longitude, latitude) like in the app.
+# PARKGALLEN_NOMINATIM_URL points the client to another server (e.g. benchmarks/standin_server.py),
+# and the Nominatim answers are recorded/replayed with the HTTP ones (http_replay.py).
+# The disk store outlives the process, so its keys are prefixed with where the answer came from
+# (disk_namespace): the points of a stand-in server or of the fixtures are never served once the
+# app is back on the real Nominatim, whose keys have no prefix.
+
+# Custom bounding box coordinates based on St. gallen map (Aid of ChatGPT)
+SOUTHWEST_BOUND = (47.404229, 9.324815)  # Adjusted to the southwest boundary
+NORTHEAST_BOUND = (47.4400, 9.4400)      # Adjusted to the northeast boundary
+
+LRU_SIZE = 1024
+RATE_LIMIT_WAIT = 10  # seconds waited before the single retry when Nominatim rate limits us
+CACHE_PATH = os.environ.get("PARKGALLEN_GEOCODE_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "geocode_cache.sqlite3"))
+GAZETTEER_PATH = os.environ.get("PARKGALLEN_GAZETTEER", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.csv"))
+NOMINATIM_URL = os.environ.get("PARKGALLEN_NOMINATIM_URL")  # default: the public nominatim.openstreetmap.org
+REPLAY_URL = "nominatim:/search"  # key of the Nominatim answers in the fixtures
+
+_NOT_FOUND = "not found"  # marker kept in memory only for queries Nominatim could not resolve
+
+
+def normalise_query(location):
+    """Key used by every cache level: case, accents composition, spaces and a trailing city name do not matter."""
+    query = unicodedata.normalize("NFC", location).casefold()
+    query = re.sub(r"\s+", " ", query).strip(" ,")
+    query = re.sub(r"^(.*?\S),?\s+(9000\s+)?(st\.?|sankt)\s*gallen(,?\s*(switzerland|schweiz))?$", r"\1", query)
+    return query.strip(" ,")
+
+
+def disk_namespace():
+    """Prefix of the disk keys: empty for the public Nominatim, else the other server or the replayed fixtures."""
+    if http_replay.MODE == "replay":
+        return f"replay {http_replay.FIXTURES_DIR}|"
+    return f"{NOMINATIM_URL}|" if NOMINATIM_URL else ""
+
+
+def inside_bounds(latitude, longitude):
+    return SOUTHWEST_BOUND[0] <= latitude <= NORTHEAST_BOUND[0] and SOUTHWEST_BOUND[1] <= longitude <= NORTHEAST_BOUND[1]
+
+
+class LRUCache:
+    def __init__(self, size=LRU_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DiskStore:
+    """Persistent key -> (longitude, latitude) store in a small SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS geocode (query TEXT PRIMARY KEY, longitude REAL, latitude REAL)"
+            )
+        return self._connection
+
+    def get(self, key):
+        try:
+            with self._lock:
+                row = self._connect().execute("SELECT longitude, latitude FROM geocode WHERE query = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            return None  # A broken or read-only cache file only costs us the network call
+        return None if row is None else (row[0], row[1])
+
+    def put(self, key, point):
+        longitude, latitude = point
+        try:
+            with self._lock:
+                connection = self._connect()
+                connection.execute("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?)", (key, longitude, latitude))
+                connection.commit()
+        except sqlite3.Error:
+            pass
+
+
+def load_gazetteer(path):
+    """Read the offline gazetteer, keeping only the addresses inside the St. Gallen bounding box."""
+    gazetteer = {}
+    if not path or not os.path.exists(path):
+        return gazetteer
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            try:
+                latitude, longitude = float(row["latitude"]), float(row["longitude"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if inside_bounds(latitude, longitude):
+                gazetteer[normalise_query(row.get("address", ""))] = (longitude, latitude)
+    return gazetteer
+
+
+_lru = LRUCache()
+_disk = DiskStore(CACHE_PATH) if CACHE_PATH else None
+_gazetteer = None
+_geolocator = None
+_setup_lock = threading.Lock()
+stats = {"memory": 0, "disk": 0, "gazetteer": 0, "network": 0}
+
+
+def get_gazetteer():
+    global _gazetteer
+    if _gazetteer is None:
+        with _setup_lock:
+            if _gazetteer is None:
+                _gazetteer = load_gazetteer(GAZETTEER_PATH)
+    return _gazetteer
+
+
+def get_geolocator():
+    """One Nominatim client for the whole process instead of one per call."""
+    global _geolocator
+    if _geolocator is None:
+        with _setup_lock:
+            if _geolocator is None:
+                options = {}
+                if NOMINATIM_URL:
+                    parts = urlsplit(NOMINATIM_URL)
+                    options = {'scheme': parts.scheme or "https", 'domain': parts.netloc + parts.path.rstrip("/")}
+                _geolocator = geocoders.Nominatim(user_agent="geocoding_app", timeout=10, **options)
+    return _geolocator
+
+
+def geocode_online(location):
+    """The answer of Nominatim for an address, or the recorded one in the replay mode of http_replay."""
+    full_location = f"{location}, St. Gallen, Switzerland"
+    if http_replay.MODE == "replay":
+        response = http_replay.get_store().replay(REPLAY_URL, {'q': full_location})
+        if response is None:
+            raise exc.GeocoderUnavailable(f"No recorded answer for {full_location!r}")
+        point = response.json()['point']
+        return tuple(point) if point is not None else None
+    point = geocode_nominatim(full_location)
+    if http_replay.MODE == "record":
+        http_replay.get_store().add(REPLAY_URL, {'q': full_location}, json.dumps({'point': point}))
+    return point
+
+
+def geocode_nominatim(full_location):
+    """Ask Nominatim, restricted to the St. Gallen bounding box. Retries once if we are rate limited."""
+    for attempt in range(2):
+        try:
+            geocoded_location = get_geolocator().geocode(full_location, viewbox=[SOUTHWEST_BOUND, NORTHEAST_BOUND], bounded=True)
+            break
+        except exc.GeocoderRateLimited as e:
+            if attempt == 1:
+                raise
+            time.sleep(min(e.retry_after or RATE_LIMIT_WAIT, RATE_LIMIT_WAIT))
+    if geocoded_location:
+        return (geocoded_location.longitude, geocoded_location.latitude)
+    return None
+
+
+def geocode(location):
+    """Return (longitude, latitude) for an address in St. Gallen, or None. Network errors are raised."""
+    key = normalise_query(location)
+    if not key:
+        return None
+
+    point = _lru.get(key)
+    if point is not None:
+        stats["memory"] += 1
+        return None if point is _NOT_FOUND else point
+
+    disk_key = disk_namespace() + key
+    point = _disk.get(disk_key) if _disk else None
+    if point is not None:
+        stats["disk"] += 1
+    else:
+        point = get_gazetteer().get(key)
+        if point is not None:
+            stats["gazetteer"] += 1
+        else:
+            stats["network"] += 1
+            point = geocode_online(location)
+            if point is None:
+                point = _NOT_FOUND
+            elif _disk:
+                _disk.put(disk_key, point)
+
+    _lru.put(key, point)
+    return None if point is _NOT_FOUND else point
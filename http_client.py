@@ -0,0 +1,107 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import http_replay
+import instrumentation
+
+# One shared HTTP session for all the calls to the open-data APIs.
+# The pooled adapter keeps the connections alive, so only the first request pays the
+# TCP + TLS handshake; every request has explicit connect/read timeouts.
+# In the record and replay modes of http_replay the answers are stored in / read from fixtures.
+
+CONNECT_TIMEOUT = 3.05  # seconds
+READ_TIMEOUT = 10  # seconds
+POOL_SIZE = 8  # connections kept per host, more than the parallel page downloads
+MAX_ATTEMPTS = 5
+BACKOFF_FACTOR = 1.5
+MAX_BACKOFF = 30  # seconds, also the longest Retry-After we are willing to wait
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def create_session(pool_size=POOL_SIZE):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"User-Agent": "ParkGallen", "Connection": "keep-alive"})
+    return session
+
+
+def get_session():
+    """Return the session shared by the whole process (created on first use)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def retry_after_seconds(response):
+    """Seconds asked by the Retry-After header (number of seconds or HTTP date), None if missing or invalid."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def backoff_seconds(attempt, response=None):
+    """Waiting time before the next attempt: Retry-After if the server sent one, else exponential backoff with jitter."""
+    if response is not None:
+        retry_after = retry_after_seconds(response)
+        if retry_after is not None:
+            return min(retry_after, MAX_BACKOFF)
+    return min(BACKOFF_FACTOR ** attempt + random.uniform(0, 1), MAX_BACKOFF)
+
+
+def get(url, params=None, session=None, max_attempts=MAX_ATTEMPTS, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), sleep=time.sleep):
+    """
+    GET with retries on rate limiting (429), temporary server errors and connection problems/timeouts.
+    Returns the last response (whatever its status code), or None if the server never answered.
+    """
+    if http_replay.MODE == "replay":
+        return http_replay.get_store().replay(url, params)
+    response = get_live(url, params, session, max_attempts, timeout, sleep)
+    if response is not None and http_replay.MODE == "record":
+        http_replay.get_store().record(url, params, response)
+    return response
+
+
+def get_live(url, params=None, session=None, max_attempts=MAX_ATTEMPTS, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), sleep=time.sleep):
+    session = session or get_session()
+    response = None
+    for attempt in range(max_attempts):
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            response = None
+            if instrumentation.ENABLED:
+                instrumentation.count_http_status(url, "error")
+            if attempt + 1 < max_attempts:
+                sleep(backoff_seconds(attempt))
+            continue
+        if instrumentation.ENABLED:
+            instrumentation.count_http_status(url, response.status_code)
+        if response.status_code not in RETRY_STATUS_CODES:
+            return response
+        if attempt + 1 < max_attempts:
+            sleep(backoff_seconds(attempt, response))
+    return response
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from requests.structures import CaseInsensitiveDict
+
+# Record/replay of the answers of the open-data APIs and of Nominatim, so that the benchmarks
+# and load tests run offline and always see the same data.
+#
+# PARKGALLEN_HTTP_MODE selects what http_client.get and geocoding.geocode_online do:
+#   live    (default) ask the servers
+#   record  ask the servers and also store every answer in PARKGALLEN_HTTP_FIXTURES
+#   replay  answer from the stored fixtures only, the network is never used
+# A request is identified by its URL with the query parameters merged and sorted, so the order
+# of the params does not matter. All the answers recorded for a request are kept in order; a
+# replay gives them back one after the other (e.g. the occupancy changing between two polls)
+# and then starts over. A request without fixture behaves like a server that does not answer.
+# One JSON file per request: <directory>/<host>/<sha1 of the URL>.json.
+
+MODES = ("live", "record", "replay")
+MODE = os.environ.get("PARKGALLEN_HTTP_MODE", "live")
+FIXTURES_DIR = os.environ.get("PARKGALLEN_HTTP_FIXTURES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "http"))
+RECORDED_HEADERS = ("Content-Type", "Retry-After")
+
+
+def canonical_url(url, params=None):
+    """url with the params added to its query string and all the parameters sorted."""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        items = params.items() if isinstance(params, dict) else params
+        query += [(str(key), str(value)) for key, value in items]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(sorted(query)), ""))
+
+
+class ReplayResponse:
+    """The parts of a requests.Response the app uses, rebuilt from a fixture."""
+
+    def __init__(self, url, status_code, text, headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.headers = CaseInsensitiveDict(headers or {})
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def content(self):
+        return self.text.encode("utf-8")
+
+    def json(self):
+        return json.loads(self.text)  # a new object every time, like a real answer
+
+
+class FixtureStore:
+    def __init__(self, directory=FIXTURES_DIR):
+        self.directory = directory
+        self._answers = {}  # canonical URL -> recorded answers
+        self._next = {}  # canonical URL -> number of answers already replayed
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+    def path(self, url):
+        parts = urlsplit(url)
+        host = (parts.netloc or parts.scheme or "local").replace(":", "_")
+        return os.path.join(self.directory, host, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+    def _load(self, url):
+        answers = self._answers.get(url)
+        if answers is None:
+            path = self.path(url)
+            answers = []
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as file:
+                    answers = json.load(file)['answers']
+            self._answers[url] = answers
+        return answers
+
+    def _save(self, url, answers):
+        path = self.path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({'url': url, 'answers': answers}, file, ensure_ascii=False)
+        os.replace(temporary, path)
+
+    def add(self, url, params, text, status_code=200, headers=None):
+        """Store one more answer for the request (text is the body as sent by the server)."""
+        url = canonical_url(url, params)
+        with self._lock:
+            answers = self._load(url)
+            answers.append({'status_code': status_code, 'headers': dict(headers or {}), 'text': text})
+            self._save(url, answers)
+            self.recorded += 1
+
+    def record(self, url, params, response):
+        headers = {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers}
+        self.add(url, params, response.text, response.status_code, headers)
+
+    def replay(self, url, params=None):
+        """The next recorded answer of the request as a ReplayResponse, None if nothing was recorded."""
+        url = canonical_url(url, params)
+        with self._lock:
+            answers = self._load(url)
+            if not answers:
+                self.misses += 1
+                return None
+            position = self._next.get(url, 0)
+            self._next[url] = position + 1
+            self.replayed += 1
+        answer = answers[position % len(answers)]
+        return ReplayResponse(url, answer['status_code'], answer['text'], answer['headers'])
+
+    def rewind(self):
+        """Replay every request from its first answer again."""
+        with self._lock:
+            self._next.clear()
+
+    def entries(self):
+        """(url, answers) of every request recorded in the directory."""
+        if not os.path.isdir(self.directory):
+            return
+        for host in sorted(os.listdir(self.directory)):
+            folder = os.path.join(self.directory, host)
+            if not os.path.isdir(folder):
+                continue
+            for name in sorted(os.listdir(folder)):
+                if name.endswith(".json"):
+                    with open(os.path.join(folder, name), encoding="utf-8") as file:
+                        fixture = json.load(file)
+                    yield fixture['url'], fixture['answers']
+
+    def stats(self):
+        return {'name': 'http_replay', 'mode': MODE, 'recorded': self.recorded, 'replayed': self.replayed, 'misses': self.misses}
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(directory=None):
+    """The process-wide store of directory (FIXTURES_DIR by default)."""
+    directory = directory or FIXTURES_DIR
+    with _stores_lock:
+        store = _stores.get(directory)
+        if store is None:
+            store = _stores[directory] = FixtureStore(directory)
+    return store
+
+
+def set_mode(mode, directory=None):
+    """Switch the whole process to live, record or replay (and to another fixtures directory if given)."""
+    global MODE, FIXTURES_DIR
+    if mode not in MODES:
+        raise ValueError(f"Unknown HTTP mode {mode!r}, use one of {MODES}")
+    MODE = mode
+    if directory is not None:
+        FIXTURES_DIR = directory
+    return get_store()
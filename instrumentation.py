@@ -0,0 +1,220 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlsplit
+
+# Timing of the request pipeline: latency histograms per span, status codes of the open-data
+# APIs and the hit rates of the caches, shown in the debug panel of the app and exportable
+# as JSON lines or as a Prometheus text file.
+#
+# Off unless PARKGALLEN_INSTRUMENTATION=1 (or enable() is called). When off, span() returns
+# a shared empty context manager, timed() returns the function itself and the HTTP counter
+# is one boolean check, so the hot path is unchanged.
+
+ENABLED = os.environ.get("PARKGALLEN_INSTRUMENTATION", "") not in ("", "0", "false", "no")
+METRIC_PREFIX = "parkgallen"
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)  # upper bounds, +inf is added
+
+_NO_SPAN = nullcontext()
+
+
+def enable(flag=True):
+    global ENABLED
+    ENABLED = bool(flag)
+
+
+def enabled():
+    return ENABLED
+
+
+class Histogram:
+    """Latency histogram with fixed buckets (milliseconds), quantiles are estimated from the buckets."""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q quantile (the largest value seen for the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.buckets[bucket], self.max) if bucket < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else 0.0,
+            'p50_ms': self.quantile(0.5),
+            'p99_ms': self.quantile(0.99),
+            'max_ms': self.max,
+        }
+
+
+_lock = threading.Lock()
+_histograms = {}
+_http_status = Counter()  # (host, status) -> responses, status 'error' when the server did not answer
+_stats_sources = {}
+
+
+def observe(name, ms):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(ms)
+
+
+@contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - start) * 1000)
+
+
+def span(name):
+    """with span("name"): ... records the duration of the block in the histogram called name."""
+    return _span(name) if ENABLED else _NO_SPAN
+
+
+def timed(name=None):
+    """Decorator recording every call in a histogram (the function name by default). No wrapper if off when decorating."""
+    def decorate(function):
+        if not ENABLED:
+            return function
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            with _span(span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count_http_status(url, status):
+    host = urlsplit(url).hostname or url
+    with _lock:
+        _http_status[(host, str(status))] += 1
+
+
+def add_stats_source(name, source):
+    """source() returns a dict (or a list of dicts with a 'name') of counters, e.g. the stats of a cache."""
+    _stats_sources[name] = source
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _http_status.clear()
+
+
+def histogram_summaries():
+    with _lock:
+        return {name: histogram.summary() for name, histogram in sorted(_histograms.items())}
+
+
+def http_status_counts():
+    with _lock:
+        return dict(_http_status)
+
+
+def cache_stats():
+    """Numeric counters of every stats source, as {source or source.name: {counter: value}}."""
+    result = {}
+    for source_name, source in list(_stats_sources.items()):
+        stats = source()
+        for entry in (stats if isinstance(stats, list) else [stats]):
+            key = f"{source_name}.{entry['name']}" if isinstance(stats, list) and 'name' in entry else source_name
+            result[key] = {k: v for k, v in entry.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+    return result
+
+
+def records(timestamp=None):
+    """Everything measured so far as a list of flat records (one JSON line each)."""
+    timestamp = time.time() if timestamp is None else timestamp
+    rows = []
+    with _lock:
+        for name, histogram in sorted(_histograms.items()):
+            rows.append({'time': timestamp, 'type': 'span', 'name': name, **histogram.summary(),
+                         'buckets': dict(zip([str(b) for b in histogram.buckets] + ['+Inf'], histogram.counts))})
+        for (host, status), count in sorted(_http_status.items()):
+            rows.append({'time': timestamp, 'type': 'http_status', 'host': host, 'status': status, 'count': count})
+    for name, counters in cache_stats().items():
+        rows.append({'time': timestamp, 'type': 'cache', 'name': name, **counters})
+    return rows
+
+
+def to_json_lines(timestamp=None):
+    return "".join(json.dumps(row) + "\n" for row in records(timestamp))
+
+
+def export_json_lines(path):
+    """Append one snapshot to path (one JSON object per line)."""
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(to_json_lines())
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _metric_name(value):
+    return "".join(c if c.isalnum() else "_" for c in str(value))
+
+
+def to_prometheus():
+    """Prometheus text exposition format."""
+    lines = [f"# TYPE {METRIC_PREFIX}_span_milliseconds histogram"]
+    with _lock:
+        for name, histogram in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, count in zip([str(b) for b in histogram.buckets] + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f'{METRIC_PREFIX}_span_milliseconds_bucket{{span="{_label(name)}",le="{bound}"}} {cumulative}')
+            lines.append(f'{METRIC_PREFIX}_span_milliseconds_sum{{span="{_label(name)}"}} {histogram.total}')
+            lines.append(f'{METRIC_PREFIX}_span_milliseconds_count{{span="{_label(name)}"}} {histogram.count}')
+        lines.append(f"# TYPE {METRIC_PREFIX}_http_responses_total counter")
+        for (host, status), count in sorted(_http_status.items()):
+            lines.append(f'{METRIC_PREFIX}_http_responses_total{{host="{_label(host)}",status="{_label(status)}"}} {count}')
+    by_counter = {}  # the samples of one metric must be consecutive
+    for name, counters in sorted(cache_stats().items()):
+        for counter, value in counters.items():
+            by_counter.setdefault(counter, []).append((name, value))
+    for counter, samples in sorted(by_counter.items()):
+        metric = f"{METRIC_PREFIX}_cache_{_metric_name(counter)}"
+        lines.append(f"# TYPE {metric} gauge")
+        lines.extend(f'{metric}{{cache="{_label(name)}"}} {value}' for name, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(path):
+    """Write the metrics for the textfile collector of node_exporter (replaced at once, never half written)."""
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        file.write(to_prometheus())
+    os.replace(temporary, path)
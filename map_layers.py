@@ -0,0 +1,133 @@
+import json
+
+import folium
+import numpy as np
+from folium.plugins.marker_cluster import MarkerCluster
+
+import distances
+import frame_registry
+
+# Map rendered in two parts, so that the cost of a request does not depend on the number of POIs:
+#   - the base: the folium map plus every POI (coordinates and popup) as one JavaScript array,
+#     serialised once per data refresh and kept here (shared by all the sessions);
+#   - the overlay: a small script with what changes at every request (your position, the
+#     destination, the radius, the Parkhaus with their availability and the row numbers of
+#     the POIs to show), appended to the cached base.
+# The clusters are built in the browser from the row numbers, with the same icons as add_marker.
+# The server work no longer depends on the number of POIs, but every rerun still sends the whole
+# base (all the POIs) to the browser: more than the folium map of a small radius, so the app
+# only uses this when PARKGALLEN_MAP_MODE=incremental. Sessions keep the overlay, not the HTML.
+
+MAP_CENTER = [47.4237, 9.3747]
+MAP_ZOOM = 14
+POI_ICONS = {"blue": "🔵", "white": "⚪", "handicapped": "♿"}
+PARKHAUS_ICON = "🅿️"
+
+BASE_SCRIPT = """
+<script>
+var parkgallen_points = %(points)s;
+var parkgallen_icons = %(icons)s;
+
+function parkgallen_icon(icon, size) {
+    return L.divIcon({html: '<div style="font-size: ' + size + 'pt">' + icon + '</div>', iconSize: [150, 36], iconAnchor: [7, 20], className: ''});
+}
+
+function parkgallen_marker(layer, point, icon, size) {
+    return L.marker([point[0], point[1]], {icon: parkgallen_icon(icon, size)}).bindPopup(point[2], {maxWidth: 250}).addTo(layer);
+}
+
+function parkgallen_show(map, categories, parkhaus, parkhaus_icon) {
+    if (parkhaus !== null) {
+        var parkhaus_cluster = L.markerClusterGroup();
+        parkhaus.forEach(function (point) { parkgallen_marker(parkhaus_cluster, point, parkhaus_icon, 20); });
+        parkhaus_cluster.addTo(map);
+    }
+    Object.keys(categories).forEach(function (category) {
+        var cluster = L.markerClusterGroup();
+        categories[category].forEach(function (row) {
+            var point = parkgallen_points[row];
+            if (point !== null) { parkgallen_marker(cluster, point, parkgallen_icons[category], 20); }
+        });
+        cluster.addTo(map);
+    });
+}
+</script>
+"""
+
+
+def to_js(value):
+    """JSON that can be put inside a <script> tag."""
+    return json.dumps(value).replace("</", "<\\/")
+
+
+class BaseMap:
+    __slots__ = ("html", "map_name")
+
+    def __init__(self, html, map_name):
+        self.html = html
+        self.map_name = map_name
+
+
+def render_base_map(additional_data):
+    """Render the folium map with every POI of additional_data as a JavaScript array (slow, done once per dataset)."""
+    map_folium = folium.Map(location=MAP_CENTER, zoom_start=MAP_ZOOM)
+    for name, url in MarkerCluster.default_js:
+        map_folium.get_root().header.add_child(folium.JavascriptLink(url), name=name)
+    for name, url in MarkerCluster.default_css:
+        map_folium.get_root().header.add_child(folium.CssLink(url), name=name)
+
+    latitudes, longitudes = distances.coordinate_arrays(additional_data)
+    addresses = additional_data['address'].tolist() if 'address' in additional_data.columns else ['No Address Provided'] * len(additional_data)
+    points = [
+        [lat, lon, f"Address: {address}"] if lat == lat and lon == lon else None
+        for lat, lon, address in zip(latitudes.tolist(), longitudes.tolist(), addresses)
+    ]
+
+    figure = folium.Figure().add_child(map_folium)
+    html = figure.render()
+    script = BASE_SCRIPT % {"points": to_js(points), "icons": to_js(POI_ICONS)}
+    return BaseMap(insert_before_end(html, script), map_folium.get_name())
+
+
+def insert_before_end(html, script):
+    """Add script at the end of the document, after the script that creates the map."""
+    end = html.rfind("</html>")
+    if end == -1:
+        return html + script
+    return html[:end] + script + html[end:]
+
+
+# One base per loaded POI DataFrame, rendered once even if several sessions ask at the same time
+_bases = frame_registry.FrameRegistry()
+
+
+def base_map_for(additional_data):
+    return _bases.get_or_build(additional_data, render_base_map)
+
+
+def overlay_script(base, location_point, destination_point, radius, parkhaus_points, category_positions):
+    """
+    Script with the part of the map that changes at every request.
+    parkhaus_points: [latitude, longitude, popup] of the Parkhaus to show (None to hide them);
+    category_positions: row numbers of the POIs to show, per category.
+    """
+    lines = [f"var map = {base.map_name};"]
+    if location_point:
+        lines.append(f"L.marker([{location_point[1]}, {location_point[0]}], {{icon: L.divIcon({{html: '<div style=\"font-size: 40pt;\">🏡</div>', className: ''}})}}).bindPopup('Your Position').addTo(map);")
+    if destination_point:
+        lines.append(f"L.marker([{destination_point[1]}, {destination_point[0]}], {{icon: L.divIcon({{html: '<div style=\"font-size: 40pt;\">📍</div>', className: ''}})}}).bindPopup('Your destination').addTo(map);")
+        if radius:
+            lines.append(f"L.circle([{destination_point[1]}, {destination_point[0]}], {{radius: {float(radius)}, color: 'Blue', fill: false}}).addTo(map);")
+    categories = {category: np.asarray(positions).tolist() for category, positions in category_positions.items()}
+    lines.append(f"parkgallen_show(map, {to_js(categories)}, {to_js(parkhaus_points)}, {to_js(PARKHAUS_ICON)});")
+    return "<script>\n(function () {\n" + "\n".join(lines) + "\n})();\n</script>\n"
+
+
+def request_overlay(additional_data, location_point, destination_point, radius, parkhaus_points, category_positions):
+    """Overlay script of this request for the base of additional_data."""
+    return overlay_script(base_map_for(additional_data), location_point, destination_point, radius, parkhaus_points, category_positions)
+
+
+def compose_map(additional_data, overlay):
+    """Full HTML of the map: the cached base plus an overlay."""
+    return insert_before_end(base_map_for(additional_data).html, overlay)
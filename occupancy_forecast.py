@@ -0,0 +1,171 @@
+import math
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+import parking_dataset
+
+# Forecast of the free spaces of every Parkhaus at the arrival time chosen by the user.
+#
+# The model is a seasonal profile: the mean number of free spaces per garage, weekday and
+# quarter of an hour (local time), kept as running sums in a (garage, 7, 96) table. Training
+# adds samples to the sums (np.add.at), so it is incremental: the poller gives it every new
+# snapshot, and the recorded history is added once, by the first snapshot after it is attached.
+# Both run in the polling thread, never in a request: get_forecaster() only returns the shared
+# forecaster, whoever calls it first, and a history given later is still read. A forecast is one
+# lookup in the table.
+# The lightweight correction: the difference between the current occupancy and the profile
+# of now is added to the profile of the arrival, halved every FORECAST_HALF_LIFE hours, so a
+# busier than usual morning still shows an hour later but not the next day.
+
+TIMEZONE = "Europe/Zurich"
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+MIN_SAMPLES = 3  # fewer samples in a cell: use the same quarter of an hour of all the weekdays
+FORECAST_HALF_LIFE = 2.0  # hours
+
+
+def local_slots(timestamps):
+    """(weekday, quarter of an hour) in local time of unix seconds."""
+    local = pd.to_datetime(np.asarray(timestamps, dtype=np.int64), unit="s", utc=True).tz_convert(TIMEZONE)
+    return np.asarray(local.weekday), np.asarray((local.hour * 60 + local.minute) // SLOT_MINUTES)
+
+
+def local_now():
+    """Current local time, naive like the arrival times typed by the user (the server may run in UTC)."""
+    return datetime.now(ZoneInfo(TIMEZONE)).replace(tzinfo=None)
+
+
+def arrival_slot(arrival_datetime):
+    """(weekday, quarter of an hour) of a local datetime as typed by the user."""
+    return arrival_datetime.weekday(), (arrival_datetime.hour * 60 + arrival_datetime.minute) // SLOT_MINUTES
+
+
+class OccupancyForecaster:
+    def __init__(self):
+        self._rows = {}  # garage name -> row of the tables
+        self.sums = np.zeros((0, 7, SLOTS_PER_DAY))
+        self.counts = np.zeros((0, 7, SLOTS_PER_DAY), dtype=np.int64)
+        self.totals = np.zeros(0)  # last known capacity of every garage
+        self.trained_until = 0  # unix seconds of the newest sample seen
+        self.history = None  # occupancy_history.OccupancyHistory learnt from, see attach_history
+        self._history_pending = False
+        self._lock = threading.Lock()
+
+    def _row(self, name):
+        row = self._rows.get(name)
+        if row is None:
+            # the tables grow before the name is visible, so a concurrent forecast never sees a missing row
+            row = len(self._rows)
+            self.sums = np.concatenate([self.sums, np.zeros((1, 7, SLOTS_PER_DAY))])
+            self.counts = np.concatenate([self.counts, np.zeros((1, 7, SLOTS_PER_DAY), dtype=np.int64)])
+            self.totals = np.append(self.totals, np.nan)
+            self._rows[name] = row
+        return row
+
+    def add_samples(self, names, timestamps, free, total=None):
+        """Add observations (arrays of the same length); missing free values are skipped."""
+        free = np.asarray(free, dtype=float)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        valid = ~np.isnan(free) & (free >= 0)
+        if not valid.any():
+            return 0
+        weekdays, slots = local_slots(timestamps[valid])
+        with self._lock:
+            rows = np.array([self._row(name) for name in np.asarray(names, dtype=object)[valid]])
+            np.add.at(self.sums, (rows, weekdays, slots), free[valid])
+            np.add.at(self.counts, (rows, weekdays, slots), 1)
+            if total is not None:
+                total = np.asarray(total, dtype=float)[valid]
+                known = ~np.isnan(total) & (total > 0)
+                self.totals[rows[known]] = total[known]
+            self.trained_until = max(self.trained_until, int(timestamps[valid].max()))
+        return int(valid.sum())
+
+    def attach_history(self, history):
+        """Learn from history too: the next add_snapshot reads it (once) before its own samples."""
+        with self._lock:
+            if self.history is None:
+                self.history, self._history_pending = history, True
+
+    def add_snapshot(self, snapshot):
+        """Train on one occupancy_poller.OccupancySnapshot (used as a listener of the poller)."""
+        if self._history_pending:
+            self._history_pending = False
+            self.train_from_history(self.history, until=int(snapshot.fetched_at))  # the snapshot may already be recorded
+        dataset = snapshot.dataset
+        return self.add_samples(dataset.names, np.full(len(snapshot), int(snapshot.fetched_at)), parking_dataset.as_float(dataset.free), parking_dataset.as_float(dataset.total))
+
+    __call__ = add_snapshot
+
+    def train_from_history(self, history, until=None):
+        """Add the records of an occupancy_history.OccupancyHistory newer than what was already seen."""
+        records = history.read(self.trained_until + 1, until if until is not None else int(time.time()) + 1)
+        if len(records) == 0:
+            return 0
+        frame = history.to_frame(records)
+        return self.add_samples(frame['phname'].to_numpy(), records['time'], frame['shortfree'].to_numpy(), frame['shortmax'].to_numpy())
+
+    def profile(self, names, weekday, slot):
+        """Mean free spaces of every garage at (weekday, slot), NaN where there is no data."""
+        rows = np.array([self._rows.get(name, -1) for name in names], dtype=np.int64)
+        result = np.full(len(rows), np.nan)
+        known = rows >= 0
+        if not known.any():
+            return result
+        r = rows[known]
+        cell_count = self.counts[r, weekday, slot]
+        all_days_count = self.counts[r, :, slot].sum(axis=-1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cell = self.sums[r, weekday, slot] / cell_count
+            all_days = self.sums[r, :, slot].sum(axis=-1) / all_days_count
+        result[known] = np.where(cell_count >= MIN_SAMPLES, cell, np.where(all_days_count > 0, all_days, np.nan))
+        return result
+
+    def predict(self, names, arrival_datetime, current_free=None, now=None):
+        """
+        Expected free spaces of the garages called names at arrival_datetime (local time, naive), NaN if unknown.
+        With current_free (the occupancy now) the forecast is corrected by today's difference to the profile.
+        """
+        names = list(names)
+        forecast = self.profile(names, *arrival_slot(arrival_datetime))
+        if current_free is not None:
+            now = now or local_now()
+            current_free = np.asarray(current_free, dtype=float)
+            usual_now = self.profile(names, *arrival_slot(now))
+            lead_hours = max((arrival_datetime - now).total_seconds() / 3600, 0.0)
+            weight = math.pow(0.5, lead_hours / FORECAST_HALF_LIFE)
+            difference = np.where(np.isnan(current_free) | np.isnan(usual_now), 0.0, current_free - usual_now)
+            forecast = forecast + weight * difference
+        rows = [self._rows.get(name, -1) for name in names]
+        capacity = np.array([self.totals[row] if row >= 0 else np.nan for row in rows])
+        forecast = np.maximum(forecast, 0.0)
+        return np.where(np.isnan(capacity), forecast, np.minimum(forecast, capacity))
+
+    def stats(self):
+        return {
+            'name': 'forecast',
+            'garages': len(self._rows),
+            'samples': int(self.counts.sum()),
+            'trained_until': self.trained_until,
+        }
+
+
+_forecaster = None
+_forecaster_lock = threading.Lock()
+
+
+def get_forecaster(history=None):
+    """The process-wide forecaster; the first history given is read by its next snapshot (see attach_history)."""
+    global _forecaster
+    if _forecaster is None:
+        with _forecaster_lock:
+            if _forecaster is None:
+                _forecaster = OccupancyForecaster()
+    if history is not None and _forecaster.history is None:
+        _forecaster.attach_history(history)
+    return _forecaster
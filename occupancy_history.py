@@ -0,0 +1,181 @@
+import fcntl
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+# History of the occupancy, one record per Parkhaus per poll, kept in append-only binary files.
+#
+# Every record is 19 bytes (time, garage number, free and total spaces, state), written in
+# one file per UTC day: <directory>/YYYY-MM-DD.bin. The names of the garages and states are
+# numbered in <directory>/dictionary.json. The files are read back with numpy.memmap; the
+# records of a day are in time order, so a time window is two binary searches and a garage
+# is a mask on the window.
+# Missing numbers are stored as -1.
+# Every process (Streamlit, each uvicorn worker) polls the API, but only one of them writes: the
+# one holding the non-blocking flock on <directory>/writer.lock, kept for the life of the process.
+# When it exits the lock is released and the next poll of another process takes over, so every
+# poll is recorded once however many processes share the directory.
+
+HISTORY_DIR = os.environ.get("PARKGALLEN_HISTORY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "occupancy_history"))
+
+RECORD_DTYPE = np.dtype([
+    ('time', '<i8'),  # unix seconds of the download
+    ('garage', '<u2'),  # number of the garage in dictionary.json
+    ('free', '<i4'),
+    ('total', '<i4'),
+    ('state', 'i1'),  # number of the state in dictionary.json, -1 unknown
+])
+
+
+def _day(timestamp):
+    return datetime.fromtimestamp(int(timestamp), timezone.utc).strftime("%Y-%m-%d")
+
+
+def _timestamp(value):
+    """Unix seconds of a datetime (naive = UTC), a pandas Timestamp or a number."""
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return int(value)
+    value = pd.Timestamp(value)
+    if value.tzinfo is None:
+        value = value.tz_localize("UTC")
+    return int(value.timestamp())
+
+
+class OccupancyHistory:
+    def __init__(self, directory=HISTORY_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._dictionary_path = os.path.join(directory, "dictionary.json")
+        self._dictionary = {'garages': [], 'states': []}
+        self._numbers = {'garages': {}, 'states': {}}
+        self._writer_lock = None  # open writer.lock while this process is the one that writes
+        self.skipped = 0  # snapshots left to the process that writes
+        self._load_dictionary()
+
+    def _load_dictionary(self):
+        if os.path.exists(self._dictionary_path):
+            with open(self._dictionary_path, encoding="utf-8") as file:
+                self._dictionary = json.load(file)
+        self._numbers = {kind: {name: i for i, name in enumerate(names)} for kind, names in self._dictionary.items()}
+
+    def _number(self, kind, name):
+        number = self._numbers[kind].get(name)
+        if number is None:
+            self._load_dictionary()  # another process may have added it
+            number = self._numbers[kind].get(name)
+        if number is None:
+            number = len(self._dictionary[kind])
+            self._dictionary[kind].append(name)
+            self._numbers[kind][name] = number
+            temporary = f"{self._dictionary_path}.tmp"
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(self._dictionary, file, ensure_ascii=False)
+            os.replace(temporary, self._dictionary_path)
+        return number
+
+    def garages(self):
+        return list(self._dictionary['garages'])
+
+    def is_writer(self):
+        """True if this process writes the history (takes the writer lock if no other process has it)."""
+        if self._writer_lock is None:
+            os.makedirs(self.directory, exist_ok=True)
+            lock = open(os.path.join(self.directory, "writer.lock"), "w")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                return False
+            self._writer_lock = lock
+        return True
+
+    def append(self, snapshot):
+        """Store one occupancy_poller.OccupancySnapshot (one record per garage)."""
+        if len(snapshot) == 0:
+            return 0
+        with self._lock:
+            writer = self.is_writer()
+        if not writer:
+            self.skipped += 1
+            return 0
+        with self._lock, open(os.path.join(self.directory, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # the dictionary and the files are shared by all the processes
+            records = np.empty(len(snapshot), dtype=RECORD_DTYPE)
+            records['time'] = int(snapshot.fetched_at)
+            dataset = snapshot.dataset  # free spaces and capacity are already int32 with -1 when missing
+            records['garage'] = [self._number('garages', str(name)) for name in dataset.names]
+            records['free'] = dataset.free
+            records['total'] = dataset.total
+            records['state'] = [self._number('states', state) if isinstance(state, str) else -1 for state in dataset.states]  # a missing state is NaN in pandas
+            with open(os.path.join(self.directory, f"{_day(snapshot.fetched_at)}.bin"), "ab") as file:
+                file.write(records.tobytes())
+        return len(records)
+
+    __call__ = append  # so that the history can be given to the poller as a listener
+
+    def _day_records(self, day):
+        path = os.path.join(self.directory, f"{day}.bin")
+        if not os.path.exists(path):
+            return None
+        count = os.path.getsize(path) // RECORD_DTYPE.itemsize  # a record being written is ignored
+        if count == 0:
+            return None
+        return np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+
+    def read(self, start, end, garages=None):
+        """Records with start <= time < end (datetimes or unix seconds), of the named garages only if given."""
+        start, end = _timestamp(start), _timestamp(end)
+        numbers = None
+        if garages is not None:
+            self._load_dictionary()
+            numbers = np.array([self._numbers['garages'][name] for name in garages if name in self._numbers['garages']], dtype=np.uint16)
+        parts = []
+        for day in self.days(start, end):
+            records = self._day_records(day)
+            if records is None:
+                continue
+            times = records['time']
+            window = records[np.searchsorted(times, start, side="left"):np.searchsorted(times, end, side="left")]
+            if numbers is not None:
+                window = window[np.isin(window['garage'], numbers)]
+            parts.append(np.array(window))  # copy, the memmap is closed with the file
+        return np.concatenate(parts) if parts else np.empty(0, dtype=RECORD_DTYPE)
+
+    def days(self, start=None, end=None):
+        """Days (YYYY-MM-DD) with records, between the unix seconds start (included) and end (excluded) if given."""
+        if not os.path.isdir(self.directory):
+            return []
+        days = sorted(name[:-len(".bin")] for name in os.listdir(self.directory) if name.endswith(".bin"))
+        if start is not None:
+            days = [day for day in days if day >= _day(start)]
+        if end is not None:
+            days = [day for day in days if day <= _day(end - 1)]
+        return days
+
+    def to_frame(self, records):
+        """Records as a DataFrame with the names of the garages and states and NaN for missing numbers."""
+        self._load_dictionary()
+        garages = np.array(self._dictionary['garages'] or [""], dtype=object)
+        states = np.array(self._dictionary['states'] + [None], dtype=object)  # -1 picks the last one (None)
+        return pd.DataFrame({
+            'time': pd.to_datetime(records['time'], unit="s", utc=True),
+            'phname': garages[records['garage']] if len(records) else np.empty(0, dtype=object),
+            'shortfree': np.where(records['free'] < 0, np.nan, records['free']),
+            'shortmax': np.where(records['total'] < 0, np.nan, records['total']),
+            'phstate': states[records['state']] if len(records) else np.empty(0, dtype=object),
+        })
+
+
+_histories = {}
+
+
+def get_history(directory=HISTORY_DIR):
+    """The process-wide history writing to directory."""
+    history = _histories.get(directory)
+    if history is None:
+        history = _histories.setdefault(directory, OccupancyHistory(directory))
+    return history
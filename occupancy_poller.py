@@ -0,0 +1,122 @@
+import threading
+import time
+
+import parking_dataset
+
+# Live occupancy of the Parkhaus, downloaded by a background thread instead of inside the
+# user request.
+#
+# The thread calls the loader every interval seconds and publishes the result as an
+# OccupancySnapshot: the DataFrame the rest of the app works on and its
+# parking_dataset.ParkingDataset, the read-only arrays built once per download. The history, the
+# forecast, api.py and the app all read that one dataset (dataset_for returns it for the DataFrame).
+# Publishing is a single reference assignment, so readers take self.snapshot without a lock
+# and always see a complete snapshot. If a poll fails the previous snapshot stays published
+# (its age tells how old it is) and the error is kept in last_error.
+# Listeners (e.g. occupancy_history) are called in the polling thread with every new snapshot.
+
+DEFAULT_INTERVAL = 60  # seconds, about how often the city updates the occupancy
+FIRST_SNAPSHOT_TIMEOUT = 15  # seconds a request waits for the very first download
+
+
+class OccupancySnapshot:
+    __slots__ = ("dataset", "data", "fetched_at")
+
+    def __init__(self, data, fetched_at=None):
+        self.dataset = parking_dataset.dataset_for(data)  # built by the loader, or now if it did not
+        self.data = data  # the DataFrame of the loader (with its spatial index), never modified after publishing
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def age(self, now=None):
+        """Seconds since the data was downloaded."""
+        return (time.time() if now is None else now) - self.fetched_at
+
+
+class OccupancyPoller:
+    def __init__(self, load, interval=DEFAULT_INTERVAL, listeners=()):
+        self.load = load  # returns a DataFrame or raises
+        self.interval = interval
+        self.listeners = list(listeners)  # called with every new snapshot
+        self.listener_errors = 0
+        self.snapshot = None
+        self.last_error = None
+        self.polls = 0
+        self.failures = 0
+        self._first = threading.Event()  # set after the first poll, successful or not
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def poll(self):
+        """Download once and publish the result; on failure the last snapshot stays."""
+        self.polls += 1
+        try:
+            snapshot = OccupancySnapshot(self.load())
+        except Exception as e:
+            self.failures += 1
+            self.last_error = e
+            self._first.set()
+            return self.snapshot
+        self.snapshot = snapshot
+        self.last_error = None
+        self._first.set()
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception:
+                self.listener_errors += 1  # a listener must never stop the polling
+        return snapshot
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.poll()
+            self._stop.wait(max(self.interval - (time.monotonic() - started), 0))
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="occupancy-poller", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def current(self, timeout=FIRST_SNAPSHOT_TIMEOUT):
+        """The published snapshot; only before the first poll does this wait (up to timeout). None if there is none."""
+        snapshot = self.snapshot
+        if snapshot is None and not self._first.is_set():
+            self._first.wait(timeout)
+            snapshot = self.snapshot
+        return snapshot
+
+    def stats(self):
+        snapshot = self.snapshot
+        return {
+            'name': 'occupancy',
+            'polls': self.polls,
+            'failures': self.failures,
+            'listener_errors': self.listener_errors,
+            'garages': len(snapshot) if snapshot is not None else 0,
+            'age_seconds': snapshot.age() if snapshot is not None else -1.0,
+        }
+
+
+_pollers = {}
+_pollers_lock = threading.Lock()
+
+
+def get_poller(name, load, interval=DEFAULT_INTERVAL, listeners=()):
+    """The process-wide poller called name, created (with its listeners) and started on first use."""
+    with _pollers_lock:
+        poller = _pollers.get(name)
+        if poller is None:
+            poller = _pollers[name] = OccupancyPoller(load, interval, listeners)
+    return poller.start()
@@ -0,0 +1,182 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import http_client
+import occupancy_forecast
+import occupancy_history
+import occupancy_poller
+import parking_dataset
+import poi_categories
+import prices
+import spatial_index
+import ttl_cache
+
+# Download of the two datasets of the city (occupancy of the Parkhaus, points of interest) and the
+# process-wide stores that keep them, shared by the Streamlit app (Codice_full.py) and api.py.
+#
+# This is an imported module on purpose: Streamlit executes Codice_full.py again at every rerun,
+# which would define FetchError and the loaders again, while the poller and the cache started by
+# the first run keep calling the first definitions (isinstance on the errors they raise fails).
+
+
+#Used to handale the API with a rate limit (unrelible conditions)
+#The retries, the backoff (honouring Retry-After) and the shared connection pool are in http_client.py
+def safe_request(url, params):
+    """Make a request with exponential backoff."""
+    response = http_client.get(url, params=params)
+    if response is not None and response.status_code == 200:
+        return response
+    return None   #Written with the help of ChatGPT, in order to prevent and help with the rate of requests a user can make 
+
+
+#Raised by the loaders below, so that a failed download is never stored in the cache
+
+class FetchError(Exception):
+    def __init__(self, message, data=None):
+        super().__init__(message)
+        self.data = data  # Whatever could be downloaded before the error, if anything
+
+
+#Both datasets are kept for the whole process (shared by all the sessions)
+#The occupancy is downloaded every minute by a background thread (occupancy_poller.py), the list of
+#parking spaces almost never changes and is cached for a day (ttl_cache.py)
+
+PARKING_DATA_INTERVAL = 60  # seconds between two downloads of the occupancy
+ADDITIONAL_DATA_TTL = 24 * 3600
+ADDITIONAL_DATA_RETRY = 60  # seconds a failed download is not tried again (the error is shown meanwhile)
+
+#With PARKGALLEN_PRECOMPUTE_FEES=1 the fee memo of prices.py is filled in the background when the process starts
+#(the app and api.py both import this module once per process)
+
+if prices.PRECOMPUTE_FEES:
+    prices.start_precompute()
+
+#Server of the open data of the city, PARKGALLEN_OPENDATA_URL points to another one (e.g. benchmarks/standin_server.py)
+OPENDATA_URL = os.environ.get("PARKGALLEN_OPENDATA_URL", "https://daten.stadt.sg.ch").rstrip("/")
+PARKING_DATA_URL = f"{OPENDATA_URL}/api/explore/v2.1/catalog/datasets/freie-parkplatze-in-der-stadt-stgallen-pls/records?limit=20"
+
+
+#Call of the first API (Parkhaus platzte)
+
+def load_parking_data():
+    """Download the parking data from the API, raises FetchError if there is nothing usable."""
+    response = http_client.get(PARKING_DATA_URL)
+    if response is None:
+        raise FetchError("Failed to retrieve data: the API did not answer.")
+    if response.status_code == 200:
+        data = response.json()['results']
+        if data:
+            parking_data = pd.DataFrame(data)
+            parking_data['latitude'] = parking_data['standort'].apply(lambda x: x.get('lat'))
+            parking_data['longitude'] = parking_data['standort'].apply(lambda x: x.get('lon'))
+            parking_data['category'] = np.where(parking_data['phstate'] == parking_dataset.OPEN_STATE, 'Parkhaus', 'Closed')
+            parking_dataset.build_dataset(parking_data)  # Arrays and spatial index built once here, reused by every request
+            return parking_data
+        else:
+            raise FetchError("No data available from the API.")
+    else:
+        raise FetchError(f'Failed to retrieve data: HTTP Status Code {response.status_code}')
+
+
+#Every download is also appended to the occupancy history (occupancy_history.py), unless PARKGALLEN_HISTORY_DIR is empty
+
+def parking_data_poller():
+    history = occupancy_history.get_history() if occupancy_history.HISTORY_DIR else None
+    listeners = [history] if history is not None else []
+    listeners.append(occupancy_forecast.get_forecaster(history))  # reads the history at the first download, then learns from every one
+    return occupancy_poller.get_poller("freie-parkplatze-in-der-stadt-stgallen-pls", load_parking_data, PARKING_DATA_INTERVAL, listeners)
+
+
+def cached_parking_data():
+    """Parking data of the last successful download, raises FetchError if there never was one."""
+    poller = parking_data_poller()
+    snapshot = poller.current()
+    if snapshot is None:
+        error = poller.last_error
+        raise error if isinstance(error, FetchError) else FetchError(f"Failed to retrieve data: {error or 'no answer yet'}")
+    return snapshot.data
+
+
+# Call of the second API (all the Parkings)   
+
+ADDITIONAL_DATA_URL = f"{OPENDATA_URL}/api/explore/v2.1/catalog/datasets/points-of-interest-/records?refine=kategorie%3A%22Parkpl%C3%A4tze%2C%20Parkh%C3%A4user%22"
+ADDITIONAL_DATA_PAGE_SIZE = 100
+ADDITIONAL_DATA_WORKERS = 4  # pages downloaded at the same time (the API has a rate limit)
+
+
+def additional_page_params(offset):
+    return {
+        "refine": 'kategorie:"Parkplätze, Parkhäuser"',
+        "limit": ADDITIONAL_DATA_PAGE_SIZE,
+        "offset": offset
+    }
+
+
+def fetch_additional_page(offset):
+    """Download one page of the second API, returns the JSON answer or None (safe_request already retried)."""
+    response = safe_request(ADDITIONAL_DATA_URL, additional_page_params(offset))
+    if response and response.status_code == 200:
+        return response.json()
+    return None
+
+
+def parse_additional_records(results):
+    parking_data = []
+    for item in results:
+        geo_point = item.get('geo_point_2d', {})
+        parking_data.append({
+            'latitude': geo_point.get('lat', 0),  # Default to 0 if no latitude
+            'longitude': geo_point.get('lon', 0),  # Default to 0 if no longitude
+            'name': item.get('name', 'No Name Provided'),
+            'description': item.get('description', 'No Description Provided'),
+            'address': item.get('adresse', 'No Address Provided'),
+            'info': item.get('informatio', 'No Information Provided')  # Additional info
+        })
+    return parking_data
+
+
+def load_additional_data(concurrent=True):
+    """
+    Download all the pages of the second API.
+    The first page tells the total_count; with concurrent=True the other pages are then downloaded
+    in parallel and put back in order, otherwise (or if total_count is missing) one after the other.
+    """
+    first_page = fetch_additional_page(0)
+    if first_page is None:
+        raise FetchError("Failed to fetch additional data after multiple attempts.", pd.DataFrame())
+    parking_data = parse_additional_records(first_page.get('results', []))
+
+    total_count = first_page.get('total_count')
+    if concurrent and total_count is not None:
+        offsets = range(ADDITIONAL_DATA_PAGE_SIZE, total_count, ADDITIONAL_DATA_PAGE_SIZE)
+        with ThreadPoolExecutor(max_workers=ADDITIONAL_DATA_WORKERS) as executor:
+            pages = list(executor.map(fetch_additional_page, offsets))  # map keeps the order of the offsets
+        for page in pages:
+            if page is None:
+                raise FetchError("Failed to fetch additional data after multiple attempts.", pd.DataFrame(parking_data))
+            parking_data.extend(parse_additional_records(page.get('results', [])))
+    elif first_page.get('results'):
+        offset = ADDITIONAL_DATA_PAGE_SIZE
+        while True:
+            page = fetch_additional_page(offset)
+            if page is None:
+                raise FetchError("Failed to fetch additional data after multiple attempts.", pd.DataFrame(parking_data))
+            results = page.get('results', [])
+            if not results:
+                break
+            parking_data.extend(parse_additional_records(results))
+            offset += ADDITIONAL_DATA_PAGE_SIZE
+
+    parking_data = pd.DataFrame(parking_data)  # Assicurati di restituire sempre un DataFrame
+    poi_categories.build_category_index(parking_data)  # Blue/white/handicapped decided once here, not at every render
+    spatial_index.build_index(parking_data)  # Built once here, reused by every radius query
+    return parking_data
+
+
+def cached_additional_data():
+    """Points of interest from the process-wide cache, raises FetchError."""
+    cache = ttl_cache.get_cache("points-of-interest-", ADDITIONAL_DATA_TTL, error_ttl=ADDITIONAL_DATA_RETRY)
+    return cache.get("parking", load_additional_data)
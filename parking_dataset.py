@@ -0,0 +1,158 @@
+import sys
+import weakref
+
+import numpy as np
+import pandas as pd
+
+import distances
+import frame_registry
+import spatial_index
+
+# Array form of the Parkhaus data, built once per download and shared read-only by every request.
+#
+# The loader still returns a DataFrame (the app and api.py display its rows), but the per-request
+# work (radius, free spaces, category, ranking, popups) runs on a ParkingDataset: contiguous
+# float64 coordinates, int32 free spaces and capacities (-1 when missing), interned names and
+# states and int8 category codes, all with writeable=False. The nested 'standort' dict is read
+# once here and never again.
+# A query returns a DatasetView: the row positions and distances of the rows found, not a copy of
+# them. Filtering a view gives another view, a DataFrame is only made (frame(), row()) for what
+# is finally displayed, so a session keeps a few integers per garage instead of its own copy.
+
+CATEGORIES = ('Parkhaus', 'Closed')
+OPEN_STATE = 'offen'
+MISSING = -1  # free spaces or capacity unknown
+
+
+def _frozen(array):
+    array = np.ascontiguousarray(array)
+    array.flags.writeable = False
+    return array
+
+
+def _interned(values):
+    """Object array of the values, strings interned (every dataset shares one copy of 'offen', of each name...)."""
+    return _frozen(np.array([sys.intern(value) if isinstance(value, str) else value for value in values], dtype=object))
+
+
+def _counts(data, column):
+    if column not in data.columns:
+        return _frozen(np.full(len(data), MISSING, dtype=np.int32))
+    numbers = pd.to_numeric(data[column], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    return _frozen(np.where(np.isnan(numbers), MISSING, numbers).astype(np.int32))
+
+
+def as_float(counts):
+    """int32 counts of a dataset as floats, NaN where missing."""
+    return np.where(counts == MISSING, np.nan, counts.astype(float))
+
+
+class ParkingDataset:
+    __slots__ = ("_data", "index", "latitudes", "longitudes", "names", "states", "category_codes", "free", "total", "expected_free", "__weakref__")
+
+    def __init__(self, data):
+        def column(name):
+            return data[name].to_numpy() if name in data.columns else np.full(len(data), None, dtype=object)
+
+        self._data = weakref.ref(data)  # not a strong reference, the registry below must not keep the DataFrame alive
+        latitudes, longitudes = distances.coordinate_arrays(data)
+        self.latitudes = _frozen(latitudes.astype(np.float64))
+        self.longitudes = _frozen(longitudes.astype(np.float64))
+        self.index = spatial_index.register_index(data, spatial_index.GridIndex(self.latitudes, self.longitudes))
+        self.names = _interned(column('phname'))
+        self.states = _interned(column('phstate'))
+        if 'category' in data.columns:
+            categories = data['category'].to_numpy()
+        else:
+            categories = np.where(self.states == OPEN_STATE, CATEGORIES[0], CATEGORIES[1])
+        self.category_codes = _frozen(np.select([categories == category for category in CATEGORIES], np.arange(len(CATEGORIES)), -1).astype(np.int8))
+        self.free = _counts(data, 'shortfree')
+        self.total = _counts(data, 'shortmax')
+        self.expected_free = _counts(data, 'expected_free') if 'expected_free' in data.columns else None
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    @property
+    def data(self):
+        """The DataFrame the dataset was built from (None once it is gone)."""
+        return self._data()
+
+    def category_mask(self, category):
+        return self.category_codes == CATEGORIES.index(category)
+
+    def free_mask(self):
+        """Garages with free spaces, the forecast ones for the arrival time if the data has them."""
+        free = self.expected_free if self.expected_free is not None else self.free
+        return free > 0
+
+    def all(self, mask=None):
+        positions = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        return DatasetView(self, positions, np.full(len(positions), np.nan))
+
+    def within(self, point, radius, mask=None):
+        """View of the rows within radius metres of point (longitude, latitude), in row order."""
+        return DatasetView(self, *self.index.query_radius(point, radius, mask))
+
+    def nearest(self, point, k=1, mask=None):
+        """View of the k rows nearest to point, nearest first."""
+        return DatasetView(self, *self.index.query_nearest(point, k, mask))
+
+
+class DatasetView:
+    __slots__ = ("dataset", "positions", "distances")
+
+    # DataFrame column -> array of the dataset
+    COLUMNS = {'latitude': 'latitudes', 'longitude': 'longitudes', 'phname': 'names', 'phstate': 'states',
+               'shortfree': 'free', 'shortmax': 'total', 'expected_free': 'expected_free'}
+
+    def __init__(self, dataset, positions, distances):
+        self.dataset = dataset
+        self.positions = positions  # row positions in dataset (and in dataset.data)
+        self.distances = distances  # metres to the query point, NaN without one
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def empty(self):
+        return len(self.positions) == 0
+
+    def where(self, mask):
+        """The rows of the view for which mask (over all the rows of the dataset) is true."""
+        keep = np.asarray(mask, dtype=bool)[self.positions]
+        return DatasetView(self.dataset, self.positions[keep], self.distances[keep])
+
+    def column(self, name):
+        """Values of a column for the rows of the view (only these rows are copied)."""
+        if name == 'distance_to_destination':
+            return self.distances
+        values = getattr(self.dataset, self.COLUMNS[name])
+        return None if values is None else values[self.positions]
+
+    def frame(self):
+        """The rows as a DataFrame with their 'distance_to_destination', for display."""
+        return self.dataset.data.iloc[self.positions].assign(distance_to_destination=self.distances)
+
+    def row(self, i):
+        """Row i of the view as a Series, with its 'distance_to_destination'."""
+        row = self.dataset.data.iloc[int(self.positions[i])].copy()
+        row['distance_to_destination'] = self.distances[i]
+        return row
+
+
+# One dataset per loaded DataFrame
+_datasets = frame_registry.FrameRegistry()
+
+
+def build_dataset(data):
+    """Build the dataset (and the spatial index) of a DataFrame and remember it for dataset_for."""
+    return _datasets.put(data, ParkingDataset(data))
+
+
+def dataset_for(data, build=True):
+    """The dataset built for this exact DataFrame, built now if there is none (None if build is False)."""
+    dataset = _datasets.get(data)
+    if dataset is None and build:
+        dataset = build_dataset(data)
+    return dataset
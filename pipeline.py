@@ -0,0 +1,63 @@
+import time
+
+# Staged pipeline for the Streamlit script, which is run again from the top at every
+# widget interaction. Every stage remembers, in a mapping that survives the reruns
+# (st.session_state), the inputs it was last run with and its output: when the inputs
+# are the same the output is reused, so moving the radius slider does not parse the
+# dates or geocode the addresses again.
+# The duration of every stage of the last run is kept in self.timings.
+
+
+def same_inputs(a, b):
+    """Inputs are equal: DataFrames and other objects without a plain == must be the same object."""
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if x is y:
+            continue
+        try:
+            if not bool(x == y):
+                return False
+        except (ValueError, TypeError):
+            return False
+    return True
+
+
+class Pipeline:
+    def __init__(self, state, name="pipeline"):
+        if name not in state:
+            state[name] = {}
+        self.memo = state[name]
+        self.timings = {}  # stage name -> (seconds, reused) for this run
+
+    def run(self, stage, inputs, function, *args, keep=None, **kwargs):
+        """
+        Output of function(*args, **kwargs), reused while inputs (a tuple) stay the same.
+        Only outputs for which keep(output) is true are kept (default: not None), so a failed
+        stage runs again and shows its error message again.
+        """
+        start = time.perf_counter()
+        entry = self.memo.get(stage)
+        if entry is not None and same_inputs(entry[0], inputs):
+            self.timings[stage] = (time.perf_counter() - start, True)
+            return entry[1]
+        output = function(*args, **kwargs)
+        if (keep(output) if keep is not None else output is not None):
+            self.memo[stage] = (inputs, output)
+        else:
+            self.memo.pop(stage, None)
+        self.timings[stage] = (time.perf_counter() - start, False)
+        return output
+
+    def always(self, stage, function, *args, **kwargs):
+        """Stage that runs at every rerun (e.g. the fetches, which have their own cache), only timed."""
+        start = time.perf_counter()
+        output = function(*args, **kwargs)
+        self.timings[stage] = (time.perf_counter() - start, False)
+        return output
+
+    def timing_rows(self):
+        return [
+            {'stage': stage, 'ms': round(seconds * 1000, 2), 'reused': reused}
+            for stage, (seconds, reused) in self.timings.items()
+        ]
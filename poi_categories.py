@@ -0,0 +1,73 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+import frame_registry
+
+# Classification of the parking spaces of the second API (points of interest) into the
+# categories shown on the map, done once when the dataset loads.
+# The loader stores a categorical 'poi_category' column and, next to the DataFrame, one
+# boolean mask and one sorted index array per category, so filtering by checkbox is a
+# boolean mask and counting is len().
+
+# Categories recognised by words in the 'info' column (a row can match more than one)
+POI_CATEGORIES = {
+    "blue": ("erweiterte blaue zone",),
+    "white": ("weiss (bewirtschaftet)", "weisse zone"),
+    "handicapped": ("invalidenparkplatz",),
+}
+OTHER = "other"
+
+
+def classify_poi_info(data):
+    """Boolean mask per POI category, the 'info' column is lowercased and searched only once."""
+    if 'info' not in data.columns:
+        return {category: np.zeros(len(data), dtype=bool) for category in POI_CATEGORIES}
+    info = data['info'].fillna('').astype(str).str.lower()
+    return {
+        category: info.str.contains("|".join(re.escape(word) for word in words), regex=True).to_numpy()
+        for category, words in POI_CATEGORIES.items()
+    }
+
+
+class CategoryIndex:
+    __slots__ = ("masks", "positions")
+
+    def __init__(self, masks):
+        self.masks = masks
+        self.positions = {category: np.flatnonzero(mask) for category, mask in masks.items()}
+
+    def select(self, category, positions=None):
+        """Row positions of the category, restricted to positions (e.g. the result of a radius query) if given."""
+        if positions is None:
+            return self.positions[category]
+        return positions[self.masks[category][positions]]
+
+    def count(self, category, positions=None):
+        return len(self.select(category, positions))
+
+
+def category_column(masks, size):
+    """One categorical label per row (the first matching category, else 'other')."""
+    labels = np.full(size, OTHER, dtype=object)
+    for category in reversed(list(POI_CATEGORIES)):
+        labels[masks[category]] = category
+    return pd.Categorical(labels, categories=list(POI_CATEGORIES) + [OTHER])
+
+
+# One CategoryIndex per loaded DataFrame
+_indexes = frame_registry.FrameRegistry()
+
+
+def build_category_index(data):
+    """Classify every row of data, add the 'poi_category' column and remember the masks for category_index_for."""
+    masks = classify_poi_info(data)
+    data['poi_category'] = category_column(masks, len(data))
+    return _indexes.put(data, CategoryIndex(masks))
+
+
+def category_index_for(data):
+    """The CategoryIndex built when data was loaded, or one computed now for frames that were not."""
+    index = _indexes.get(data)
+    return index if index is not None else CategoryIndex(classify_poi_info(data))
@@ -1,460 +1,192 @@
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import lru_cache
 import math
+import os
+import threading
+import numpy as np
+from tariffs import Band, Tier, Tariff, quote
+import batch_fees
+from garage_registry import GarageRegistry, GarageMiss
 
 #This file is used to explain the prices calculation as every single parkhaus is different 
+#Every parkhaus is described by its tariff (data only), the calculation itself is done in tariffs.py
+#To add a parkhaus, add its Tariff to TARIFFS
 
-def calculate_parking_fees(parking_name, arrival_datetime, rounded_total_hours):
-    if parking_name == "Manor":
-        return calculate_fee_manor(arrival_datetime, rounded_total_hours)
-    elif parking_name == "Bahnhof":
-        return calculate_fee_bahnhof(arrival_datetime, rounded_total_hours)
-    elif parking_name == "Brühltor":
-        return calculate_fee_brühltor(arrival_datetime, rounded_total_hours)
-    elif parking_name == "Burggraben":
-        return calculate_fee_burggraben(arrival_datetime, rounded_total_hours)
-    elif parking_name == "Stadtpark AZSG":
-        return calculate_fee_stadtpark_azsg(arrival_datetime, rounded_total_hours)
-    elif parking_name == "Neumarkt":
-        return calculate_fee_neumarkt(arrival_datetime, rounded_total_hours)
-    elif parking_name == "Rathaus":
-        return calculate_fee_rathaus(arrival_datetime, rounded_total_hours)
-    elif parking_name == "Kreuzbleiche":
-        return calculate_fee_kreuzbleiche(arrival_datetime, rounded_total_hours)
-    elif parking_name == "Oberer Graben":
-        return calculate_fee_oberer_graben(arrival_datetime, rounded_total_hours)
-    elif parking_name == "Raiffeisen":
-        return calculate_fee_raiffeisen(arrival_datetime, rounded_total_hours)
-    elif parking_name == "Einstein":
-        return calculate_fee_einstein(arrival_datetime, rounded_total_hours)
-    elif parking_name == "Spisertor":
-        return calculate_fee_spisertor(arrival_datetime, rounded_total_hours)
-    elif parking_name == "Spelterini":
-        return calculate_fee_spelterini(arrival_datetime, rounded_total_hours)
-    elif parking_name == "OLMA Messe":
-        return calculate_fee_olma_messe(arrival_datetime, rounded_total_hours)
-    elif parking_name == "Unterer Graben":
-        return calculate_fee_unterer_graben(arrival_datetime, rounded_total_hours)
-    elif parking_name == "OLMA Parkplatz":
-        return calculate_fee_olma_parkplatz(arrival_datetime, rounded_total_hours)
-    else:
-        return "Parking name not recognized. Please check the parking name."
 
-    
-#Calculation for every single parking space
-#standard identification--> def "name parking"(arrival_datetime, duration_hours)
+DAY = "day"
+NIGHT = "night"
 
 
+def day_night_bands(day_start, day_end, day_rate, night_rate):
+    """Bands for the usual tariff with one day rate between day_start and day_end and one night rate around it."""
+    bands = []
+    if day_start > 0:
+        bands.append(Band(0, day_start, night_rate, NIGHT))
+    bands.append(Band(day_start, day_end, day_rate, DAY))
+    if day_end < 24:
+        bands.append(Band(day_end, 24, night_rate, NIGHT))
+    return tuple(bands)
 
 
-def calculate_fee_bahnhof(arrival_datetime, rounded_total_hours):
-    daytime_rate_first_hour = 2.40
-    day_subsequent_rate = 1.20
-    nighttime_rate_first_hour = 1.20
-    night_subsequent_rate = 0.60
-
-    total_fee = 0.0
-    current_time = arrival_datetime
-    remaining_hours = rounded_total_hours
-
-    while remaining_hours > 0:
-        current_hour = current_time.hour + current_time.minute / 60
-
-        if 6 <= current_hour < 22:
-            if total_fee == 0:  # First hour
-                total_fee += daytime_rate_first_hour
-                remaining_hours -= 1
-            else:
-                total_fee += day_subsequent_rate
-                remaining_hours -= 0.5
-        else:
-            if total_fee == 0:  # First hour
-                total_fee += nighttime_rate_first_hour
-                remaining_hours -= 1
-            else:
-                total_fee += night_subsequent_rate
-                remaining_hours -= 0.5
-
-        current_time += timedelta(minutes=30)
-
-    return f"at Bahnhof: {total_fee:.2f} CHF"
-
-
-
-def calculate_fee_brühltor(arrival_datetime, rounded_total_hours):
-    daytime_rate_first_hour = 2.00
-    day_subsequent_rate = 1.00
-    nighttime_rate_first_hour = 1.20
-    night_subsequent_rate = 0.60
-
-    total_fee = 0.0
-    current_time = arrival_datetime
-    remaining_hours = rounded_total_hours
-
-    while remaining_hours > 0:
-        current_hour = current_time.hour + current_time.minute / 60
-
-        if 7 <= current_hour < 24:
-            if total_fee == 0:  # First hour
-                total_fee += daytime_rate_first_hour
-                remaining_hours -= 1
-            else:
-                total_fee += day_subsequent_rate
-                remaining_hours -= 0.5
-        else:
-            if total_fee == 0:  # First hour
-                total_fee += nighttime_rate_first_hour
-                remaining_hours -= 1
-            else:
-                total_fee += night_subsequent_rate
-                remaining_hours -= 0.5
-
-        current_time += timedelta(minutes=30)
-
-    return f" at Brühltor: {(total_fee):.2f} CHF"
-
-
-
-def calculate_fee_burggraben(arrival_datetime, rounded_total_hours):
-    daytime_rate_first_hour = 2.00
-    day_subsequent_rate = 1.00
-    nighttime_rate_first_hour = 1.20
-    night_subsequent_rate = 0.60
-
-    total_fee = 0.0
-    current_time = arrival_datetime
-    remaining_hours = rounded_total_hours
-
-    while remaining_hours > 0:
-        current_hour = current_time.hour + current_time.minute / 60
-
-        if 6 <= current_hour < 22:
-            if total_fee == 0:  # First hour
-                total_fee += daytime_rate_first_hour
-                remaining_hours -= 1
-            else:
-                total_fee += day_subsequent_rate
-                remaining_hours -= 0.5
-        else:
-            if total_fee == 0:  # First hour
-                total_fee += nighttime_rate_first_hour
-                remaining_hours -= 1
-            else:
-                total_fee += night_subsequent_rate
-                remaining_hours -= 0.5
-
-        current_time += timedelta(minutes=30)
-    return f" at Burggraben: {(total_fee):.2f} CHF"
-
-def calculate_fee_stadtpark_azsg(arrival_datetime, rounded_total_hours):
-    daytime_rate_first_hour = 1.60
-    day_subsequent_rate = 0.80
-    nighttime_rate_first_hour = 0.80
-    night_subsequent_rate = 0.40
-
-    total_fee = 0.0
-    current_time = arrival_datetime
-    remaining_hours = rounded_total_hours
-
-    while remaining_hours > 0:
-        current_hour = current_time.hour + current_time.minute / 60
-
-        if 6 <= current_hour < 22:
-            if total_fee == 0:  # First hour
-                total_fee += daytime_rate_first_hour
-                remaining_hours -= 1
-            else:
-                total_fee += day_subsequent_rate
-                remaining_hours -= 0.5
-        else:
-            if total_fee == 0:  # First hour
-                total_fee += nighttime_rate_first_hour
-                remaining_hours -= 1
-            else:
-                total_fee += night_subsequent_rate
-                remaining_hours -= 0.5
-
-        current_time += timedelta(minutes=30)
-
-    return f"at Stadtpark AZSG: {total_fee:.2f} CHF"
-
-def calculate_fee_neumarkt(arrival_datetime, rounded_total_hours):
-    day_rate = 3.0  # CHF per hour during the day (7 AM to 10 PM)
-    night_rate = 2.0  # CHF per hour during the night (10 PM to 7 AM)
-    daytime_hours = (7, 22)  # From 7 AM to 10 PM
-
-    total_fee = 0.0
-    current_time = arrival_datetime
-    hours_left = rounded_total_hours
-
-    while hours_left > 0:
-        current_hour = current_time.hour + current_time.minute / 60
-
-        if daytime_hours[0] <= current_hour < daytime_hours[1]:
-            # Calculate daytime fee
-            if hours_left + current_hour > daytime_hours[1]:
-                hours_to_charge = daytime_hours[1] - current_hour
-            else:
-                hours_to_charge = hours_left
-            total_fee += hours_to_charge * day_rate
-            hours_left -= hours_to_charge
-            current_time = current_time.replace(hour=int((current_time.hour + hours_to_charge) % 24))
-        else:
-            # Calculate nighttime fee
-            if current_hour >= daytime_hours[1]:
-                hours_to_charge = min(hours_left, 24 - current_hour)
-            else:
-                hours_to_charge = min(hours_left, daytime_hours[0] - current_hour)
-            total_fee += hours_to_charge * night_rate
-            hours_left -= hours_to_charge
-            current_time = current_time.replace(hour=int((current_time.hour + hours_to_charge) % 24))
-
-    return f" at Neumarkt: {total_fee:.2f} CHF"
-
-
-def calculate_fee_rathaus(arrival_datetime, rounded_total_hours):
-    daytime_hours = (7, 22)  # From 7 AM to 10 PM
-    night_rate = 1.2  # CHF per hour at night
-    day_rate = 2.4  # CHF per hour during the day
-
-    total_fee = 0.0
-    current_time = arrival_datetime.hour + arrival_datetime.minute / 60
-    hours_left = rounded_total_hours
-
-    while hours_left > 0:
-        if daytime_hours[0] <= current_time < daytime_hours[1]:
-            # Calculate daytime fee
-            day_hours_left = min(daytime_hours[1] - current_time, hours_left)
-            total_fee += math.ceil(day_hours_left) * day_rate  # Apply day rate and round up
-            hours_left -= day_hours_left
-            current_time += day_hours_left
-        else:
-            # Calculate nighttime fee
-            if current_time >= daytime_hours[1]:
-                night_hours_left = 24 - current_time
-            else:
-                night_hours_left = daytime_hours[0] - current_time
-
-            night_hours_left = min(night_hours_left, hours_left)
-            total_fee += math.ceil(night_hours_left) * night_rate  # Apply night rate and round up
-            hours_left -= night_hours_left
-            current_time += night_hours_left
-
-        current_time %= 24  # Reset time after midnight
-
-    return f" at Rathaus: {total_fee:.2f} CHF"
-
-def calculate_fee_kreuzbleiche(arrival_datetime, rounded_total_hours):
-    daytime_hours = (6, 23)  # Daytime from 6 AM to 11 PM
-    night_rate = 1.0  # CHF per hour during the night
-    day_rate = 1.5  # CHF per hour during the day
-
-    total_fee = 0.0
-    current_time = arrival_datetime.hour + arrival_datetime.minute / 60
-    hours_left = rounded_total_hours
-
-    while hours_left > 0:
-        if daytime_hours[0] <= current_time < daytime_hours[1]:
-            # Calculate daytime fee
-            day_hours_left = min(daytime_hours[1] - current_time, hours_left)
-            total_fee += day_hours_left * day_rate
-            hours_left -= day_hours_left
-            current_time += day_hours_left
-        else:
-            # Calculate nighttime fee
-            if current_time >= daytime_hours[1]:
-                night_hours_left = 24 - current_time
-            else:
-                night_hours_left = daytime_hours[0] - current_time
-
-            night_hours_left = min(night_hours_left, hours_left)
-            total_fee += night_hours_left * night_rate
-            hours_left -= night_hours_left
-            current_time += night_hours_left
-
-        current_time %= 24  # Reset time after midnight
-
-    # Round the total fee to the nearest whole number
-    total_fee = (total_fee)
-
-    return f"at Kreuzbleiche: {total_fee:.2f} CHF"
-
-
-def calculate_fee_manor(arrival_datetime, rounded_total_hours):
-    initial_rate = 2.0  # CHF for less than 1 hour
-    mid_rate = 3.0  # CHF per hour for 1 to 3 hours
-    long_term_rate = 4.5  # CHF per hour for more than 3 hours
-
-    # Initialize the total fee
-    total_fee = 0.0
-
-    # Apply the rate based on the rounded_total_hours
-    if rounded_total_hours <= 1:
-        total_fee = initial_rate  # Apply initial rate if parking duration is less than 1 hour
-    elif rounded_total_hours <= 3:
-        total_fee = mid_rate * rounded_total_hours  # Apply mid rate if parking duration is between 1 and 3 hours
-    else:
-        total_fee = long_term_rate * rounded_total_hours  # Apply long term rate if parking duration is more than 3 hours
-
-    return f" at Manor: {total_fee:.2f} CHF"
-
-
-def calculate_fee_oberer_graben(arrival_datetime, rounded_total_hours):
-    daytime_hours = (6, 23)  # Daytime from 6 AM to 11 PM
-    night_rate = 1.5  # CHF per hour during the night
-    day_rate = 2.0  # CHF per hour during the day
-
-    total_fee = 0.0
-    current_time = arrival_datetime.hour + arrival_datetime.minute / 60
-    hours_left = rounded_total_hours
-
-    while hours_left > 0:
-        if daytime_hours[0] <= current_time < daytime_hours[1]:
-            # Calculate daytime fee
-            day_hours_left = min(daytime_hours[1] - current_time, hours_left)
-            total_fee += day_hours_left * day_rate
-            hours_left -= day_hours_left
-            current_time += day_hours_left
-        else:
-            # Calculate nighttime fee
-            if current_time >= daytime_hours[1]:
-                night_hours_left = 24 - current_time
-            else:
-                night_hours_left = daytime_hours[0] - current_time
-
-            night_hours_left = min(night_hours_left, hours_left)
-            total_fee += night_hours_left * night_rate
-            hours_left -= night_hours_left
-            current_time += night_hours_left
-
-        current_time %= 24  # Reset time after midnight
-
-    # Round the total fee to the nearest whole number
-    total_fee = math.ceil(total_fee)
-
-    return f" at Oberer Graben: {total_fee:.2f} CHF"
-    
-def calculate_fee_raiffeisen(arrival_datetime, rounded_total_hours):
-    initial_rate = 2.0  # CHF per hour for the first 3 hours
-    mid_rate = 1.5  # CHF per hour from 3 to 13 hours
-    long_term_rate = 1.0  # CHF per hour beyond 13 hours
-    first_rate_hours = 3  # Duration for the initial rate
-    mid_rate_limit = 13  # Upper limit for the mid rate
-
-    total_fee = 0.0
-
-    # Apply the rate based on the rounded_total_hours
-    if rounded_total_hours <= first_rate_hours:
-        total_fee = rounded_total_hours * initial_rate
-    elif rounded_total_hours <= mid_rate_limit:
-        total_fee = rounded_total_hours * mid_rate
-    else:
-        total_fee = rounded_total_hours * long_term_rate
-
-    return f" at Raiffeisen: {total_fee:.2f} CHF"
-
-
-def calculate_fee_einstein(arrival_datetime, rounded_total_hours):
-    flat_rate = 2.5  # CHF per hour regardless of duration
-
-    total_fee = flat_rate * rounded_total_hours  # Total fee is simply the hourly rate multiplied by hours parked
+TARIFFS = {
+    # First hour, then every started 30 minutes at the rate of the time of day
+    "Bahnhof": Tariff("Bahnhof", bands=day_night_bands(6, 22, 2.40, 1.20), slot_hours=0.5, first_hour=True),
+    "Brühltor": Tariff("Brühltor", bands=day_night_bands(7, 24, 2.00, 1.20), slot_hours=0.5, first_hour=True),
+    "Burggraben": Tariff("Burggraben", bands=day_night_bands(6, 22, 2.00, 1.20), slot_hours=0.5, first_hour=True),
+    "Stadtpark AZSG": Tariff("Stadtpark AZSG", bands=day_night_bands(6, 22, 1.60, 0.80), slot_hours=0.5, first_hour=True),
+
+    # Rate per hour depending on the time of day, charged pro rata
+    "Neumarkt": Tariff("Neumarkt", bands=day_night_bands(7, 22, 3.0, 2.0)),
+    "Kreuzbleiche": Tariff("Kreuzbleiche", bands=day_night_bands(6, 23, 1.5, 1.0)),
+    "Spelterini": Tariff("Spelterini", bands=day_night_bands(7, 24, 2.0, 1.5)),
+    "Oberer Graben": Tariff("Oberer Graben", bands=day_night_bands(6, 23, 2.0, 1.5), round_total=1.0),  # total rounded up to whole CHF
+    "Rathaus": Tariff("Rathaus", bands=day_night_bands(7, 22, 2.4, 1.2), segment_rounding=1.0),  # every started hour of a band is paid
+
+    # Every started hour at the rate of the time of day
+    "OLMA Parkplatz": Tariff("OLMA Parkplatz", bands=day_night_bands(6, 23, 2.0, 1.5), slot_hours=1.0),
+
+    # Price depending only on the duration
+    "Manor": Tariff("Manor", tiers=(Tier(1, 0.0, flat=2.0), Tier(3, 3.0), Tier(math.inf, 4.5))),
+    "Raiffeisen": Tariff("Raiffeisen", tiers=(Tier(3, 2.0), Tier(13, 1.5), Tier(math.inf, 1.0))),
+    "OLMA Messe": Tariff("OLMA Messe", tiers=(Tier(3, 2.0), Tier(math.inf, 1.5)), tiers_marginal=True),  # 2 CHF for the first 3 hours, then 1.5
+    "Einstein": Tariff("Einstein", tiers=(Tier(math.inf, 2.5),)),
+    "Unterer Graben": Tariff("Unterer Graben", tiers=(Tier(math.inf, 2.0),)),
+    "Spisertor": Tariff("Spisertor", tiers=(Tier(math.inf, 2.5),), daily_cap=30.0),  # at most 30 CHF per 24 hours
+}
+
+
+#Other names used for the same parkhaus (case, umlauts and words like "Parkhaus" are already ignored)
+ALIASES = {
+    "Stadtpark": "Stadtpark AZSG",
+    "AZSG": "Stadtpark AZSG",
+    "Hauptbahnhof": "Bahnhof",
+    "Olma Halle": "OLMA Messe",
+}
 
-    return f" at Einstein: {total_fee:.2f} CHF"
+#Built once at import: maps the phname of the API to its tariff (see garage_registry.py)
+REGISTRY = GarageRegistry(TARIFFS, ALIASES)
 
-def calculate_fee_spisertor(arrival_datetime, rounded_total_hours):
-    flat_rate = 2.5  # CHF per hour
-    max_daily_rate = 30  # CHF per day
 
-    # Calculate the total number of complete 24-hour periods
-    complete_days = rounded_total_hours // 24
-    remaining_hours = rounded_total_hours % 24
+def find_tariff(parking_name):
+    """Tariff of the parkhaus, or None (the miss is counted in REGISTRY.misses)."""
+    tariff = REGISTRY.resolve(parking_name)
+    return None if isinstance(tariff, GarageMiss) else tariff
 
-    # Calculate the fee for the complete 24-hour periods
-    total_fee = complete_days * max_daily_rate
 
-    # Calculate the fee for the remaining hours
-    remaining_fee = min(flat_rate * remaining_hours, max_daily_rate)
-    total_fee += remaining_fee
+#Returns a FeeResult (amount, currency, garage and the tariff bands applied), or None if the parkhaus is not known
+#The results are memoised (see cached_quote), popular stays like "arrive 09:00, stay 2h" are not recomputed
+
+def calculate_parking_fees(parking_name, arrival_datetime, rounded_total_hours):
+    tariff = find_tariff(parking_name)
+    if tariff is None:
+        return None
+    return cached_quote(tariff.garage, arrival_slot(tariff, arrival_datetime), float(rounded_total_hours))
+
+
+#Memo of the fees, keyed by (parkhaus, arrival slot, rounded_total_hours)
+#The arrival slot is the minute of the day, or 0 for the tariffs that only depend on the duration.
+#No tariff depends on the weekday (Tariff has no weekday field), so the weekday is not part of the key.
+
+FEE_CACHE_SIZE = 65536  # enough for the precomputed table below
+COMMON_DURATIONS = [hours / 2 for hours in range(1, 49)]  # 0.5 h to 24 h
+ARRIVAL_STEP = 15  # minutes between the precomputed arrival slots, times are mostly typed to the quarter hour
+PRECOMPUTE_FEES = os.environ.get("PARKGALLEN_PRECOMPUTE_FEES", "") not in ("", "0", "false", "no")
 
-    return f" at Spisertor: {total_fee:.2f} CHF"
 
-def calculate_fee_spelterini(arrival_datetime, rounded_total_hours):
-    daytime_hours = (7, 24)  # Daytime from 6 AM to 11 PM
-    night_rate = 1.5  # CHF per hour during the night
-    day_rate = 2.0  # CHF per hour during the day
+def arrival_slot(tariff, arrival_datetime):
+    if not tariff.bands:
+        return 0
+    return arrival_datetime.hour * 60 + arrival_datetime.minute
 
-    total_fee = 0.0
-    current_time = arrival_datetime.hour + arrival_datetime.minute / 60
-    hours_left = rounded_total_hours
 
-    while hours_left > 0:
-        if daytime_hours[0] <= current_time < daytime_hours[1]:
-            # Calculate daytime fee
-            day_hours_left = min(daytime_hours[1] - current_time, hours_left)
-            total_fee += day_hours_left * day_rate
-            hours_left -= day_hours_left
-            current_time += day_hours_left
-        else:
-            # Calculate nighttime fee
-            if current_time >= daytime_hours[1]:
-                night_hours_left = 24 - current_time
-            else:
-                night_hours_left = daytime_hours[0] - current_time
+@lru_cache(maxsize=FEE_CACHE_SIZE)
+def cached_quote(parking_name, arrival_minute, rounded_total_hours):
+    arrival_datetime = datetime(2000, 1, 1, arrival_minute // 60, arrival_minute % 60)
+    return quote(TARIFFS[parking_name], arrival_datetime, rounded_total_hours)
 
-            night_hours_left = min(night_hours_left, hours_left)
-            total_fee += night_hours_left * night_rate
-            hours_left -= night_hours_left
-            current_time += night_hours_left
 
-        current_time %= 24  # Reset time after midnight
+def precompute_fees(durations=COMMON_DURATIONS, parking_names=None, step=ARRIVAL_STEP):
+    """Fill the memo for every parkhaus x arrival slot (every step minutes) x durations, with the keys of calculate_parking_fees."""
+    for parking_name in (parking_names or TARIFFS):
+        tariff = TARIFFS[parking_name]
+        slots = range(0, 24 * 60, step) if tariff.bands else [0]
+        for arrival_minute in slots:
+            for hours in durations:
+                cached_quote(parking_name, arrival_minute, float(hours))
 
-    # Round the total fee to the nearest whole number
-    total_fee = (total_fee)
-    return f" at Spelterini: {total_fee:.2f} CHF"
 
+_precompute_thread = None
+_precompute_lock = threading.Lock()
 
-def calculate_fee_olma_messe(arrival_datetime, rounded_total_hours):
-    total_fee = 0
-    current_hour = arrival_datetime.hour + arrival_datetime.minute / 60
-    base_hours = 3
-    base_rate = 2
-    incremental_rate = 1.5
-    rate_interval = 1  # Rate changes every hour after the first three hours
 
-    if rounded_total_hours <= base_hours:
-        total_fee = base_rate * rounded_total_hours
-    else:
-        total_fee = base_rate * base_hours
-        additional_hours = rounded_total_hours - base_hours
-        while additional_hours > 0:
-            hours_to_charge = min(additional_hours, rate_interval)
-            total_fee += incremental_rate * hours_to_charge
-            additional_hours -= hours_to_charge
+def start_precompute():
+    """Run precompute_fees once per process in a background thread (under a second), so no request waits for it."""
+    global _precompute_thread
+    with _precompute_lock:
+        if _precompute_thread is None:
+            _precompute_thread = threading.Thread(target=precompute_fees, name="precompute-fees", daemon=True)
+            _precompute_thread.start()
+    return _precompute_thread
 
-    return f" at OLMA Messe: {total_fee:.2f} CHF"
 
-def calculate_fee_unterer_graben(arrival_datetime, rounded_total_hours):
-    flat_rate = 2  # Flat rate per hour
-    total_fee = flat_rate * rounded_total_hours
+def fee_cache_stats():
+    info = cached_quote.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'name': 'fees',
+        'hits': info.hits,
+        'misses': info.misses,
+        'entries': info.currsize,
+        'hit_rate': info.hits / lookups if lookups else 0.0,
+    }
 
-    return f"at Unterer Graben: {total_fee:.2f} CHF"
 
-def calculate_fee_olma_parkplatz(arrival_datetime, rounded_total_hours):
-    daytime_start = 6  # Daytime starts at 6 AM
-    nighttime_start = 23  # Nighttime starts at 11 PM
-    day_rate = 2  # Day rate per hour
-    night_rate = 1.5  # Night rate per hour
-    total_fee = 0
-    current_hour = arrival_datetime.hour + arrival_datetime.minute / 60
+#Fees of many parkhaus at once (e.g. to rank them by cost), as an array in the order of parking_names
+#Unknown names get NaN
 
-    for _ in range(int(rounded_total_hours)):  # Adjust to use rounded_total_hours
-        if daytime_start <= current_hour < nighttime_start:
-            total_fee += day_rate
-        else:
-            total_fee += night_rate
-        current_hour = (current_hour + 1) % 24  # Wrap around to the next hour, mod 24 for midnight wrap-around
+def calculate_all_fees(arrival_datetime, rounded_total_hours, parking_names=None):
+    parking_names = list(TARIFFS) if parking_names is None else list(parking_names)
+    tariffs = [find_tariff(name) for name in parking_names]
+    known = np.array([tariff is not None for tariff in tariffs], dtype=bool)
+    fees = np.full(len(parking_names), np.nan)
+    if known.any():
+        fees[known] = batch_fees.fees_for_garages([t for t in tariffs if t is not None], arrival_datetime, rounded_total_hours)
+    return fees
 
-    return f" at OLMA Parkplatz: {total_fee:.2f} CHF"
 
+#Formatting, only used when the fee is displayed
 
+def format_fee(fee_result):
+    return f"at {fee_result.garage}: {fee_result.amount:.2f} {fee_result.currency}"
 
 
+def format_charges(fee_result):
+    return ", ".join(f"{charge.label} {charge.hours:g} h: {charge.amount:.2f} {fee_result.currency}" for charge in fee_result.charges)
+
+    
+#Calculation for every single parking space
+#standard identification--> def "name parking"(arrival_datetime, duration_hours)
+
+def fee_function(parking_name):
+    def calculate_fee_for_parking(arrival_datetime, rounded_total_hours):
+        return calculate_parking_fees(parking_name, arrival_datetime, rounded_total_hours)
+    calculate_fee_for_parking.__name__ = f"calculate_fee_{parking_name.lower().replace(' ', '_')}"
+    return calculate_fee_for_parking
+
+
+calculate_fee_bahnhof = fee_function("Bahnhof")
+calculate_fee_brühltor = fee_function("Brühltor")
+calculate_fee_burggraben = fee_function("Burggraben")
+calculate_fee_stadtpark_azsg = fee_function("Stadtpark AZSG")
+calculate_fee_neumarkt = fee_function("Neumarkt")
+calculate_fee_rathaus = fee_function("Rathaus")
+calculate_fee_kreuzbleiche = fee_function("Kreuzbleiche")
+calculate_fee_manor = fee_function("Manor")
+calculate_fee_oberer_graben = fee_function("Oberer Graben")
+calculate_fee_raiffeisen = fee_function("Raiffeisen")
+calculate_fee_einstein = fee_function("Einstein")
+calculate_fee_spisertor = fee_function("Spisertor")
+calculate_fee_spelterini = fee_function("Spelterini")
+calculate_fee_olma_messe = fee_function("OLMA Messe")
+calculate_fee_unterer_graben = fee_function("Unterer Graben")
+calculate_fee_olma_parkplatz = fee_function("OLMA Parkplatz")
@@ -0,0 +1,160 @@
+import numpy as np
+
+import distances
+import frame_registry
+
+# Uniform grid over projected metres, used to answer "all points within r metres"
+# and "k nearest" without scanning the whole dataset.
+#
+# Points are projected once (local equirectangular around the centre of the data),
+# bucketed into square cells and sorted by cell key. Cells of one grid column have
+# consecutive keys, so a radius query costs one binary search per grid column it
+# touches plus the candidates it returns. The grid is only used to prune: the final
+# distances always come from distances.distances_to_point, so results are exact.
+
+DEFAULT_CELL_SIZE = 250.0  # metres, about a quarter of the largest radius of the slider
+
+
+class GridIndex:
+    def __init__(self, latitudes, longitudes, cell_size=DEFAULT_CELL_SIZE):
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        self.size = len(latitudes)
+        self.cell_size = float(cell_size)
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+
+        valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        positions = np.flatnonzero(valid)
+        if len(positions) == 0:
+            self.ref_lat, self.ref_lon = 0.0, 0.0
+            self._scale_x = self._scale_y = 1.0
+            self._slack = 0.0
+            self._origin = np.zeros(2)
+            self._rows = 1
+            self._columns = 0
+            self._extent = np.zeros(4)
+            self._keys = np.empty(0, dtype=np.int64)
+            self._positions = positions
+            return
+
+        # Projection around the centre of the data
+        self.ref_lat = float((latitudes[valid].min() + latitudes[valid].max()) / 2)
+        self.ref_lon = float((longitudes[valid].min() + longitudes[valid].max()) / 2)
+        meridional, prime_vertical = distances.radii_of_curvature(self.ref_lat)
+        self._scale_y = float(meridional * np.pi / 180)
+        self._scale_x = float(prime_vertical * np.cos(np.radians(self.ref_lat)) * np.pi / 180)
+        # A fixed projection stretches east-west distances away from ref_lat; widen the searched area accordingly
+        cos_ratio = np.cos(np.radians(latitudes[valid])) / np.cos(np.radians(self.ref_lat))
+        self._slack = float(np.abs(cos_ratio - 1).max()) + 1e-3
+
+        x, y = self._project(latitudes[valid], longitudes[valid])
+        self._origin = np.array([x.min(), y.min()])
+        self._extent = np.array([x.min(), x.max(), y.min(), y.max()])
+        ix = ((x - self._origin[0]) // self.cell_size).astype(np.int64)
+        iy = ((y - self._origin[1]) // self.cell_size).astype(np.int64)
+        self._rows = int(iy.max()) + 1
+        self._columns = int(ix.max()) + 1
+
+        keys = ix * self._rows + iy
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._positions = positions[order]
+
+    @classmethod
+    def from_data(cls, data, cell_size=DEFAULT_CELL_SIZE):
+        latitudes, longitudes = distances.coordinate_arrays(data)
+        return cls(latitudes, longitudes, cell_size)
+
+    def __len__(self):
+        return self.size
+
+    def _project(self, latitudes, longitudes):
+        x = (np.asarray(longitudes) - self.ref_lon) * self._scale_x
+        y = (np.asarray(latitudes) - self.ref_lat) * self._scale_y
+        return x, y
+
+    def _candidates(self, point, radius):
+        """Row positions of all points in the cells overlapping the (padded) query square."""
+        if len(self._keys) == 0:
+            return self._positions
+        x, y = self._project(point[1], point[0])
+        reach = radius * (1 + self._slack) + 1.0
+        ix0 = max(int((x - reach - self._origin[0]) // self.cell_size), 0)
+        ix1 = min(int((x + reach - self._origin[0]) // self.cell_size), self._columns - 1)
+        iy0 = max(int((y - reach - self._origin[1]) // self.cell_size), 0)
+        iy1 = min(int((y + reach - self._origin[1]) // self.cell_size), self._rows - 1)
+        if ix0 > ix1 or iy0 > iy1:
+            return self._positions[:0]
+
+        columns = np.arange(ix0, ix1 + 1, dtype=np.int64) * self._rows
+        starts = np.searchsorted(self._keys, columns + iy0, side='left')
+        ends = np.searchsorted(self._keys, columns + iy1, side='right')
+        if len(starts) == 1:
+            return self._positions[starts[0]:ends[0]]
+        return np.concatenate([self._positions[s:e] for s, e in zip(starts, ends) if e > s] or [self._positions[:0]])
+
+    def query_radius(self, point, radius, mask=None):
+        """
+        Row positions (sorted) and distances in metres of all points within radius of point (longitude, latitude).
+        mask is an optional boolean array over all rows, e.g. only Parkhaus with free spaces.
+        """
+        candidates = self._candidates(point, radius)
+        if mask is not None:
+            candidates = candidates[np.asarray(mask, dtype=bool)[candidates]]
+        candidate_distances = distances.distances_to_point(self.latitudes[candidates], self.longitudes[candidates], point)
+        inside = candidate_distances <= radius
+        positions = candidates[inside]
+        found_distances = candidate_distances[inside]
+        order = np.argsort(positions, kind='stable')
+        return positions[order], found_distances[order]
+
+    def _max_reach(self, point):
+        """Distance beyond which a radius query is guaranteed to return every indexed point."""
+        x, y = self._project(point[1], point[0])
+        dx = max(abs(x - self._extent[0]), abs(x - self._extent[1]))
+        dy = max(abs(y - self._extent[2]), abs(y - self._extent[3]))
+        return float(np.hypot(dx, dy)) * (1 + self._slack) + self.cell_size
+
+    def query_nearest(self, point, k=1, mask=None):
+        """
+        Row positions and distances of the k nearest points to point (longitude, latitude), nearest first.
+        The search radius starts at one cell and doubles, so the cost depends on the local density
+        and not on the size of the whole dataset.
+        """
+        if len(self._keys) == 0 or k <= 0:
+            return self._positions[:0], np.empty(0)
+        radius = self.cell_size
+        max_reach = self._max_reach(point)
+        while True:
+            positions, found_distances = self.query_radius(point, radius, mask)
+            if len(positions) >= k or radius >= max_reach:
+                break
+            radius *= 2
+        if len(positions) > k:
+            nearest = np.argpartition(found_distances, k - 1)[:k]
+            positions, found_distances = positions[nearest], found_distances[nearest]
+        order = np.argsort(found_distances, kind='stable')
+        return positions[order], found_distances[order]
+
+
+# One index per loaded DataFrame, built when the dataset loads
+_indexes = frame_registry.FrameRegistry()
+
+
+def build_index(data, cell_size=DEFAULT_CELL_SIZE):
+    """Build the index of a DataFrame and remember it for later lookups with index_for."""
+    return register_index(data, GridIndex.from_data(data, cell_size))
+
+
+def register_index(data, index):
+    """Remember an index built elsewhere (e.g. by parking_dataset from its own arrays) as the one of data."""
+    return _indexes.put(data, index)
+
+
+def index_for(data, build=False):
+    """Return the index built for this exact DataFrame, or None (builds it if build is True)."""
+    index = _indexes.get(data)
+    if index is None and build:
+        index = build_index(data)
+    return index
@@ -0,0 +1,241 @@
+import math
+from typing import NamedTuple, Optional
+
+# Tariff engine: every Parkhaus is described by a Tariff record (see prices.py) and
+# this module turns a record, an arrival time and a duration into a fee.
+#
+# Fees are computed in closed form: the stay is cut at the band boundaries (and at the
+# 24 h windows when there is a daily cap) and every piece is priced at once, so a stay
+# of 30 days costs about 60 steps for a day/night tariff instead of 1440 half hours.
+# Everything is done in whole minutes and amounts are counted in integer units of 1/60 Rappen,
+# so that a minute at any rate in Rappen per hour is a whole number: the sums are exact and the
+# total is rounded to the Rappen once, at the end (batch_fees.py rounds the same way).
+
+MINUTES_PER_DAY = 24 * 60
+UNITS_PER_CHF = 100 * 60
+
+
+class Band(NamedTuple):
+    start: float  # hour of the day when the band starts (included)
+    end: float  # hour of the day when the band ends (excluded, 24 = midnight)
+    rate: float  # CHF per hour
+    label: str = ""
+    first_hour: Optional[float] = None  # CHF for the first hour if the stay starts in this band (default: rate)
+
+
+class Tier(NamedTuple):
+    up_to: float  # hours, math.inf for the last tier
+    rate: float  # CHF per hour
+    flat: Optional[float] = None  # fixed CHF for the whole tier instead of rate per hour
+
+
+class Tariff(NamedTuple):
+    garage: str
+    bands: tuple = ()  # time-of-day bands covering 0-24 h; empty if the price only depends on the duration
+    slot_hours: Optional[float] = None  # None: charged pro rata; else every started slot at the band of its start
+    first_hour: bool = False  # the first hour is charged as one block at the band of the arrival
+    segment_rounding: Optional[float] = None  # the time spent in every band is rounded up to this many hours
+    tiers: tuple = ()  # duration tiers, used when there are no bands
+    tiers_marginal: bool = False  # True: every tier prices its own hours; False: the tier of the total duration prices all hours
+    daily_cap: Optional[float] = None  # maximum CHF for every 24 h from the arrival
+    round_total: Optional[float] = None  # the total is rounded up to a multiple of this amount (CHF)
+    currency: str = "CHF"
+
+
+class Charge(NamedTuple):
+    label: str
+    hours: float
+    amount: float
+
+
+class FeeResult(NamedTuple):
+    """Numeric result of the pricing, formatted only when it is displayed."""
+    garage: str
+    amount: float
+    currency: str = "CHF"
+    charges: tuple = ()  # the Charge of every tariff band applied
+
+
+def _minutes(hours):
+    return int(round(hours * 60))
+
+
+def rate_units(rate):
+    """Units per minute of a rate in CHF per hour (its Rappen per hour)."""
+    return int(round(rate * 100))
+
+
+def chf_units(amount):
+    return int(round(amount * UNITS_PER_CHF))
+
+
+def units_to_chf(units):
+    """Whole Rappen (half a Rappen rounded up) in CHF."""
+    return ((units + 30) // 60) / 100
+
+
+def _band_of(tariff, minute):
+    minute_of_day = minute % MINUTES_PER_DAY
+    for band in tariff.bands:
+        if _minutes(band.start) <= minute_of_day < _minutes(band.end):
+            return band
+    raise ValueError(f"The bands of {tariff.garage} do not cover minute {minute_of_day} of the day")
+
+
+def _band_occurrences(tariff, start, end):
+    """(band, from, to) for every piece of [start, end) (minutes) that falls in one band."""
+    first_day = start // MINUTES_PER_DAY
+    last_day = (end - 1) // MINUTES_PER_DAY
+    for day in range(first_day, last_day + 1):
+        offset = day * MINUTES_PER_DAY
+        for band in tariff.bands:
+            piece_start = max(start, offset + _minutes(band.start))
+            piece_end = min(end, offset + _minutes(band.end))
+            if piece_start < piece_end:
+                yield band, piece_start, piece_end
+
+
+def _band_charges(tariff, start, end):
+    """Charges (amounts in units) for [start, end) (minutes) on a tariff with time-of-day bands."""
+    charges = []
+    if start >= end:
+        return charges
+
+    if tariff.slot_hours:
+        slot = _minutes(tariff.slot_hours)
+        slots = -(-(end - start) // slot)  # every started slot is paid
+        for band, piece_start, piece_end in _band_occurrences(tariff, start, start + slots * slot):
+            # slots whose start falls in [piece_start, piece_end)
+            first = -(-(piece_start - start) // slot)
+            last = -(-(piece_end - start) // slot) - 1
+            count = last - first + 1
+            if count > 0:
+                charges.append(Charge(band.label, count * tariff.slot_hours, count * slot * rate_units(band.rate)))
+        return charges
+
+    for band, piece_start, piece_end in _band_occurrences(tariff, start, end):
+        minutes = piece_end - piece_start
+        if tariff.segment_rounding:
+            step = _minutes(tariff.segment_rounding)
+            minutes = -(-minutes // step) * step
+        charges.append(Charge(band.label, minutes / 60, minutes * rate_units(band.rate)))
+    return charges
+
+
+def _tier_label(lower, up_to):
+    if up_to == math.inf:
+        return f"over {lower:g} h" if lower else "per hour"
+    return f"{lower:g}-{up_to:g} h"
+
+
+def _merge(charges):
+    """One charge per label (in order of appearance) in CHF, so a stay of many days stays a short list."""
+    merged = {}
+    for charge in charges:
+        hours, amount = merged.get(charge.label, (0.0, 0))
+        merged[charge.label] = (hours + charge.hours, amount + charge.amount)
+    return [Charge(label, hours, units_to_chf(amount)) for label, (hours, amount) in merged.items()]
+
+
+def _tier_amount(tier, minutes):
+    return chf_units(tier.flat) if tier.flat is not None else minutes * rate_units(tier.rate)
+
+
+def _tier_charges(tariff, duration):
+    """Charges (amounts in units) for duration minutes on a tariff that only depends on the duration."""
+    if duration <= 0:
+        return []
+    if tariff.tiers_marginal:
+        charges = []
+        lower = 0.0
+        for tier in tariff.tiers:
+            tier_minutes = min(duration, tier.up_to * 60) - lower * 60
+            if tier_minutes > 0:
+                tier_minutes = int(tier_minutes)
+                charges.append(Charge(_tier_label(lower, tier.up_to), tier_minutes / 60, _tier_amount(tier, tier_minutes)))
+            lower = tier.up_to
+            if duration <= lower * 60:
+                break
+        return charges
+
+    lower = 0.0
+    for tier in tariff.tiers:
+        if duration <= tier.up_to * 60:
+            return [Charge(_tier_label(lower, tier.up_to), duration / 60, _tier_amount(tier, duration))]
+        lower = tier.up_to
+    raise ValueError(f"The tiers of {tariff.garage} do not cover {duration / 60} hours")
+
+
+def _window_charges(tariff, start, end, with_first_hour):
+    """Charges for [start, end) minutes after midnight of the arrival day, first hour included if asked."""
+    if not tariff.bands:
+        return _tier_charges(tariff, end - start)
+
+    charges = []
+    if with_first_hour and tariff.first_hour and start < end:
+        band = _band_of(tariff, start)
+        amount = band.first_hour if band.first_hour is not None else band.rate
+        charges.append(Charge(f"{band.label} first hour".strip(), 1.0, chf_units(amount)))
+        start += 60
+    return charges + _band_charges(tariff, start, end)
+
+
+def round_total_units(tariff, total):
+    """total (units) rounded up to the round_total of the tariff, if it has one."""
+    if not tariff.round_total:
+        return total
+    step = chf_units(tariff.round_total)
+    return -(-total // step) * step
+
+
+def charge_units(tariff, arrival_minute, duration):
+    """
+    Every charge (amounts in units) for a stay of duration minutes from arrival_minute, and the
+    total in units before the rounding of the tariff. A daily cap appears as an extra charge.
+    """
+    end = arrival_minute + duration
+    if duration <= 0:
+        return 0, []
+
+    if tariff.daily_cap is None:
+        charges = _window_charges(tariff, arrival_minute, end, True)
+        return sum(charge.amount for charge in charges), charges
+
+    cap = chf_units(tariff.daily_cap)
+    charges = []
+    total = 0
+    window_start = arrival_minute
+    while window_start < end:
+        window_end = min(window_start + MINUTES_PER_DAY, end)
+        window = _window_charges(tariff, window_start, window_end, window_start == arrival_minute)
+        window_total = sum(charge.amount for charge in window)
+        charges.extend(window)
+        if window_total > cap:
+            charges.append(Charge("daily cap", 0.0, cap - window_total))
+            window_total = cap
+        total += window_total
+        window_start = window_end
+    return total, charges
+
+
+def compute_charges(tariff, arrival_datetime, hours):
+    """
+    Every charge applied for a stay of hours starting at arrival_datetime, and the total fee.
+    Returns (total, charges); a daily cap or the rounding of the total appear as extra charges.
+    """
+    total, charges = charge_units(tariff, arrival_datetime.hour * 60 + arrival_datetime.minute, _minutes(hours))
+    rounded = round_total_units(tariff, total)
+    if rounded != total:
+        charges.append(Charge("rounding", 0.0, rounded - total))
+    return units_to_chf(rounded), _merge(charges)
+
+
+def calculate_fee(tariff, arrival_datetime, hours):
+    """Fee in CHF for a stay of hours (already rounded to the half hour) starting at arrival_datetime."""
+    return compute_charges(tariff, arrival_datetime, hours)[0]
+
+
+def quote(tariff, arrival_datetime, hours):
+    """FeeResult for a stay of hours starting at arrival_datetime."""
+    total, charges = compute_charges(tariff, arrival_datetime, hours)
+    return FeeResult(tariff.garage, total, tariff.currency, tuple(charges))
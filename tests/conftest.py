@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules of the app are at the root of the repository, like for streamlit run Codice_full.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import batch_fees
+import prices
+import tariffs
+
+TARIFFS = list(prices.TARIFFS.values())
+
+
+def random_stays(count, seed=0):
+    rng = np.random.default_rng(seed)
+    minutes = rng.integers(0, 24 * 60, count)
+    arrivals = [datetime(2024, 5, 14) + timedelta(minutes=int(minute)) for minute in minutes]
+    hours = rng.integers(1, 24 * 2 * 5, count) / 2  # 0.5 h to 5 days
+    return arrivals, hours
+
+
+@pytest.mark.parametrize("garage, arrival, hours, amount", [
+    ("Spelterini", datetime(2024, 5, 14, 5, 15), 32, 59.63),
+    ("Kreuzbleiche", datetime(2024, 5, 14, 7, 51), 44.5, 60.58),
+])
+def test_reported_stays(garage, arrival, hours, amount):
+    tariff = prices.TARIFFS[garage]
+    assert tariffs.calculate_fee(tariff, arrival, hours) == amount
+    assert batch_fees.fees_for_garages([tariff], arrival, hours)[0] == amount
+
+
+def test_fees_for_garages_equal_scalar_fees_to_the_cent():
+    arrivals, hours = random_stays(500)
+    for arrival, stay in zip(arrivals, hours):
+        expected = [tariffs.calculate_fee(tariff, arrival, stay) for tariff in TARIFFS]
+        assert batch_fees.fees_for_garages(TARIFFS, arrival, stay).tolist() == expected, (arrival, stay)
+
+
+@pytest.mark.parametrize("tariff", TARIFFS, ids=lambda tariff: tariff.garage)
+def test_fees_for_stays_equal_scalar_fees_to_the_cent(tariff):
+    arrivals, hours = random_stays(3_000, seed=1)
+    expected = [tariffs.calculate_fee(tariff, arrival, stay) for arrival, stay in zip(arrivals, hours)]
+    assert batch_fees.fees_for_stays(tariff, arrivals, hours).tolist() == expected
+
+
+def test_all_fees_equal_quotes():
+    arrival = datetime(2024, 5, 14, 21, 15)
+    fees = prices.calculate_all_fees(arrival, 3.5)
+    assert fees.tolist() == [prices.calculate_parking_fees(name, arrival, 3.5).amount for name in prices.TARIFFS]
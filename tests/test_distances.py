@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from geopy.distance import geodesic
+
+import Codice_full
+import distances
+import geocoding
+import parking_dataset
+
+SOUTH, WEST = geocoding.SOUTHWEST_BOUND
+NORTH, EAST = geocoding.NORTHEAST_BOUND
+
+
+def random_points(rng, n):
+    return rng.uniform(SOUTH, NORTH, n), rng.uniform(WEST, EAST, n)
+
+
+def test_projection_error_is_below_a_metre_in_the_bounding_box():
+    rng = np.random.default_rng(1)
+    latitudes, longitudes = random_points(rng, 500)
+    for point_lat, point_lon in zip(*random_points(rng, 5)):
+        projected = distances.distances_to_point(latitudes, longitudes, (point_lon, point_lat))
+        exact = np.array([geodesic((lat, lon), (point_lat, point_lon)).meters for lat, lon in zip(latitudes, longitudes)])
+        assert np.abs(projected - exact).max() < 1.0
+
+
+def test_missing_coordinates_are_never_near():
+    result = distances.distances_to_point([np.nan, 47.42], [9.37, np.nan], (9.37, 47.42))
+    assert np.isnan(result).all()
+
+
+def old_nearest(data, destination_point):
+    """The loop of the original find_nearest_parking_place: geodesic to every Parkhaus, then the minimum."""
+    parkhaus = data[data['category'] == 'Parkhaus']
+    meters = parkhaus.apply(lambda row: geodesic((row['latitude'], row['longitude']), (destination_point[1], destination_point[0])).meters, axis=1)
+    return parkhaus.loc[meters.idxmin(), 'phname'], meters.min()
+
+
+def test_nearest_parking_place_matches_the_old_loop():
+    rng = np.random.default_rng(2)
+    latitudes, longitudes = random_points(rng, 40)
+    data = pd.DataFrame({
+        'phname': [f"Parkhaus {i}" for i in range(40)], 'latitude': latitudes, 'longitude': longitudes,
+        'category': np.where(rng.random(40) < 0.7, 'Parkhaus', 'Closed'),
+    })
+    indexed = data.copy()
+    parking_dataset.build_dataset(indexed)  # the loaded DataFrames have a spatial index, their copies do not
+    for point_lat, point_lon in zip(*random_points(rng, 50)):
+        point = (point_lon, point_lat)
+        name, meters = old_nearest(data, point)
+        for frame in (data, indexed):
+            nearest, minutes = Codice_full.find_nearest_parking_place(frame, point)
+            assert nearest['phname'] == name
+            assert abs(nearest['distance_to_destination'] - meters) < 1.0
+            assert minutes == distances.walking_minutes(nearest['distance_to_destination'])
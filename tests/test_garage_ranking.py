@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import garage_ranking
+import prices
+
+ARRIVAL = datetime(2024, 5, 14, 10, 0)
+DESTINATION = (9.37, 47.42)
+
+
+def candidates():
+    # distance_to_destination as left by the radius filter of the app; 660 m is a 10 minute walk
+    return pd.DataFrame({
+        'phname': ["Einstein", "Unterer Graben", "Unknown Parkhaus", "Unterer Graben"],
+        'phstate': ["offen", "offen", "offen", "geschlossen"],
+        'shortfree': [20, 5, 0, 50],
+        'shortmax': [100, 100, 100, 100],
+        'distance_to_destination': [660.0, 1320.0, 330.0, 66.0],
+    })
+
+
+def test_hand_computed_scores():
+    # 2 h: Einstein 5.00, Unterer Graben 4.00, unknown fee (cost 1); walks 10, 20 and 5 minutes
+    assert prices.calculate_parking_fees("Einstein", ARRIVAL, 2.0).amount == 5.0
+    assert prices.calculate_parking_fees("Unterer Graben", ARRIVAL, 2.0).amount == 4.0
+    # (walking, fee, free) costs: Einstein (0.5, 1, 0), Unterer Graben (1, 0.8, 0.75), unknown (0.25, 1, 1)
+    ranked = garage_ranking.rank_garages(candidates(), DESTINATION, ARRIVAL, 2.0, k=3)
+    assert [(garage.position, garage.name) for garage in ranked] == [(0, "Einstein"), (2, "Unknown Parkhaus"), (1, "Unterer Graben")]
+    np.testing.assert_allclose([garage.score for garage in ranked], [1.5 / 3, 2.25 / 3, 2.55 / 3])
+    assert ranked[0].walking_minutes == pytest.approx(10.0) and np.isnan(ranked[1].fee)
+
+    ranked = garage_ranking.rank_garages(candidates(), DESTINATION, ARRIVAL, 2.0, weights={'walking': 1, 'fee': 3, 'free': 0}, k=2)
+    assert [garage.name for garage in ranked] == ["Unknown Parkhaus", "Unterer Graben"]
+    np.testing.assert_allclose([garage.score for garage in ranked], [3.25 / 4, 3.4 / 4])
+
+
+def test_k_larger_than_the_candidates():
+    ranked = garage_ranking.rank_garages(candidates(), DESTINATION, ARRIVAL, 2.0, k=10)
+    assert [garage.position for garage in ranked] == [0, 2, 1]  # the closed garage is left out
+    ranked = garage_ranking.rank_garages(candidates(), DESTINATION, ARRIVAL, 2.0, k=10, only_open=False)
+    assert [garage.position for garage in ranked] == [0, 2, 1, 3] and ranked[-1].score == 1.0
+
+
+def test_all_weights_zero():
+    ranked = garage_ranking.rank_garages(candidates(), DESTINATION, ARRIVAL, 2.0, weights={'walking': 0, 'fee': 0, 'free': 0}, k=10, only_open=False)
+    assert [garage.score for garage in ranked] == [0.0, 0.0, 0.0, 1.0]  # every open garage ties, closed ones stay last
+    assert [garage.position for garage in ranked] == [0, 1, 2, 3]
+
+
+def test_no_candidates():
+    assert garage_ranking.rank_garages(candidates().iloc[:0], DESTINATION, ARRIVAL, 2.0) == []
+    assert garage_ranking.rank_garages(candidates(), None, ARRIVAL, 2.0) == []
@@ -0,0 +1,26 @@
+import garage_registry
+import prices
+from garage_registry import GarageMiss, GarageRegistry
+
+
+def test_aliases_and_fuzzy_names_resolve():
+    registry = GarageRegistry(prices.TARIFFS, prices.ALIASES)
+    assert registry.resolve("Parkhaus Hauptbahnhof").garage == "Bahnhof"
+    assert registry.resolve("Bruehltor").garage == "Brühltor"
+    assert registry.resolve("Spelterinni").garage == "Spelterini"
+
+
+def test_client_names_do_not_grow_the_registry():
+    registry = GarageRegistry(prices.TARIFFS, prices.ALIASES)
+    for i in range(garage_registry.MAX_REMEMBERED + 500):
+        assert isinstance(registry.resolve(f"Unknown {i}"), GarageMiss)
+        registry.resolve(f"Bahnhof {i}")
+    stats = registry.stats()
+    assert stats['remembered_names'] <= garage_registry.MAX_REMEMBERED
+    assert len(stats['unknown_names']) == garage_registry.MAX_COUNTED_NAMES + 1
+    assert len(stats['fuzzy_names']) <= garage_registry.MAX_COUNTED_NAMES + 1
+
+
+def test_long_names_miss_without_fuzzy_matching():
+    miss = GarageRegistry(prices.TARIFFS).resolve("Bahnhof" * 1000)
+    assert isinstance(miss, GarageMiss) and len(miss.name) == garage_registry.MAX_NAME_LENGTH
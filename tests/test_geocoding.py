@@ -0,0 +1,23 @@
+import geocoding
+import http_replay
+
+STANDIN_POINT, LIVE_POINT = (9.33, 47.41), (9.37, 47.42)
+
+
+def test_standin_points_are_not_served_by_the_live_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(geocoding, "_disk", geocoding.DiskStore(str(tmp_path / "geocode.sqlite3")))
+    monkeypatch.setattr(geocoding, "_lru", geocoding.LRUCache())
+    monkeypatch.setattr(geocoding, "NOMINATIM_URL", "http://127.0.0.1:8765")
+    monkeypatch.setattr(geocoding, "geocode_nominatim", lambda location: STANDIN_POINT)
+    assert geocoding.geocode("Marktplatz") == STANDIN_POINT
+
+    # Restarted against the public Nominatim, with the same disk store
+    monkeypatch.setattr(geocoding, "_lru", geocoding.LRUCache())
+    monkeypatch.setattr(geocoding, "NOMINATIM_URL", None)
+    monkeypatch.setattr(geocoding, "geocode_nominatim", lambda location: LIVE_POINT)
+    assert http_replay.MODE == "live"
+    assert geocoding.geocode("Marktplatz") == LIVE_POINT
+
+    monkeypatch.setattr(geocoding, "_lru", geocoding.LRUCache())
+    monkeypatch.setattr(geocoding, "geocode_nominatim", lambda location: None)  # now answered by the disk store
+    assert geocoding.geocode("Marktplatz") == LIVE_POINT
@@ -0,0 +1,87 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_client
+import instrumentation
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers each request to a path with the next (status, headers, delay) of its script, the last one repeated."""
+
+    scripts = {}
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        script = self.scripts[self.path]
+        status, headers, delay = script.pop(0) if len(script) > 1 else script[0]
+        time.sleep(delay)
+        body = b'{"ok": true}'
+        try:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass  # the client gave up waiting
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    ScriptedHandler.scripts, ScriptedHandler.requests = {}, []
+    stub = ThreadingHTTPServer(("127.0.0.1", 0), ScriptedHandler)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    instrumentation.enable(True)
+    instrumentation.reset()
+    yield f"http://127.0.0.1:{stub.server_address[1]}"
+    instrumentation.enable(False)
+    instrumentation.reset()
+    stub.shutdown()
+    stub.server_close()
+
+
+def get(url, **kwargs):
+    waits = []
+    response = http_client.get(url, session=http_client.create_session(), sleep=waits.append, **kwargs)
+    return response, waits
+
+
+def test_rate_limited_request_waits_retry_after_then_succeeds(server):
+    ScriptedHandler.scripts["/limited"] = [(429, {"Retry-After": "2"}, 0), (200, {}, 0)]
+    response, waits = get(server + "/limited")
+    assert response.status_code == 200 and response.json() == {"ok": True}
+    assert waits == [2.0]
+    counts = instrumentation.http_status_counts()
+    assert counts[("127.0.0.1", "429")] == 1 and counts[("127.0.0.1", "200")] == 1
+
+
+@pytest.mark.parametrize("status", [502, 503, 504])
+def test_server_errors_are_retried_up_to_max_attempts(server, status):
+    ScriptedHandler.scripts["/broken"] = [(status, {}, 0)]
+    response, waits = get(server + "/broken", max_attempts=3)
+    assert response.status_code == status
+    assert len(ScriptedHandler.requests) == 3 and len(waits) == 2  # no wait after the last attempt
+    assert all(0 < wait <= http_client.MAX_BACKOFF for wait in waits)
+    assert instrumentation.http_status_counts() == {("127.0.0.1", str(status)): 3}
+
+
+def test_other_errors_are_not_retried(server):
+    ScriptedHandler.scripts["/missing"] = [(404, {}, 0)]
+    response, waits = get(server + "/missing")
+    assert response.status_code == 404 and waits == [] and len(ScriptedHandler.requests) == 1
+
+
+def test_read_timeouts_are_retried_and_end_in_none(server):
+    ScriptedHandler.scripts["/slow"] = [(200, {}, 0.5)]
+    response, waits = get(server + "/slow", max_attempts=2, timeout=(1, 0.1))
+    assert response is None
+    assert len(waits) == 1
+    assert instrumentation.http_status_counts() == {("127.0.0.1", "error"): 2}
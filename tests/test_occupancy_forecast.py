@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import occupancy_forecast
+from occupancy_history import OccupancyHistory
+from occupancy_poller import OccupancySnapshot
+
+MONDAY_NINE = int(pd.Timestamp("2024-05-13 09:00", tz=occupancy_forecast.TIMEZONE).timestamp())
+WEEK = 7 * 24 * 3600
+
+
+def snapshot(fetched_at, free):
+    data = pd.DataFrame({'phname': ["Bahnhof"], 'shortfree': [free], 'shortmax': [100], 'phstate': ["offen"],
+                         'latitude': [47.42], 'longitude': [9.37]})
+    return OccupancySnapshot(data, fetched_at=fetched_at)
+
+
+def test_history_is_used_even_if_the_forecaster_was_asked_for_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(occupancy_forecast, "_forecaster", None)
+    history = OccupancyHistory(str(tmp_path))
+    for week in range(4):  # four Mondays at 09:00 with 40 free spaces
+        history.append(snapshot(MONDAY_NINE + week * WEEK, 40))
+
+    forecaster = occupancy_forecast.get_forecaster()  # e.g. a request or the stats before the poller starts
+    assert occupancy_forecast.get_forecaster(history) is forecaster
+    assert forecaster.stats()['samples'] == 0  # nothing is read in the calling thread
+
+    current = snapshot(MONDAY_NINE + 4 * WEEK, 10)
+    history.append(current)  # the history listener runs before the forecaster
+    forecaster.add_snapshot(current)
+    assert forecaster.stats()['samples'] == 5  # four recorded, the current one once
+    expected = forecaster.predict(["Bahnhof"], datetime(2024, 6, 17, 9, 0))
+    np.testing.assert_allclose(expected, [(4 * 40 + 10) / 5])
+
+    forecaster.add_snapshot(snapshot(MONDAY_NINE + 4 * WEEK + 60, 10))
+    assert forecaster.stats()['samples'] == 6  # the history is only read once
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+import parking_dataset
+from occupancy_history import OccupancyHistory
+from occupancy_poller import OccupancySnapshot
+
+START = 1_700_000_000
+
+
+def snapshot(minute):
+    data = pd.DataFrame({
+        'phname': ["Bahnhof", "Brühltor"], 'shortfree': [10, 20], 'shortmax': [100, 200],
+        'phstate': ["offen", "offen"], 'latitude': [47.42, 47.43], 'longitude': [9.37, 9.38],
+    })
+    return OccupancySnapshot(data, fetched_at=START + minute * 60)
+
+
+def test_only_one_process_records_each_poll(tmp_path):
+    writer, other = OccupancyHistory(str(tmp_path)), OccupancyHistory(str(tmp_path))  # two workers
+    for minute in range(3):
+        writer.append(snapshot(minute))
+        other.append(snapshot(minute))
+    assert other.skipped == 3
+    assert len(writer.read(START, START + 3600)) == 6
+
+
+def test_another_process_takes_over_when_the_writer_stops(tmp_path):
+    writer, other = OccupancyHistory(str(tmp_path)), OccupancyHistory(str(tmp_path))
+    writer.append(snapshot(0))
+    assert other.append(snapshot(0)) == 0
+    writer._writer_lock.close()  # what the exit of the writing process does
+    assert other.append(snapshot(1)) == 2
+    assert len(other.read(START, START + 3600)) == 4
+
+
+def test_snapshot_carries_the_dataset_the_requests_use(tmp_path):
+    data = pd.DataFrame({'phname': ["Bahnhof", "Rathaus"], 'shortfree': [5, None], 'shortmax': [50, 80], 'phstate': ["offen", None],
+                         'latitude': [47.42, 47.43], 'longitude': [9.37, 9.38]})
+    parking_dataset.build_dataset(data)
+    current = OccupancySnapshot(data, fetched_at=START)
+    assert current.dataset is parking_dataset.dataset_for(data)
+    history = OccupancyHistory(str(tmp_path))
+    history.append(current)
+    frame = history.to_frame(history.read(START, START + 60))
+    assert frame['phname'].tolist() == ["Bahnhof", "Rathaus"]
+    assert frame['shortfree'].iloc[0] == 5 and np.isnan(frame['shortfree'].iloc[1])
+    assert frame['phstate'].iloc[0] == "offen" and pd.isna(frame['phstate'].iloc[1])
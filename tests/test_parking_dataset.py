@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+from geopy.distance import geodesic
+
+import Codice_full
+import geocoding
+import parking_dataset
+
+SOUTH, WEST = geocoding.SOUTHWEST_BOUND
+NORTH, EAST = geocoding.NORTHEAST_BOUND
+
+
+def parking_data(n=60, seed=5):
+    """Rows like the loaders': some with 0 coordinates (then read from 'standort'), closed ones, unknown counts."""
+    rng = np.random.default_rng(seed)
+    latitudes, longitudes = rng.uniform(SOUTH, NORTH, n), rng.uniform(WEST, EAST, n)
+    data = pd.DataFrame({
+        'phname': [f"Parkhaus {i}" for i in range(n)],
+        'phstate': np.where(rng.random(n) < 0.8, 'offen', 'geschlossen'),
+        'shortfree': rng.integers(0, 40, n).astype(float),
+        'shortmax': rng.integers(40, 400, n).astype(float),
+        'latitude': latitudes, 'longitude': longitudes,
+        'standort': [{'lat': lat, 'lon': lon} for lat, lon in zip(latitudes, longitudes)],
+    })
+    data.loc[::7, 'shortfree'] = np.nan
+    data.loc[::11, 'shortmax'] = np.nan
+    data.loc[::9, ['latitude', 'longitude']] = 0.0
+    data['category'] = np.where(data['phstate'] == 'offen', 'Parkhaus', 'Closed')
+    return data
+
+
+def old_filter_parking_by_radius(data, destination_point, radius, show_only_free):
+    """The per-row geodesic filter of the original app."""
+    def condition(row):
+        lat = row.get('latitude') or row.get('standort', {}).get('lat', 0)
+        lon = row.get('longitude') or row.get('standort', {}).get('lon', 0)
+        if lat and lon:
+            distance_within_radius = geodesic((lat, lon), (destination_point[1], destination_point[0])).meters <= radius
+            if show_only_free:
+                return distance_within_radius and row.get('shortfree', 0) > 0
+            return distance_within_radius
+        return False
+
+    return data[data.apply(condition, axis=1)]
+
+
+def test_arrays_are_read_only():
+    dataset = parking_dataset.build_dataset(parking_data().assign(expected_free=3))
+    for name in ("latitudes", "longitudes", "names", "states", "category_codes", "free", "total", "expected_free"):
+        array = getattr(dataset, name)
+        assert not array.flags.writeable, name
+        with pytest.raises(ValueError):
+            array[0] = array[1]
+
+
+@pytest.mark.parametrize("show_only_free", [False, True])
+def test_view_frame_equals_the_old_radius_filter(show_only_free):
+    data = parking_data()
+    rng = np.random.default_rng(6)
+    for point in zip(rng.uniform(WEST, EAST, 10), rng.uniform(SOUTH, NORTH, 10)):
+        for radius in (300, 800, 2000):
+            frame = Codice_full.parking_in_radius(data, point, radius, show_only_free).frame()
+            expected = old_filter_parking_by_radius(data, point, radius, show_only_free)
+            pd.testing.assert_frame_equal(frame.drop(columns='distance_to_destination'), expected)
+            pd.testing.assert_frame_equal(Codice_full.filter_parking_by_radius(data, point, radius, show_only_free, True), frame)
+
+
+def test_missing_counts_are_minus_one_and_never_free():
+    data = parking_data(5)
+    data['shortfree'] = [10, np.nan, 0, 3, np.nan]
+    data['shortmax'] = [100, 50, np.nan, 30, np.nan]
+    dataset = parking_dataset.build_dataset(data)
+    assert dataset.free.tolist() == [10, parking_dataset.MISSING, 0, 3, parking_dataset.MISSING]
+    assert dataset.total.tolist() == [100, 50, parking_dataset.MISSING, 30, parking_dataset.MISSING]
+    assert dataset.free_mask().tolist() == [True, False, False, True, False]
+    np.testing.assert_array_equal(parking_dataset.as_float(dataset.total), [100, 50, np.nan, 30, np.nan])
+
+    forecast = parking_dataset.build_dataset(data.assign(expected_free=[0, 4, np.nan, 2, 1]))
+    assert forecast.free_mask().tolist() == [False, True, False, True, True]  # the forecast replaces the current spaces
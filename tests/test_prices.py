@@ -0,0 +1,148 @@
+from datetime import datetime
+
+import pytest
+
+import prices
+import tariffs
+
+# Fees of the old per-garage loops (before the tariff table of prices.py), for every arrival
+# of ARRIVALS (rows) and stay of HOURS (columns). The ten garages below must keep them; the
+# other six had bugs in their loops and are checked against hand-computed fees further down.
+ARRIVALS = [(0, 0), (5, 30), (6, 45), (12, 0), (21, 15), (23, 30)]
+HOURS = [0.5, 1, 3.5, 8, 13, 30.5]
+
+OLD_LOOP_FEES = {
+    "Rathaus": [
+        [1.20, 1.20, 4.80, 10.80, 22.80, 55.20],
+        [1.20, 1.20, 7.20, 19.20, 31.20, 61.20],
+        [3.60, 3.60, 10.80, 20.40, 32.40, 64.80],
+        [2.40, 2.40, 9.60, 19.20, 27.60, 63.60],
+        [2.40, 3.60, 6.00, 12.00, 22.80, 56.40],
+        [1.20, 2.40, 4.80, 12.00, 24.00, 55.20],
+    ],
+    "Kreuzbleiche": [
+        [0.50, 1.00, 3.50, 9.00, 16.50, 39.25],
+        [0.50, 1.25, 5.00, 11.75, 19.25, 42.00],
+        [0.75, 1.50, 5.25, 12.00, 19.50, 42.25],
+        [0.75, 1.50, 5.25, 12.00, 18.50, 42.25],
+        [0.75, 1.50, 4.38, 8.88, 16.00, 39.88],
+        [0.50, 1.00, 3.50, 8.75, 16.25, 39.00],
+    ],
+    "Oberer Graben": [
+        [1.00, 2.00, 6.00, 13.00, 23.00, 55.00],
+        [1.00, 2.00, 7.00, 16.00, 26.00, 58.00],
+        [1.00, 2.00, 7.00, 16.00, 26.00, 58.00],
+        [1.00, 2.00, 7.00, 16.00, 25.00, 58.00],
+        [1.00, 2.00, 7.00, 13.00, 23.00, 56.00],
+        [1.00, 2.00, 6.00, 13.00, 23.00, 55.00],
+    ],
+    "Spelterini": [
+        [0.75, 1.50, 5.25, 12.50, 22.50, 54.25],
+        [0.75, 1.50, 6.25, 15.25, 25.25, 56.75],
+        [0.88, 1.88, 6.88, 15.88, 25.88, 57.38],
+        [1.00, 2.00, 7.00, 16.00, 25.50, 57.50],
+        [1.00, 2.00, 6.63, 13.38, 22.50, 55.63],  # 6.625 and 55.625: the old loop printed the float tie down
+        [1.00, 1.75, 5.50, 12.50, 22.50, 54.50],
+    ],
+    "Manor": [
+        [2.00, 2.00, 15.75, 36.00, 58.50, 137.25],
+        [2.00, 2.00, 15.75, 36.00, 58.50, 137.25],
+        [2.00, 2.00, 15.75, 36.00, 58.50, 137.25],
+        [2.00, 2.00, 15.75, 36.00, 58.50, 137.25],
+        [2.00, 2.00, 15.75, 36.00, 58.50, 137.25],
+        [2.00, 2.00, 15.75, 36.00, 58.50, 137.25],
+    ],
+    "Raiffeisen": [
+        [1.00, 2.00, 5.25, 12.00, 19.50, 30.50],
+        [1.00, 2.00, 5.25, 12.00, 19.50, 30.50],
+        [1.00, 2.00, 5.25, 12.00, 19.50, 30.50],
+        [1.00, 2.00, 5.25, 12.00, 19.50, 30.50],
+        [1.00, 2.00, 5.25, 12.00, 19.50, 30.50],
+        [1.00, 2.00, 5.25, 12.00, 19.50, 30.50],
+    ],
+    "Einstein": [
+        [1.25, 2.50, 8.75, 20.00, 32.50, 76.25],
+        [1.25, 2.50, 8.75, 20.00, 32.50, 76.25],
+        [1.25, 2.50, 8.75, 20.00, 32.50, 76.25],
+        [1.25, 2.50, 8.75, 20.00, 32.50, 76.25],
+        [1.25, 2.50, 8.75, 20.00, 32.50, 76.25],
+        [1.25, 2.50, 8.75, 20.00, 32.50, 76.25],
+    ],
+    "Spisertor": [
+        [1.25, 2.50, 8.75, 20.00, 30.00, 46.25],
+        [1.25, 2.50, 8.75, 20.00, 30.00, 46.25],
+        [1.25, 2.50, 8.75, 20.00, 30.00, 46.25],
+        [1.25, 2.50, 8.75, 20.00, 30.00, 46.25],
+        [1.25, 2.50, 8.75, 20.00, 30.00, 46.25],
+        [1.25, 2.50, 8.75, 20.00, 30.00, 46.25],
+    ],
+    "OLMA Messe": [
+        [1.00, 2.00, 6.75, 13.50, 21.00, 47.25],
+        [1.00, 2.00, 6.75, 13.50, 21.00, 47.25],
+        [1.00, 2.00, 6.75, 13.50, 21.00, 47.25],
+        [1.00, 2.00, 6.75, 13.50, 21.00, 47.25],
+        [1.00, 2.00, 6.75, 13.50, 21.00, 47.25],
+        [1.00, 2.00, 6.75, 13.50, 21.00, 47.25],
+    ],
+    "Unterer Graben": [
+        [1.00, 2.00, 7.00, 16.00, 26.00, 61.00],
+        [1.00, 2.00, 7.00, 16.00, 26.00, 61.00],
+        [1.00, 2.00, 7.00, 16.00, 26.00, 61.00],
+        [1.00, 2.00, 7.00, 16.00, 26.00, 61.00],
+        [1.00, 2.00, 7.00, 16.00, 26.00, 61.00],
+        [1.00, 2.00, 7.00, 16.00, 26.00, 61.00],
+    ],
+}
+
+
+@pytest.mark.parametrize("garage", OLD_LOOP_FEES)
+def test_unchanged_garages_keep_the_old_fees(garage):
+    fees = [[prices.calculate_parking_fees(garage, datetime(2024, 5, 14, hour, minute), hours).amount for hours in HOURS]
+            for hour, minute in ARRIVALS]
+    assert fees == OLD_LOOP_FEES[garage]
+
+
+@pytest.mark.parametrize("garage, arrival, hours, amount", [
+    # First hour at the band of the arrival, then every started half hour at the band where it starts
+    ("Bahnhof", (8, 0), 3, 7.20),  # 2.40 + 4 x 1.20
+    ("Bahnhof", (21, 0), 3, 4.80),  # 2.40 + 4 x 0.60 from 22:00
+    ("Bahnhof", (5, 0), 2.5, 4.80),  # night first hour 1.20 + 3 x 1.20 from 06:00
+    ("Brühltor", (6, 30), 2, 3.20),  # night first hour 1.20 + 2 x 1.00
+    ("Brühltor", (23, 0), 2, 3.20),  # 2.00 + 2 x 0.60 after midnight
+    ("Burggraben", (10, 0), 1.5, 3.00),  # 2.00 + 1.00
+    ("Burggraben", (21, 15), 1.5, 2.60),  # 2.00 + 0.60 from 22:15
+    ("Stadtpark AZSG", (12, 0), 4, 6.40),  # 1.60 + 6 x 0.80
+    ("Stadtpark AZSG", (22, 0), 2, 1.60),  # 0.80 + 2 x 0.40
+    # Pro rata across the bands
+    ("Neumarkt", (12, 57), 19, 48.00),  # 543 min x 3.00/h + 540 min x 2.00/h + 57 min x 3.00/h
+    ("Neumarkt", (21, 30), 1, 2.50),  # 30 min x 3.00/h + 30 min x 2.00/h
+    # Every started hour at the band where it starts
+    ("OLMA Parkplatz", (15, 18), 33.5, 63.50),  # 34 hours: 8 + 17 day (2.00), 7 + 2 night (1.50)
+    ("OLMA Parkplatz", (22, 30), 1.5, 3.50),  # 2.00 + 1.50
+])
+def test_fixed_garages(garage, arrival, hours, amount):
+    assert prices.calculate_parking_fees(garage, datetime(2024, 5, 14, *arrival), hours).amount == amount
+
+
+def test_memoised_quotes_equal_uncached_pricing_and_count_hits():
+    prices.cached_quote.cache_clear()
+    stays = [(garage, datetime(2024, 5, 14, hour, minute), hours)
+             for garage in prices.TARIFFS for hour, minute in ARRIVALS for hours in HOURS]
+    for garage, arrival, hours in stays:
+        assert prices.calculate_parking_fees(garage, arrival, hours).amount == tariffs.calculate_fee(prices.TARIFFS[garage], arrival, hours)
+    misses = prices.fee_cache_stats()['misses']
+    for garage, arrival, hours in stays:
+        prices.calculate_parking_fees(garage, arrival.replace(day=20), hours)  # the weekday is not in the key
+    stats = prices.fee_cache_stats()
+    assert stats['misses'] == misses and stats['hits'] >= len(stays)
+
+
+def test_precomputed_table_has_the_keys_of_quarter_hour_arrivals():
+    prices.cached_quote.cache_clear()
+    prices.precompute_fees(durations=[2.0], parking_names=["Bahnhof", "Manor"])
+    entries = prices.fee_cache_stats()['entries']
+    assert entries == 24 * 60 // prices.ARRIVAL_STEP + 1  # Manor does not depend on the arrival
+    for hour, minute in [(0, 0), (9, 15), (17, 45)]:
+        prices.calculate_parking_fees("Bahnhof", datetime(2024, 5, 14, hour, minute), 2.0)
+    stats = prices.fee_cache_stats()
+    assert stats['hits'] == 3 and stats['misses'] == entries
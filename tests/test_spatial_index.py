@@ -0,0 +1,89 @@
+import numpy as np
+
+import distances
+import geocoding
+from spatial_index import GridIndex
+
+SOUTH, WEST = geocoding.SOUTHWEST_BOUND
+NORTH, EAST = geocoding.NORTHEAST_BOUND
+CELL = 250.0
+
+
+def brute_radius(latitudes, longitudes, point, radius, mask=None):
+    all_distances = distances.distances_to_point(latitudes, longitudes, point)
+    inside = all_distances <= radius
+    if mask is not None:
+        inside &= mask
+    positions = np.flatnonzero(inside)
+    return positions, all_distances[positions]
+
+
+def brute_nearest(latitudes, longitudes, point, k, mask=None):
+    all_distances = distances.distances_to_point(latitudes, longitudes, point)
+    if mask is not None:
+        all_distances = np.where(mask, all_distances, np.nan)
+    order = np.argsort(all_distances, kind='stable')
+    order = order[~np.isnan(all_distances[order])][:k]
+    return order, all_distances[order]
+
+
+def edge_points(n):
+    """Points whose projected coordinates are whole multiples of the cell size: they lie on cell edges."""
+    ref_lat, ref_lon = (SOUTH + NORTH) / 2, (WEST + EAST) / 2
+    meridional, prime_vertical = distances.radii_of_curvature(ref_lat)
+    steps = np.arange(-n, n + 1) * CELL
+    x, y = np.meshgrid(steps, steps)
+    latitudes = ref_lat + y.ravel() / (meridional * np.pi / 180)
+    longitudes = ref_lon + x.ravel() / (prime_vertical * np.cos(np.radians(ref_lat)) * np.pi / 180)
+    return latitudes, longitudes
+
+
+def check_queries(latitudes, longitudes, queries, rng):
+    index = GridIndex(latitudes, longitudes, CELL)
+    mask = rng.random(len(latitudes)) < 0.6
+    for point in queries:
+        for radius in (0.0, 100.0, CELL, 1000.0, 3 * CELL, 20000.0):
+            for query_mask in (None, mask):
+                positions, found = index.query_radius(point, radius, query_mask)
+                expected_positions, expected = brute_radius(latitudes, longitudes, point, radius, query_mask)
+                np.testing.assert_array_equal(positions, expected_positions)
+                np.testing.assert_array_equal(found, expected)
+        for k in (1, 3, 10, len(latitudes) + 5):
+            for query_mask in (None, mask):
+                positions, found = index.query_nearest(point, k, query_mask)
+                expected_positions, expected = brute_nearest(latitudes, longitudes, point, k, query_mask)
+                np.testing.assert_array_equal(found, expected)
+                assert len(set(positions)) == len(positions)
+
+
+def test_random_points_match_a_brute_force_scan():
+    rng = np.random.default_rng(3)
+    latitudes, longitudes = rng.uniform(SOUTH, NORTH, 300), rng.uniform(WEST, EAST, 300)
+    latitudes[::37] = np.nan  # missing coordinates are never found
+    queries = list(zip(rng.uniform(WEST - 0.02, EAST + 0.02, 30), rng.uniform(SOUTH - 0.02, NORTH + 0.02, 30)))
+    queries += [(longitudes[i], latitudes[i]) for i in (1, 2, 3)]  # on a point, at distance 0
+    check_queries(latitudes, longitudes, queries, rng)
+
+
+def test_points_and_queries_on_cell_edges():
+    rng = np.random.default_rng(4)
+    latitudes, longitudes = edge_points(6)
+    queries = [(longitudes[i], latitudes[i]) for i in rng.choice(len(latitudes), 20, replace=False)]
+    check_queries(latitudes, longitudes, queries, rng)
+
+
+def test_radius_equal_to_a_distance_includes_that_point():
+    latitudes, longitudes = edge_points(3)
+    point = (longitudes[0], latitudes[0])
+    radius = distances.distances_to_point(latitudes[5:6], longitudes[5:6], point)[0]
+    positions, _ = GridIndex(latitudes, longitudes, CELL).query_radius(point, radius)
+    assert 5 in positions
+
+
+def test_empty_index():
+    point = ((WEST + EAST) / 2, (SOUTH + NORTH) / 2)
+    for index in (GridIndex([], []), GridIndex([np.nan, np.nan], [9.37, np.nan])):
+        positions, found = index.query_radius(point, 5000.0)
+        assert len(positions) == 0 and len(found) == 0
+        positions, found = index.query_nearest(point, 3)
+        assert len(positions) == 0 and len(found) == 0
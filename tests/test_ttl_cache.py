@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Loader:
+    def __init__(self, *results):
+        self.results = list(results)  # values returned, exceptions raised, in order
+        self.calls = 0
+
+    def __call__(self):
+        result = self.results[min(self.calls, len(self.results) - 1)]
+        self.calls += 1
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def wait_for_refresh(cache):
+    deadline = time.monotonic() + 5
+    while cache._refreshing and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert not cache._refreshing
+
+
+def test_stale_values_are_served_while_one_refresh_runs():
+    clock = FakeClock()
+    cache = TTLCache("test", ttl=60, max_stale=600, clock=clock)
+    loader = Loader("old", "new")
+    assert cache.get("k", loader) == "old"
+    clock.now += 30
+    assert cache.get("k", loader) == "old" and loader.calls == 1  # fresh hit
+
+    clock.now += 60
+    assert cache.get("k", loader) == "old"  # stale hit, refreshed in the background
+    wait_for_refresh(cache)
+    assert cache.get("k", loader) == "new" and loader.calls == 2
+    assert (cache.hits, cache.stale_hits, cache.misses, cache.refreshes) == (2, 1, 1, 1)
+
+    clock.now += 1000  # older than max_stale: the caller waits for the load
+    assert cache.get("k", Loader("newest")) == "newest"
+    assert cache.misses == 2
+
+
+def test_a_failed_load_is_raised_again_until_error_ttl():
+    clock = FakeClock()
+    cache = TTLCache("test", ttl=60, error_ttl=30, clock=clock)
+    loader = Loader(ValueError("down"), "back")
+    tracebacks = []
+    for _ in range(3):
+        with pytest.raises(ValueError, match="down") as raised:
+            cache.get("k", loader)
+        tracebacks.append(len(list(_frames(raised.value.__traceback__))))
+    assert loader.calls == 1 and cache.failed_hits == 2
+    assert tracebacks[1] == tracebacks[2]  # the traceback does not grow at every failed hit
+
+    clock.now += 31
+    assert cache.get("k", loader) == "back" and loader.calls == 2
+    stats = cache.stats()
+    assert stats['lookups'] == 4 and stats['hit_rate'] == 0.0
+
+
+def test_a_failed_refresh_keeps_the_stale_value_and_waits_for_error_ttl():
+    clock = FakeClock()
+    cache = TTLCache("test", ttl=60, error_ttl=30, clock=clock)
+    loader = Loader("old", ValueError("down"), "new")
+    cache.get("k", loader)
+    clock.now += 61
+    assert cache.get("k", loader) == "old"
+    wait_for_refresh(cache)
+    assert loader.calls == 2 and cache.errors == 1
+    assert cache.get("k", loader) == "old"
+    assert not cache._refreshing and loader.calls == 2  # no new refresh inside the error window
+
+    clock.now += 31
+    cache.get("k", loader)
+    wait_for_refresh(cache)
+    assert cache.get("k", loader) == "new" and loader.calls == 3
+
+
+def test_concurrent_misses_share_one_load():
+    cache = TTLCache("test", ttl=60)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("k", slow_loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["value"] * 8 and len(calls) == 1
+    assert cache.misses == 1 and cache.hits == 7
+
+
+def _frames(traceback):
+    while traceback is not None:
+        yield traceback.tb_frame
+        traceback = traceback.tb_next
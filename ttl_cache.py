@@ -0,0 +1,165 @@
+import threading
+import time
+
+# Process-wide cache for the open-data datasets.
+#
+# Streamlit executes Codice_full.py again on every rerun, so anything stored there is
+# lost; this module is imported once per process and therefore shared by all sessions.
+#
+# Every cache has a TTL. Inside the TTL a value is served as is (hit). After the TTL the
+# old value is still served (stale hit) while one background thread reloads it, so users
+# never wait on a refresh. Only a missing value, or one older than max_stale, is loaded
+# while the caller waits (miss); concurrent misses on the same key share one load.
+#
+# A failed load is remembered for error_ttl seconds: meanwhile the same error is raised again
+# (failed hit) and no stale refresh is started, so with the server down the loader still runs
+# at most once per window instead of at every rerun of every session.
+# The stored exception is raised again without the traceback of the previous raise, which
+# would otherwise grow at every failed hit.
+#
+# hit_rate is the share of lookups answered with a cached value (fresh or stale); failed
+# hits are lookups too, but not hits, since the caller gets no value.
+
+DEFAULT_ERROR_TTL = 30  # seconds
+
+
+class TTLCache:
+    def __init__(self, name, ttl, max_stale=None, error_ttl=DEFAULT_ERROR_TTL, clock=time.monotonic):
+        self.name = name
+        self.ttl = ttl
+        self.max_stale = max_stale  # None = serve stale values of any age
+        self.error_ttl = error_ttl  # 0 = never remember a failure
+        self.clock = clock  # seconds, monotonic (a fake one in the tests)
+        self._entries = {}  # key -> (value, loaded_at)
+        self._failures = {}  # key -> (exception, failed_at) of the last failed load
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._refreshing = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.failed_hits = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    def _recent_failure(self, key):
+        """The exception of the last load of key if it failed less than error_ttl seconds ago, else None."""
+        failure = self._failures.get(key)
+        if failure is None or self.clock() - failure[1] > self.error_ttl:
+            return None
+        return failure[0]
+
+    def _failed(self, key, error):
+        self.errors += 1
+        self._failures[key] = (error, self.clock())
+
+    def _loaded(self, key, value):
+        self._entries[key] = (value, self.clock())
+        self._failures.pop(key, None)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, key, loader):
+        """Return the cached value for key, calling loader() to fill or refresh it."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = self.clock() - entry[1]
+            if age <= self.ttl:
+                self.hits += 1
+                return entry[0]
+            if self.max_stale is None or age <= self.max_stale:
+                self.stale_hits += 1
+                self._refresh_in_background(key, loader)
+                return entry[0]
+
+        with self._key_lock(key):
+            # Another thread may have loaded it while we were waiting for the lock
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[1] <= self.ttl:
+                self.hits += 1
+                return entry[0]
+            error = self._recent_failure(key)
+            if error is not None:
+                self.failed_hits += 1
+                raise error.with_traceback(None)
+            self.misses += 1
+            try:
+                value = loader()
+            except Exception as e:
+                self._failed(key, e)
+                raise
+            self._loaded(key, value)
+            return value
+
+    def _refresh_in_background(self, key, loader):
+        if self._recent_failure(key) is not None:
+            return  # the last refresh failed, wait for error_ttl before asking the server again
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key, loader), daemon=True, name=f"refresh-{self.name}").start()
+
+    def _refresh(self, key, loader):
+        try:
+            with self._key_lock(key):
+                value = loader()
+                self._loaded(key, value)
+                self.refreshes += 1
+        except Exception as e:
+            # Keep serving the last good value, a stale hit after error_ttl tries again
+            self._failed(key, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def put(self, key, value):
+        self._loaded(key, value)
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+            self._failures.clear()
+        else:
+            self._entries.pop(key, None)
+            self._failures.pop(key, None)
+
+    def age(self, key):
+        """Seconds since key was loaded, or None if it is not cached."""
+        entry = self._entries.get(key)
+        return None if entry is None else self.clock() - entry[1]
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses + self.failed_hits
+        return {
+            'name': self.name,
+            'ttl': self.ttl,
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'failed_hits': self.failed_hits,
+            'refreshes': self.refreshes,
+            'errors': self.errors,
+            'lookups': lookups,
+            'hit_rate': (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name, ttl, max_stale=None, error_ttl=DEFAULT_ERROR_TTL):
+    """Return the process-wide cache called name, creating it on first use."""
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = _caches[name] = TTLCache(name, ttl, max_stale, error_ttl)
+        return cache
+
+
+def all_stats():
+    return [cache.stats() for cache in list(_caches.values())]